@@ -4,14 +4,6 @@ import os
 import shutil
 
 
-def remove_file(filepath):
-    os.remove(os.path.join(PROJECT_DIRECTORY, filepath))
-
-
-def remove_dir(filepath):
-    shutil.rmtree(os.path.join(PROJECT_DIRECTORY, filepath))
-
-
 def copy_file(original_filepath, new_filepath):
     shutil.copyfile(os.path.join(PROJECT_DIRECTORY, original_filepath),
                     os.path.join(PROJECT_DIRECTORY, new_filepath))
@@ -19,80 +11,194 @@ def copy_file(original_filepath, new_filepath):
 
 PROJECT_DIRECTORY = os.path.realpath(os.path.curdir)
 
-license_files = {"BSD 3-Clause": 'BSD3.rst',
-                 "GNU GPL v3+": 'GPLv3.rst',
-                 "Apache Software Licence 2.0": 'APACHE2.rst',
-                 "BSD 2-Clause": 'BSD2.rst',
-                 "MIT": 'MIT.rst'}
+## Local cache of `astropy-helpers`. Submodules are cloned from it and share
+## its object store, so bakes work without network access once it exists.
+## It can be changed with the `CCDS_ASTROPY_HELPERS_MIRROR` environment
+## variable.
+ASTROPY_HELPERS_URL = "https://github.com/astropy/astropy-helpers.git"
+CACHE_DIRECTORY = os.environ.get(
+    'CCDS_HOOK_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache',
+                 'cookiecutter-data-science'))
+ASTROPY_HELPERS_MIRROR = os.environ.get(
+    'CCDS_ASTROPY_HELPERS_MIRROR',
+    os.path.join(CACHE_DIRECTORY, 'astropy-helpers.git'))
+
+## Files larger than this (in bytes) are never staged in the initial commit.
+## It can be changed with the `CCDS_GIT_MAX_FILE_SIZE` environment variable.
+MAX_STAGED_FILE_SIZE = int(os.environ.get('CCDS_GIT_MAX_FILE_SIZE',
+                                          10 * 1024 * 1024))
+
+
+def astropy_helpers_mirror(version):
+    """
+    Finds a local mirror of `astropy-helpers` that contains `version`.
 
+    The mirror is created, or fetched into, when `version` is missing
+    and the network is reachable.
 
-def process_licence(licence_name):
+    Parameters
+    ----------
+    version : str
+        Tag of `astropy-helpers` to use.
+
+    Returns
+    -------
+    mirror_path : str or None
+        Path to the mirror, or `None` if no mirror with `version` is
+        available.
     """
-    Processes the License file for the document.
+    from git import Repo
+    from git.exc import GitError
+
+    try:
+        if os.path.isdir(ASTROPY_HELPERS_MIRROR):
+            mirror_repo = Repo(ASTROPY_HELPERS_MIRROR)
+        else:
+            mirror_repo = Repo.clone_from(
+                ASTROPY_HELPERS_URL, ASTROPY_HELPERS_MIRROR, mirror=True)
+        if version not in [tag.name for tag in mirror_repo.tags]:
+            mirror_repo.git.fetch('origin')
+            if version not in [tag.name for tag in mirror_repo.tags]:
+                return None
+    except (GitError, OSError):
+        return None
+
+    return ASTROPY_HELPERS_MIRROR
+
+
+def add_astropy_helpers(new_repo, version):
+    """
+    Adds `astropy_helpers` as a submodule of the project, checked out at
+    `version`.
+
+    If a local mirror is available, the submodule is cloned from it with
+    the mirror as a git alternate, and the submodule URL is then pointed
+    back to GitHub.
 
     Parameters
     ----------
-    licence_name : str
-        Name of the License to use.
-    """
-    if licence_name in license_files:
-        shutil.copyfile(os.path.join(PROJECT_DIRECTORY, 'licenses', license_files[licence_name]),
-                        os.path.join(PROJECT_DIRECTORY, 'LICENSE.rst'))
-    ##
-    ## Remove `licenses` folder
-    shutil.rmtree(os.path.join(PROJECT_DIRECTORY, 'licenses'))
+    new_repo : `git.Repo`
+        Repository of the new project.
 
-def process_conf_docs():
+    version : str
+        Tag of `astropy-helpers` to use.
     """
-    Selects the correct `conf.py` file for the project documentation.
+    from git import Repo
+
+    mirror_path = astropy_helpers_mirror(version)
+    if mirror_path is None:
+        new_repo.git.submodule('add', ASTROPY_HELPERS_URL, 'astropy_helpers')
+    else:
+        ##
+        ## Local clones of submodules are disabled by default since git 2.38.1
+        new_repo.git(c='protocol.file.allow=always').submodule(
+            'add', '--reference', mirror_path, mirror_path, 'astropy_helpers')
+        new_repo.git.config('-f', '.gitmodules',
+                            'submodule.astropy_helpers.url',
+                            ASTROPY_HELPERS_URL)
+        new_repo.git.submodule('sync', '--', 'astropy_helpers')
+    Repo(os.path.join(PROJECT_DIRECTORY, 'astropy_helpers')).git.checkout(
+        version)
+    new_repo.git.add('.gitmodules', 'astropy_helpers')
+
+
+def stage_files(new_repo):
     """
-    if '{{ cookiecutter.use_astropy_theme_or_RTD }}' == 'RTD':
-        shutil.copyfile(os.path.join(PROJECT_DIRECTORY, 'docs', 'read_docs', 'conf_rtd.py'),
-                        os.path.join(PROJECT_DIRECTORY, 'docs', 'conf.py'))
-    if '{{ cookiecutter.use_astropy_theme_or_RTD }}' == 'Astropy':
-        shutil.copyfile(os.path.join(PROJECT_DIRECTORY, 'docs', 'read_docs', 'conf_astropy.py'),
-                        os.path.join(PROJECT_DIRECTORY, 'docs', 'conf.py'))
+    Stages every untracked file of the project in a single `git add`.
+
+    Files ignored by the project `.gitignore` (e.g. `/data/`) are never
+    listed, and files larger than `MAX_STAGED_FILE_SIZE` are left untracked.
+
+    Parameters
+    ----------
+    new_repo : `git.Repo`
+        Repository of the new project.
+
+    Returns
+    -------
+    large_files : list
+        Files that were not staged because of their size.
+    """
+    untracked = new_repo.git.ls_files(
+        '--others', '--exclude-standard', '-z').split('\0')
+    staged_files = []
+    large_files = []
+    for filepath in untracked:
+        if not filepath:
+            continue
+        ## `lstat`, so symbolic links (even dangling ones) are staged as
+        ## links and do not abort the bake
+        if os.lstat(os.path.join(PROJECT_DIRECTORY, filepath)).st_size > \
+                MAX_STAGED_FILE_SIZE:
+            large_files.append(filepath)
+        else:
+            staged_files.append(filepath)
     ##
-    ## Removing `read_docs` folder
-    shutil.rmtree(os.path.join(PROJECT_DIRECTORY, 'docs','read_docs'))
+    ## The list is passed through a file, so it is not limited by the
+    ## maximum length of the command line.
+    pathspec_file = os.path.join(new_repo.git_dir, 'CCDS_STAGED_FILES')
+    with open(pathspec_file, 'w') as pathspec_f:
+        pathspec_f.write('\0'.join(staged_files))
+    try:
+        new_repo.git.add('--pathspec-from-file={0}'.format(pathspec_file),
+                         '--pathspec-file-nul')
+    finally:
+        os.remove(pathspec_file)
 
+    return large_files
 
-if __name__ == '__main__':
 
-    process_licence('{{ cookiecutter.open_source_license }}')
+def commit_identity(new_repo):
+    """
+    Git `-c` options with the project author, for the identity values that
+    are not configured for the user.
+    """
+    from git.exc import GitCommandError
+
+    options = []
+    for key, value in (('user.name', "{{ cookiecutter.author_name }}"),
+                       ('user.email', "{{ cookiecutter.author_email }}")):
+        try:
+            new_repo.git.config('--get', key)
+        except GitCommandError:
+            options.append('{0}={1}'.format(key, value))
+
+    return options
 
-    if '{{ cookiecutter.use_travis_ci }}' != 'y':
-        remove_file('.travis.yml')
 
-    if '{{ cookiecutter.use_read_the_docs }}' != 'y':
-        remove_file('.rtd-environment.yml')
-        remove_file('readthedocs.yml')
+if __name__ == '__main__':
     ##
-    ## Documentation
-    process_conf_docs()
+    ## The license, the documentation `conf.py` and the CI/RTD configuration
+    ## files are selected by their (conditional) file names in the template,
+    ## so files that are not used are never rendered.
     ##
-    ## Astropy Helpers
+    ## Git repository and Astropy Helpers
     try:
         from git import Repo
 
         new_repo = Repo.init(PROJECT_DIRECTORY)
-        new_repo.git.add('.')
-        new_repo.index.commit(
-            "Creation of {{ cookiecutter.repo_name }} from astropy package template"
-        )
+        commit_msg = ("Creation of {{ cookiecutter.repo_name }} from astropy "
+                      "package template")
         if '{{cookiecutter.use_astropy_theme_or_RTD}}' == 'Astropy':
-            astropy_helpers_version = "{% if cookiecutter.minimum_python_version == '2.7' %}v2.0.6{% else %}v3.0.1{% endif %}"
-            Repo.create_submodule(
-                new_repo, "astropy_helpers", "astropy_helpers",
-                "https://github.com/astropy/astropy-helpers.git",
-                "{}".format(astropy_helpers_version))
-            new_repo.submodules[0].update()
+            if '{{ cookiecutter.minimum_python_version }}' == '2.7':
+                astropy_helpers_version = "v2.0.6"
+            else:
+                astropy_helpers_version = "v3.0.1"
+            add_astropy_helpers(new_repo, astropy_helpers_version)
             copy_file('astropy_helpers/ah_bootstrap.py', 'ah_bootstrap.py')
-            new_repo.git.add('ah_bootstrap.py')
-            new_repo.index.commit(
-                "Initialize astropy_helpers at version {}".format(
-                    astropy_helpers_version))
+            commit_msg += ("\n\nInitialize astropy_helpers at version "
+                           "{}".format(astropy_helpers_version))
+        ##
+        ## Initial commit, made in a single pass with the git command line
+        large_files = stage_files(new_repo)
+        new_repo.git(c=commit_identity(new_repo)).commit('-q', '-m',
+                                                         commit_msg)
+        if large_files:
+            print("The following files are larger than {0} bytes and were "
+                  "not committed:\n  {1}".format(
+                    MAX_STAGED_FILE_SIZE, '\n  '.join(large_files)))
     except ImportError:
         print(
-            "gitpython is not installed so the repository will not be initialised "
-            "and astropy_helpers not downloaded.")
+            "gitpython is not installed so the repository will not be "
+            "initialised and astropy_helpers not downloaded.")
@@ -1,23 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os
-import shutil
+import subprocess
+import sys
 
 def proj_requirements():
     """
-    Tries to import the necessary packages.
+    List of packages needed by the project before running cookiecutter.
 
-    Parameters
+    Returns
     -----------
-    pkg : `str`
-        Name of the package to install
+    req_arr : `list`
+        List of requirement specifiers, e.g. `sphinx>=1.6`.
     """
-    ##
-    ## Project directory
-    PROJECT_DIRECTORY = os.path.relpath(os.path.curdir)
-    ## Reading in list of packages
-    reqfile = os.path.join(PROJECT_DIRECTORY, 'requirements_pre.txt')
     ## Dictionary for necessary requirements
     req_arr = [ 'click',
                 'coverage',
@@ -28,39 +23,85 @@ def proj_requirements():
                 "sphinx>=1.6",
                 "configparser",
                 "pytest"]
-    ##
-    ## Saving to file
-    with open(reqfile, 'w') as req_f:
-        for item in req_arr:
-            req_f.write('{0}\n'.format(item))
-    ##
-    ## Checking that file exists
-    if not (os.path.exists(reqfile)):
-        msg = '`reqfile` ({0}) was not found!'.format(reqfile)
-        raise ValueError(msg)
 
-    return reqfile
+    return req_arr
 
-def main():
+def _requirement_class():
     """
-    Making sure packages are installed before running cookiecutter.
+    Returns the `Requirement` class of `packaging`, falling back to the
+    copy vendored by `pip`.
     """
-    ## Pip package
     try:
-        import pip
+        from packaging.requirements import Requirement
     except ImportError:
-        msg = '`pip` must be installed first. Please install this beforehand!'
-        raise ImportError(msg)
+        from pip._vendor.packaging.requirements import Requirement
+
+    return Requirement
+
+def _installed_version(dist_name):
+    """
+    Version of the installed distribution `dist_name`, or `None` if it is
+    not installed.
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution(dist_name).version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return metadata.version(dist_name)
+    except metadata.PackageNotFoundError:
+        return None
+
+def missing_requirements(req_arr):
+    """
+    Checks, in-process, which requirements are not satisfied by the
+    installed distributions.
+
+    Parameters
+    -----------
+    req_arr : `list`
+        List of requirement specifiers.
+
+    Returns
+    -----------
+    missing_arr : `list`
+        Requirements that are either not installed or installed with a
+        version that does not match the specifier.
+    """
+    Requirement = _requirement_class()
+    missing_arr = []
+    for item in req_arr:
+        req = Requirement(item)
+        version = _installed_version(req.name)
+        if (version is None) or \
+                (not req.specifier.contains(version, prereleases=True)):
+            missing_arr.append(item)
+
+    return missing_arr
+
+def main():
+    """
+    Making sure packages are installed before running cookiecutter.
+    """
     ##
     ## Reading in list of packages
-    reqfile = proj_requirements()
+    req_arr = proj_requirements()
     ##
-    ## Running `install requirements.txt`
-    try:
-        os.system('pip -q install -r {0}'.format(reqfile))
-    except:
-        msg = 'Could not install requirements!!'
-        raise ValueError(msg)
+    ## Installing only the missing requirements. The check is cheap, so it
+    ## runs on every bake. A failed installation is not fatal: the project
+    ## is still created.
+    missing_arr = missing_requirements(req_arr)
+    if missing_arr:
+        try:
+            subprocess.check_call(
+                [sys.executable, '-m', 'pip', '-q', 'install'] + missing_arr)
+        except (subprocess.CalledProcessError, OSError) as err:
+            print('Warning: could not install {0} ({1}). Please install '
+                  'them beforehand!'.format(', '.join(missing_arr), err))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Bakes many projects from this template in one batch.
+
+Each row of a CSV or JSONL file is the `extra_context` of one project, e.g.
+
+    $ python scripts/bake_projects.py surveys.csv -o projects/ -j 8
+
+The Jinja templates are compiled once into a bytecode cache shared by all
+the workers, the `pre_gen_project` hook (dependency probe) is run once for
+the whole batch, and the projects are rendered on a process pool.  The
+`post_gen_project` hook (git init) is still run once per project.
+"""
+from __future__ import print_function, division, absolute_import
+
+import csv
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from binaryornot.check import is_binary
+from cookiecutter import environment, generate, hooks, main, utils
+from jinja2 import FileSystemBytecodeCache, FileSystemLoader
+
+CCDS_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                         os.pardir))
+TEMPLATE_DIR = os.path.join(CCDS_ROOT, '{{ cookiecutter.repo_name }}')
+CACHE_DIRECTORY = os.environ.get(
+    'CCDS_HOOK_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache',
+                 'cookiecutter-data-science'))
+
+
+def read_rows(filepath):
+    """
+    Reads the `extra_context` of every project.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to a CSV file with a header line, or to a JSONL file with one
+        JSON object per line.
+
+    Returns
+    -------
+    rows : list
+        List of `extra_context` dictionaries.
+    """
+    with open(filepath) as f:
+        if os.path.splitext(filepath)[1].lower() in ('.jsonl', '.json'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = [dict(row) for row in csv.DictReader(f)]
+    ##
+    ## Cookiecutter expects strings for every option
+    return [dict((key, str(val)) for key, val in row.items()) for row in rows]
+
+
+def cached_environment(bytecode_cache):
+    """
+    Subclass of cookiecutter's `StrictEnvironment` that stores the compiled
+    templates in `bytecode_cache`.
+    """
+    class CachedStrictEnvironment(environment.StrictEnvironment):
+        def __init__(self, **kwargs):
+            kwargs.setdefault('bytecode_cache', bytecode_cache)
+            super(CachedStrictEnvironment, self).__init__(**kwargs)
+
+    return CachedStrictEnvironment
+
+
+def compile_templates(bytecode_cache):
+    """
+    Compiles every text file of the template tree into `bytecode_cache`.
+
+    Returns
+    -------
+    n_templates : int
+        Number of compiled templates.
+    """
+    env = cached_environment(bytecode_cache)(
+        context={'cookiecutter': {}}, keep_trailing_newline=True)
+    n_templates = 0
+    ##
+    ## The cache key includes the template file name, so the templates are
+    ## loaded the same way as in `cookiecutter.generate.generate_files`.
+    with utils.work_in(TEMPLATE_DIR):
+        env.loader = FileSystemLoader(['.', '../templates'])
+        for root, _, files in os.walk('.'):
+            for filename in files:
+                infile = os.path.normpath(os.path.join(root, filename))
+                if is_binary(infile):
+                    continue
+                env.get_template(infile.replace(os.path.sep, '/'))
+                n_templates += 1
+
+    return n_templates
+
+
+def _init_worker(cache_dir):
+    """
+    Makes cookiecutter use the shared bytecode cache and skip the
+    `pre_gen_project` hook, which was already run for the batch.
+    """
+    env_class = cached_environment(FileSystemBytecodeCache(cache_dir))
+    for module in (utils, generate):
+        if hasattr(module, 'StrictEnvironment'):
+            setattr(module, 'StrictEnvironment', env_class)
+
+    for module in (hooks, generate):
+        run_hook = getattr(module, 'run_hook', None)
+        if run_hook is not None:
+            setattr(module, 'run_hook', _skip_pre_gen(run_hook))
+
+
+def _skip_pre_gen(run_hook):
+    def batch_run_hook(hook_name, *args, **kwargs):
+        if hook_name == 'pre_gen_project':
+            return None
+        return run_hook(hook_name, *args, **kwargs)
+    return batch_run_hook
+
+
+def bake_one(idx, extra_context, output_dir):
+    """
+    Bakes a single project.
+
+    Returns
+    -------
+    result : tuple
+        Index of the row, path to the project (`None` on failure), error
+        message (`None` on success) and wall time in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        project_dir = main.cookiecutter(CCDS_ROOT,
+                                        no_input=True,
+                                        extra_context=extra_context,
+                                        output_dir=output_dir)
+        error = None
+    except Exception as err:
+        project_dir = None
+        error = '{0}: {1}'.format(type(err).__name__, err)
+
+    return idx, project_dir, error, time.perf_counter() - start
+
+
+def run_pre_gen_hook():
+    """
+    Runs the dependency probe of the `pre_gen_project` hook once.
+    """
+    sys.path.insert(0, os.path.join(CCDS_ROOT, 'hooks'))
+    try:
+        import pre_gen_project
+    finally:
+        sys.path.pop(0)
+    pre_gen_project.main()
+
+
+def get_parser():
+    """
+    Get parser object for `bake_projects.py` script.
+
+    Returns
+    -------
+    parser : `argparse.ArgumentParser`
+    """
+    parser = ArgumentParser(description='Bakes one project per row of a '
+                                        'CSV or JSONL file.')
+    parser.add_argument('rows_file',
+                        help='CSV or JSONL file with the `extra_context` of '
+                             'each project')
+    parser.add_argument('-o', '--output-dir',
+                        dest='output_dir',
+                        help='Directory in which the projects are created',
+                        default='.')
+    parser.add_argument('-j', '--jobs',
+                        dest='jobs',
+                        help='Number of worker processes',
+                        type=int,
+                        default=os.cpu_count())
+    parser.add_argument('--cache-dir',
+                        dest='cache_dir',
+                        help='Directory of the compiled-template cache',
+                        default=os.path.join(CACHE_DIRECTORY, 'jinja'))
+
+    return parser
+
+
+def main_bake(args=None):
+    """
+    Bakes every row of the input file and reports the time per project.
+
+    Returns
+    -------
+    status : int
+        Exit status, 1 if any project failed.
+    """
+    param_dict = vars(get_parser().parse_args(args))
+    rows = read_rows(param_dict['rows_file'])
+    if not os.path.exists(param_dict['cache_dir']):
+        os.makedirs(param_dict['cache_dir'])
+    ##
+    ## Work done once per batch
+    start = time.perf_counter()
+    run_pre_gen_hook()
+    n_templates = compile_templates(
+        FileSystemBytecodeCache(param_dict['cache_dir']))
+    print('Prepared batch ({0} templates) in {1:.2f}s'.format(
+        n_templates, time.perf_counter() - start))
+    ##
+    ## Rendering the projects
+    results = []
+    with ProcessPoolExecutor(max_workers=param_dict['jobs'],
+                             initializer=_init_worker,
+                             initargs=(param_dict['cache_dir'],)) as pool:
+        futures = [pool.submit(bake_one, idx, row, param_dict['output_dir'])
+                   for idx, row in enumerate(rows)]
+        for future in as_completed(futures):
+            idx, project_dir, error, seconds = future.result()
+            results.append((idx, project_dir, error, seconds))
+            print('[{0:>4}] {1:7.2f}s  {2}'.format(
+                idx, seconds, project_dir or 'FAILED ' + error))
+
+    n_failed = len([res for res in results if res[2] is not None])
+    print('Baked {0}/{1} projects in {2:.2f}s'.format(
+        len(results) - n_failed, len(results), time.perf_counter() - start))
+
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_bake())
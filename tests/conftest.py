@@ -0,0 +1,182 @@
+import itertools
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+from cookiecutter import generate, hooks, main
+import pytest
+
+CCDS_ROOT = os.path.abspath(
+                os.path.join(
+                    __file__,
+                    os.pardir,
+                    os.pardir
+                )
+            )
+
+BENCHMARK_BASELINE = os.path.join(
+                        os.path.dirname(os.path.abspath(__file__)),
+                        'benchmark_baseline.json')
+
+# Options of `cookiecutter.json` that change the layout of the baked project
+# and are therefore part of the benchmark matrix.
+BOOLEAN_OPTIONS = ['use_travis_ci', 'use_read_the_docs']
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmark')
+    group.addoption('--benchmark', action='store_true', default=False,
+                    help='Compare the time of each phase with the baseline.')
+    group.addoption('--benchmark-save', action='store_true', default=False,
+                    help='Store the measured timings as the new baseline.')
+    group.addoption('--benchmark-tolerance', type=float, default=1.5,
+                    help='Maximum allowed ratio between measured and '
+                         'baseline time for each phase.')
+    group.addoption('--benchmark-baseline', default=BENCHMARK_BASELINE,
+                    help='Path to the JSON file with the baseline timings.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'benchmark: timed bake, compared with the baseline only '
+                   'with `--benchmark`.')
+
+
+def option_matrix():
+    """
+    Builds every combination of the choice options in `cookiecutter.json`.
+
+    Returns
+    -------
+    combinations : list
+        List of `extra_context` dictionaries, one per combination.
+    """
+    with open(os.path.join(CCDS_ROOT, 'cookiecutter.json')) as f:
+        context = json.load(f, object_pairs_hook=OrderedDict)
+
+    choices = OrderedDict()
+    for key, val in context.items():
+        if isinstance(val, list):
+            choices[key] = val
+        elif key in BOOLEAN_OPTIONS:
+            choices[key] = ['y', 'n']
+
+    keys = list(choices.keys())
+    return [dict(zip(keys, vals))
+            for vals in itertools.product(*choices.values())]
+
+
+def context_id(extra_context):
+    """
+    Stable identifier of an `extra_context` dictionary.
+    """
+    if not extra_context:
+        return 'default'
+    return '-'.join('{0}={1}'.format(key, extra_context[key])
+                    for key in sorted(extra_context))
+
+
+class PhaseTimer(object):
+    """
+    Records the wall time of the hooks run by cookiecutter.
+
+    The time spent rendering the template is the total bake time minus the
+    time spent in the `pre_gen_project` and `post_gen_project` hooks.
+    """
+    def __init__(self):
+        self.timings = {}
+        self._patched = []
+
+    def __enter__(self):
+        # `cookiecutter>=2` calls `hooks.run_hook`, while `cookiecutter<2`
+        # calls the copy imported into `generate`.
+        for module in (hooks, generate):
+            orig = getattr(module, 'run_hook', None)
+            if orig is not None:
+                self._patched.append((module, orig))
+                setattr(module, 'run_hook', self._wrap(orig))
+        return self
+
+    def __exit__(self, *exc):
+        for module, orig in self._patched:
+            setattr(module, 'run_hook', orig)
+        self._patched = []
+
+    def _wrap(self, run_hook):
+        def timed_run_hook(hook_name, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return run_hook(hook_name, *args, **kwargs)
+            finally:
+                self.timings[hook_name] = (self.timings.get(hook_name, 0.) +
+                                           time.perf_counter() - start)
+        return timed_run_hook
+
+
+def bake(extra_context, output_dir):
+    """
+    Bakes the template and times each phase.
+
+    Parameters
+    ----------
+    extra_context : dict
+        Options passed to `cookiecutter`.
+
+    output_dir : str
+        Directory in which the project is created.
+
+    Returns
+    -------
+    project_dir : str
+        Path to the baked project.
+
+    timings : dict
+        Wall time, in seconds, of the `render`, `pre_gen_project` and
+        `post_gen_project` phases.
+    """
+    with PhaseTimer() as timer:
+        start = time.perf_counter()
+        project_dir = main.cookiecutter(
+            CCDS_ROOT,
+            no_input=True,
+            extra_context=extra_context,
+            output_dir=output_dir
+        )
+        total = time.perf_counter() - start
+
+    timings = {'pre_gen_project': timer.timings.get('pre_gen_project', 0.),
+               'post_gen_project': timer.timings.get('post_gen_project', 0.)}
+    timings['render'] = total - sum(timings.values())
+
+    return project_dir, timings
+
+
+@pytest.fixture(scope='session')
+def baked_projects(tmpdir_factory):
+    """
+    Session-wide cache of baked projects, one per option combination.
+
+    Call the fixture with an `extra_context` dictionary to get the path to
+    the baked project.  Each combination is only baked once per session.
+    """
+    cache = {}
+    base_dir = tmpdir_factory.mktemp('baked-projects')
+    counter = itertools.count()
+
+    def get_project(extra_context=None):
+        extra_context = extra_context or {}
+        key = context_id(extra_context)
+        if key not in cache:
+            # Numbered by attempt, since a failed bake leaves its directory
+            out_dir = str(base_dir.mkdir(str(next(counter))))
+            cache[key] = bake(extra_context, out_dir)
+        return cache[key]
+
+    get_project.cache = cache
+
+    yield get_project
+
+    # cleanup after
+    shutil.rmtree(str(base_dir))
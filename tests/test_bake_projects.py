@@ -0,0 +1,26 @@
+import os
+import sys
+
+from conftest import CCDS_ROOT
+
+sys.path.insert(0, os.path.join(CCDS_ROOT, 'scripts'))
+import bake_projects  # noqa: E402
+
+
+def test_bake_projects(tmpdir):
+    rows_file = tmpdir.join('projects.csv')
+    rows_file.write('project_name,open_source_license\n'
+                    'survey a,MIT\n'
+                    'survey b,BSD 2-Clause\n')
+    out_dir = tmpdir.mkdir('projects')
+
+    status = bake_projects.main_bake([str(rows_file),
+                                      '-o', str(out_dir),
+                                      '-j', '2',
+                                      '--cache-dir',
+                                      str(tmpdir.join('jinja'))])
+
+    assert status == 0
+    for repo_name in ['survey_a', 'survey_b']:
+        assert os.path.exists(str(out_dir.join(repo_name, 'LICENSE.rst')))
+    assert len(tmpdir.join('jinja').listdir()) > 0
@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+import warnings
+
+import pytest
+
+from conftest import CCDS_ROOT, context_id, option_matrix
+
+PHASES = ['render', 'pre_gen_project', 'post_gen_project']
+
+# Phases faster than this (in seconds) are dominated by noise and are not
+# compared against the baseline.
+MIN_PHASE_TIME = 0.05
+
+
+@pytest.fixture(scope='session')
+def benchmark_results(request):
+    """
+    Collects the timings of every combination and, at the end of the
+    session, stores them as the new baseline if `--benchmark-save` is given.
+    """
+    results = {}
+
+    yield results
+
+    if results and request.config.getoption('--benchmark-save'):
+        baseline_path = request.config.getoption('--benchmark-baseline')
+        baseline = load_baseline(baseline_path)
+        baseline.update(results)
+        with open(baseline_path, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write('\n')
+
+
+@pytest.fixture(scope='session')
+def astropy_helpers_reachable(tmpdir_factory):
+    """
+    Whether the `post_gen_project` hook can add `astropy_helpers`, from the
+    mirror given by `CCDS_ASTROPY_HELPERS_MIRROR` or from GitHub.
+
+    Without `CCDS_ASTROPY_HELPERS_MIRROR`, the mirror is cloned into a
+    temporary directory of the session instead of the cache of the user.
+    """
+    pytest.importorskip('git')
+    sys.path.insert(0, os.path.join(CCDS_ROOT, 'hooks'))
+    import post_gen_project
+
+    mirror_env = os.environ.get('CCDS_ASTROPY_HELPERS_MIRROR')
+    if mirror_env is None:
+        os.environ['CCDS_ASTROPY_HELPERS_MIRROR'] = str(
+            tmpdir_factory.mktemp('astropy-helpers').join(
+                'astropy-helpers.git'))
+    # The hooks read the mirror from the environment, but the module may
+    # already have been imported with another one
+    mirror = post_gen_project.ASTROPY_HELPERS_MIRROR
+    post_gen_project.ASTROPY_HELPERS_MIRROR = \
+        os.environ['CCDS_ASTROPY_HELPERS_MIRROR']
+
+    yield post_gen_project.astropy_helpers_mirror('v3.0.1') is not None
+
+    post_gen_project.ASTROPY_HELPERS_MIRROR = mirror
+    if mirror_env is None:
+        del os.environ['CCDS_ASTROPY_HELPERS_MIRROR']
+
+
+def load_baseline(baseline_path):
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path) as f:
+        return json.load(f)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('extra_context', option_matrix(), ids=context_id)
+def test_bake_phases(extra_context, baked_projects, benchmark_results,
+                     request):
+    if extra_context['use_astropy_theme_or_RTD'] == 'Astropy' and \
+            not request.getfixturevalue('astropy_helpers_reachable'):
+        pytest.skip('astropy-helpers is not reachable')
+    project_dir, timings = baked_projects(extra_context)
+    key = context_id(extra_context)
+    benchmark_results[key] = timings
+
+    assert os.path.isdir(project_dir)
+
+    # Timings are only compared with `--benchmark`
+    if not request.config.getoption('--benchmark') or \
+            request.config.getoption('--benchmark-save'):
+        return
+
+    baseline = load_baseline(
+        request.config.getoption('--benchmark-baseline')).get(key)
+    if baseline is None:
+        warnings.warn('no baseline stored for `{0}`, run with '
+                      '`--benchmark-save` to store one'.format(key))
+        return
+
+    tolerance = request.config.getoption('--benchmark-tolerance')
+    slower = ['{0}: {1:.3f}s > {2:.3f}s x {3}'.format(
+                phase, timings[phase], baseline[phase], tolerance)
+              for phase in PHASES
+              if phase in baseline and
+              timings[phase] > max(baseline[phase], MIN_PHASE_TIME) *
+              tolerance]
+
+    assert not slower, 'slower than baseline: ' + '; '.join(slower)
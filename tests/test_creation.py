@@ -1,50 +1,58 @@
 import os
 import shutil
+import subprocess
+import sys
 
-from cookiecutter import main
 import pytest
 
-CCDS_ROOT = os.path.abspath(
-                os.path.join(
-                    __file__,
-                    os.pardir,
-                    os.pardir
-                )
-            )
-
-
-@pytest.fixture(scope='function')
-def default_baked_project(tmpdir):
-    out_dir = str(tmpdir.mkdir('data-project'))
-
-    main.cookiecutter(
-        CCDS_ROOT,
-        no_input=True,
-        extra_context={},
-        output_dir=out_dir
-    )
 
+@pytest.fixture(scope='session')
+def default_baked_project(baked_projects):
     # default project name is project_name
-    yield os.path.join(out_dir, 'project_name')
+    project_dir, _ = baked_projects()
 
-    # cleanup after
-    shutil.rmtree(out_dir)
+    return project_dir
 
 
 def test_readme(default_baked_project):
-    readme_path = os.path.join(default_baked_project, 'README.md')
+    readme_path = os.path.join(default_baked_project, 'README.rst')
 
     assert os.path.exists(readme_path)
     assert no_curlies(readme_path)
 
 
 def test_license(default_baked_project):
-    license_path = os.path.join(default_baked_project, 'LICENSE')
+    license_path = os.path.join(default_baked_project, 'LICENSE.rst')
 
     assert os.path.exists(license_path)
     assert no_curlies(license_path)
 
 
+@pytest.mark.parametrize('license_name', [
+    'MIT',
+    'BSD 3-Clause',
+    'GNU GPL v3+',
+    'Apache Software Licence 2.0',
+    'BSD 2-Clause'])
+def test_selected_license(baked_projects, license_name):
+    project_dir, _ = baked_projects({'open_source_license': license_name})
+    license_path = os.path.join(project_dir, 'LICENSE.rst')
+
+    assert os.path.exists(license_path)
+    assert no_curlies(license_path)
+    assert not os.path.exists(os.path.join(project_dir, 'licenses'))
+
+
+def test_optional_files(baked_projects):
+    project_dir, _ = baked_projects({'use_travis_ci': 'n',
+                                     'use_read_the_docs': 'n'})
+
+    assert os.path.exists(os.path.join(project_dir, 'docs', 'conf.py'))
+    assert not os.path.exists(os.path.join(project_dir, 'docs', 'read_docs'))
+    for filename in ['.travis.yml', '.rtd-environment.yml', 'readthedocs.yml']:
+        assert not os.path.exists(os.path.join(project_dir, filename))
+
+
 def test_requirements(default_baked_project):
     reqs_path = os.path.join(default_baked_project, 'requirements.txt')
 
@@ -76,7 +84,8 @@ def test_folders(default_baked_project):
         os.path.join('src', 'data'),
         os.path.join('src', 'features'),
         os.path.join('src', 'models'),
-        os.path.join('src', 'visualization')
+        os.path.join('src', 'visualization'),
+        'tests'
     ]
 
     ignored_dirs = [
@@ -91,6 +100,68 @@ def test_folders(default_baked_project):
     assert len(set(abs_expected_dirs + ignored_dirs) - set(abs_dirs)) == 0
 
 
+def test_project_tests(default_baked_project):
+    # The modules of the template are tested by the tests of the project
+    subprocess.check_call([sys.executable, '-m', 'pytest', '-q',
+                           '-p', 'no:cacheprovider', 'tests'],
+                          cwd=default_baked_project)
+
+
+def test_make_pipeline(default_baked_project, tmpdir):
+    pytest.importorskip('sklearn')
+    pytest.importorskip('dotenv')
+    if shutil.which('make') is None:
+        pytest.skip('make is not installed')
+    project_dir = str(tmpdir.join('project'))
+    shutil.copytree(default_baked_project, project_dir,
+                    ignore=shutil.ignore_patterns('.git'))
+    with open(os.path.join(project_dir, 'data', 'raw', 'catl.csv'), 'w') as f:
+        f.write('x0,x1,target\n' + ''.join(
+            '{0},{1},{2}\n'.format(idx, idx % 7, 2 * idx - idx % 7)
+            for idx in range(100)))
+    build_features = os.path.join(project_dir, 'src', 'features',
+                                  'build_features.py')
+    with open(build_features) as f:
+        source = f.read()
+    with open(build_features, 'w') as f:
+        f.write(source.replace(
+            "\nif __name__ == '__main__':",
+            'from src.features.registry import register_feature\n\n\n'
+            '@register_feature\n'
+            'def x01(x0, x1):\n'
+            '    return x0 * x1\n\n\n'
+            "if __name__ == '__main__':"))
+
+    subprocess.check_call(['make', 'features', 'train', 'predict',
+                           'PYTHON_INTERPRETER=' + sys.executable],
+                          cwd=project_dir)
+    with open(os.path.join(project_dir, 'models', 'predictions.csv')) as f:
+        assert len(f.read().splitlines()) == 101
+
+    ## Files of subdirectories of data/raw
+    os.makedirs(os.path.join(project_dir, 'data', 'raw', 'nested'))
+    shutil.copy(os.path.join(project_dir, 'data', 'raw', 'catl.csv'),
+                os.path.join(project_dir, 'data', 'raw', 'nested'))
+    subprocess.check_call(['make', 'data/processed/nested/catl.csv',
+                           'PYTHON_INTERPRETER=' + sys.executable],
+                          cwd=project_dir)
+
+
+def test_import_budget(default_baked_project, request):
+    pytest.importorskip('click')
+    pytest.importorskip('dotenv')
+    ## Fails when a command imports a heavy module it should load lazily.
+    ## Import times depend on the load of the machine, so their budgets in
+    ## `benchmarks/import_budget.json` are only enforced with `--benchmark`
+    if request.config.getoption('--benchmark'):
+        args = ['--repeat', '3']
+    else:
+        args = ['--repeat', '1', '--no-check-time']
+    subprocess.check_call(
+        [sys.executable, 'benchmarks/bench_import.py'] + args,
+        cwd=default_baked_project)
+
+
 def no_curlies(filepath):
     """ Utility to make sure no curly braces appear in a file.
         That is, was jinja able to render everthing?
@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import CCDS_ROOT, bake
+
+sys.path.insert(0, os.path.join(CCDS_ROOT, 'hooks'))
+import post_gen_project  # noqa: E402
+import pre_gen_project  # noqa: E402
+
+
+def git(args, cwd):
+    return subprocess.check_output(['git'] + args, cwd=cwd,
+                                   universal_newlines=True)
+
+
+@pytest.fixture
+def no_git_identity(tmpdir, monkeypatch):
+    """ Git configuration without a user name or email.
+    """
+    monkeypatch.setenv('HOME', str(tmpdir.mkdir('home')))
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+    monkeypatch.delenv('GIT_CONFIG_GLOBAL', raising=False)
+    for var in ['GIT_AUTHOR_NAME', 'GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_NAME',
+                'GIT_COMMITTER_EMAIL', 'EMAIL']:
+        monkeypatch.delenv(var, raising=False)
+
+
+def test_initial_commit(tmpdir, monkeypatch, no_git_identity):
+    pytest.importorskip('git')
+    # `src/data/sync_s3.py` is the only file over 18000 bytes
+    monkeypatch.setenv('CCDS_GIT_MAX_FILE_SIZE', '18000')
+    project_dir, _ = bake({}, str(tmpdir.mkdir('out')))
+
+    assert git(['log', '--format=%an <%ae>'], project_dir).splitlines() == [
+        'Your name (or your organization/company/team) <Your email address>']
+    assert git(['ls-files', '--others', '--exclude-standard'],
+               project_dir).splitlines() == ['src/data/sync_s3.py']
+    tracked = git(['ls-files'], project_dir).splitlines()
+    assert 'README.rst' in tracked and 'src/data/make_dataset.py' in tracked
+
+
+def test_stage_files(tmpdir, monkeypatch):
+    git_module = pytest.importorskip('git')
+    project_dir = tmpdir.mkdir('project')
+    project_dir.join('small.txt').write('a')
+    project_dir.join('large.txt').write('a' * 100)
+    project_dir.join('.gitignore').write('ignored.txt\n')
+    project_dir.join('ignored.txt').write('a' * 100)
+    os.symlink('missing.txt', str(project_dir.join('dangling')))
+    monkeypatch.setattr(post_gen_project, 'PROJECT_DIRECTORY',
+                        str(project_dir))
+    monkeypatch.setattr(post_gen_project, 'MAX_STAGED_FILE_SIZE', 50)
+    new_repo = git_module.Repo.init(str(project_dir))
+
+    assert post_gen_project.stage_files(new_repo) == ['large.txt']
+    assert sorted(git(['diff', '--cached', '--name-only'],
+                      str(project_dir)).splitlines()) == [
+        '.gitignore', 'dangling', 'small.txt']
+    assert not os.path.exists(os.path.join(new_repo.git_dir,
+                                           'CCDS_STAGED_FILES'))
+
+
+@pytest.fixture
+def astropy_helpers_mirror(tmpdir):
+    """ Bare mirror of a stand-in `astropy-helpers` repository, tagged
+        `v3.0.1`.
+    """
+    source_dir = tmpdir.mkdir('astropy-helpers')
+    source_dir.join('ah_bootstrap.py').write('# ah_bootstrap\n')
+    git(['init', '-q'], str(source_dir))
+    git(['add', 'ah_bootstrap.py'], str(source_dir))
+    git(['-c', 'user.name=test', '-c', 'user.email=test@example.com',
+         'commit', '-q', '-m', 'ah_bootstrap'], str(source_dir))
+    git(['tag', 'v3.0.1'], str(source_dir))
+    mirror_dir = str(tmpdir.join('astropy-helpers.git'))
+    git(['clone', '-q', '--mirror', str(source_dir), mirror_dir],
+        str(tmpdir))
+    return mirror_dir
+
+
+def test_astropy_helpers_mirror(tmpdir, monkeypatch, astropy_helpers_mirror):
+    pytest.importorskip('git')
+    monkeypatch.setenv('CCDS_ASTROPY_HELPERS_MIRROR', astropy_helpers_mirror)
+    project_dir, _ = bake({'use_astropy_theme_or_RTD': 'Astropy'},
+                          str(tmpdir.mkdir('out')))
+
+    assert git(['config', '-f', '.gitmodules',
+                'submodule.astropy_helpers.url'], project_dir).strip() == \
+        post_gen_project.ASTROPY_HELPERS_URL
+    assert git(['config', 'submodule.astropy_helpers.url'],
+               project_dir).strip() == post_gen_project.ASTROPY_HELPERS_URL
+    # The submodule shares the objects of the mirror
+    alternates = os.path.join(project_dir, '.git', 'modules',
+                              'astropy_helpers', 'objects', 'info',
+                              'alternates')
+    with open(alternates) as alternates_f:
+        assert os.path.join(astropy_helpers_mirror, 'objects') in \
+            alternates_f.read()
+    assert os.path.isfile(os.path.join(project_dir, 'ah_bootstrap.py'))
+    assert git(['ls-files', '--stage', 'astropy_helpers'],
+               project_dir).startswith('160000 ')
+
+
+def test_astropy_helpers_fallback(tmpdir, monkeypatch,
+                                  astropy_helpers_mirror):
+    pytest.importorskip('git')
+    # Neither the mirror nor the upstream repository are reachable
+    monkeypatch.setattr(post_gen_project, 'ASTROPY_HELPERS_URL',
+                        str(tmpdir.join('unreachable')))
+    monkeypatch.setattr(post_gen_project, 'ASTROPY_HELPERS_MIRROR',
+                        str(tmpdir.join('missing.git')))
+    assert post_gen_project.astropy_helpers_mirror('v3.0.1') is None
+    # The mirror does not have the version and cannot be fetched into
+    monkeypatch.setattr(post_gen_project, 'ASTROPY_HELPERS_MIRROR',
+                        astropy_helpers_mirror)
+    git(['remote', 'set-url', 'origin', str(tmpdir.join('unreachable'))],
+        astropy_helpers_mirror)
+    assert post_gen_project.astropy_helpers_mirror('v9.9.9') is None
+    assert post_gen_project.astropy_helpers_mirror('v3.0.1') == \
+        astropy_helpers_mirror
+
+
+def test_missing_requirements():
+    assert pre_gen_project.missing_requirements(
+        ['pytest', 'pytest>=1', 'pytest<1', 'ccds-not-a-package']) == \
+        ['pytest<1', 'ccds-not-a-package']
+
+
+def test_pre_gen_satisfied(monkeypatch):
+    def check_call(args):
+        raise AssertionError('pip should not run')
+
+    monkeypatch.setattr(pre_gen_project, 'proj_requirements',
+                        lambda: ['pytest'])
+    monkeypatch.setattr(pre_gen_project.subprocess, 'check_call', check_call)
+    pre_gen_project.main()
+
+
+def test_pre_gen_failed_install(monkeypatch, capsys):
+    calls = []
+
+    def check_call(args):
+        calls.append(args)
+        raise subprocess.CalledProcessError(1, args)
+
+    monkeypatch.setattr(pre_gen_project, 'proj_requirements',
+                        lambda: ['pytest', 'ccds-not-a-package'])
+    monkeypatch.setattr(pre_gen_project.subprocess, 'check_call', check_call)
+    # The requirements are probed again on every bake, and a failed
+    # installation only warns
+    pre_gen_project.main()
+    pre_gen_project.main()
+
+    assert [args[-1] for args in calls] == ['ccds-not-a-package'] * 2
+    assert 'Warning: could not install ccds-not-a-package' in \
+        capsys.readouterr().out
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks of the project.
+
+    `stages.py` holds the benchmark suite, run by `runner.py` (`make bench`,
+    `make bench-compare REF=<git ref>`); the `bench_*.py` scripts are
+    standalone experiments.
+"""
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+""" Time and file size of density images of large catalogues.
+
+    Bins `--n-points` random points, `--chunksize` at a time, with
+    `src.visualization.density`, draws them as an image and saves it as PNG
+    and PDF. A scatter plot of `--scatter-points` points is drawn for
+    comparison.
+
+        $ python benchmarks/bench_density.py --n-points 100000000
+"""
+import os
+import tempfile
+import time
+
+import click
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib.figure import Figure
+
+from src.visualization.density import DensityGrid, plot_density
+
+
+def _save(fig, tmp_dir, name):
+    sizes = []
+    for fmt in ['png', 'pdf']:
+        filepath = os.path.join(tmp_dir, '{0}.{1}'.format(name, fmt))
+        fig.savefig(filepath, dpi=150)
+        sizes.append(os.path.getsize(filepath) / 1024.)
+    return sizes
+
+
+@click.command()
+@click.option('--n-points', type=int, default=100000000, show_default=True)
+@click.option('--chunksize', type=int, default=5000000, show_default=True)
+@click.option('--bins', type=int, default=512, show_default=True)
+@click.option('--scatter-points', type=int, default=1000000,
+              show_default=True)
+def main(n_points, chunksize, bins, scatter_points):
+    rng = np.random.RandomState(0)
+    print('{0:<10} {1:>12} {2:>10} {3:>10} {4:>10}'.format(
+        'method', 'points', 'seconds', 'PNG (KB)', 'PDF (KB)'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        grid = DensityGrid((-5, 5), (-5, 5), bins=bins)
+        binning = 0.
+        for chunk_start in range(0, n_points, chunksize):
+            size = min(chunksize, n_points - chunk_start)
+            x, y = rng.normal(size=size), rng.normal(size=size)
+            bin_start = time.perf_counter()
+            grid.add(x, y)
+            binning += time.perf_counter() - bin_start
+        fig = Figure()
+        plot_density(fig.add_subplot(111), grid)
+        sizes = _save(fig, tmp_dir, 'density')
+        print('{0:<10} {1:>12d} {2:>10.2f} {3:>10.0f} {4:>10.0f}'.format(
+            'density', n_points, binning, *sizes))
+        print('  (binning only; {0:.2f}s including generating the points '
+              'and saving the files)'.format(time.perf_counter() - start))
+
+        x, y = rng.normal(size=scatter_points), rng.normal(size=scatter_points)
+        start = time.perf_counter()
+        fig = Figure()
+        fig.add_subplot(111).scatter(x, y, s=1)
+        sizes = _save(fig, tmp_dir, 'scatter')
+        print('{0:<10} {1:>12d} {2:>10.2f} {3:>10.0f} {4:>10.0f}'.format(
+            'scatter', scatter_points, time.perf_counter() - start, *sizes))
+
+
+if __name__ == '__main__':
+    main()
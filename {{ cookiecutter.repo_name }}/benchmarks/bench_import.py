@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+""" Import time of the project's modules and scripts, against a budget.
+
+    Runs every command of `benchmarks/import_budget.json` with
+    `python -X importtime`, `--repeat` times, and reports the best import
+    time (net of the interpreter's own start-up imports) and the slowest
+    modules it imports. A command fails its budget when it takes longer than
+    its `max_ms`, or imports one of its `forbidden` modules (e.g. NumPy for
+    `--help`):
+
+        $ python benchmarks/bench_import.py
+        $ python benchmarks/bench_import.py --top 10 'example_script --help'
+
+    Exits with an error when a budget is exceeded. Import times depend on
+    the load of the machine: with `--no-check-time`, they are only
+    reported, and only forbidden imports are errors.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import click
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir))
+# Commands and their budgets
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'import_budget.json')
+
+
+def parse_importtime(report):
+    """ Modules of an `-X importtime` report.
+
+        Returns a list of `(name, level, self_us, cumulative_us)`, where
+        `level` is 0 for the modules imported directly by the command.
+    """
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), level, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def import_time(args, env=None):
+    """ Modules imported by `python -X importtime <args>`.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + list(args),
+                          cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines()
+                  if not line.startswith('import time:')]
+        raise click.ClickException('`{0}` failed:\n{1}'.format(
+            ' '.join(args), '\n'.join(errors)))
+    return parse_importtime(proc.stderr)
+
+
+def _total_ms(modules):
+    return sum(mod[3] for mod in modules if mod[1] == 0) / 1000.
+
+
+def measure(args, repeat=5, env=None):
+    """ Best import time, in ms, of `python <args>` over `repeat` runs, net
+        of the start-up imports of the interpreter, with the modules of that
+        run that are not imported at start-up.
+    """
+    startup = [import_time(['-c', 'pass'], env=env) for _ in range(repeat)]
+    startup_names = set(mod[0] for mod in startup[0])
+    runs = [import_time(args, env=env) for _ in range(repeat)]
+    best = min(runs, key=_total_ms)
+    ms = max(_total_ms(best) - min(_total_ms(run) for run in startup), 0.)
+    return ms, [mod for mod in best if mod[0] not in startup_names]
+
+
+def forbidden_imports(modules, forbidden):
+    """ Modules of `forbidden` (or their submodules) imported in `modules`.
+    """
+    names = set(mod[0] for mod in modules)
+    return sorted(name for name in forbidden
+                  if any(mod == name or mod.startswith(name + '.')
+                         for mod in names))
+
+
+@click.command()
+@click.argument('names', nargs=-1)
+@click.option('--budget', 'budget_file', type=click.Path(exists=True),
+              default=BUDGET_FILE, show_default=True,
+              help='JSON file with the commands and their budgets.')
+@click.option('--repeat', type=click.IntRange(min=1), default=5,
+              show_default=True, help='Runs of each command.')
+@click.option('--top', type=click.IntRange(min=0), default=3,
+              show_default=True, help='Slowest modules shown per command.')
+@click.option('--check-time/--no-check-time', default=True,
+              show_default=True,
+              help='Whether a command over its time budget is an error, or '
+                   'is only reported.')
+def main(names, budget_file, repeat, top, check_time):
+    """ Checks the import time of the commands NAMES (all of them by
+        default) against their budget.
+    """
+    with open(budget_file) as f:
+        budgets = json.load(f)
+    unknown = [name for name in names if name not in budgets]
+    if unknown:
+        raise click.BadParameter('unknown commands: {0}'.format(
+            ', '.join(unknown)), param_hint='NAMES')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [PROJECT_DIR] + [path for path in [env.get('PYTHONPATH')] if path])
+
+    failed = []
+    print('{0:<30} {1:>10} {2:>10}  {3}'.format('command', 'ms', 'budget',
+                                                'status'))
+    for name in names or list(budgets):
+        budget = budgets[name]
+        ms, modules = measure(budget['args'], repeat=repeat, env=env)
+        forbidden = forbidden_imports(modules, budget.get('forbidden', []))
+        errors = []
+        warnings = []
+        if ms > budget['max_ms']:
+            (errors if check_time else warnings).append('over budget')
+        if forbidden:
+            errors.append('imports {0}'.format(', '.join(forbidden)))
+        print('{0:<30} {1:>10.1f} {2:>10.1f}  {3}'.format(
+            name, ms, budget['max_ms'], '; '.join(errors + warnings) or 'ok'))
+        slowest = sorted((mod for mod in modules if mod[1] == 0),
+                         key=lambda mod: -mod[3])
+        for mod_name, _, _, cumulative_us in slowest[:top]:
+            print('    {0:<40} {1:>8.1f}'.format(mod_name,
+                                                 cumulative_us / 1000.))
+        if errors:
+            failed.append(name)
+
+    if failed:
+        raise click.ClickException('import budget exceeded: {0}'.format(
+            ', '.join(failed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+""" Load time and memory of a table stored in different formats.
+
+    Writes a synthetic table as CSV, pickle, Parquet, Feather and HDF5 and
+    loads it back in a fresh process for each format, reporting the load
+    time and the growth of the resident memory (RSS) of that process while
+    the table is loaded. The load also computes the sum of one column, so
+    the memory-mapped formats are measured with their data actually read.
+
+        $ python benchmarks/bench_io.py --n-rows 10000000
+"""
+import os
+import pickle
+import resource
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.data.io import read_columns, read_table, write_table
+
+# Loaders of each format: (name, file extension, function)
+LOADERS = [
+    ('csv', '.csv', pd.read_csv),
+    ('pickle', '.pkl', pd.read_pickle),
+    ('parquet', '.parquet', read_table),
+    ('parquet[x]', '.parquet', lambda path: read_table(path, columns=['x'])),
+    ('feather', '.feather', read_table),
+    ('feather[x] mmap', '.feather',
+     lambda path: read_columns(path, columns=['x'], memory_map=True)),
+    ('hdf5', '.h5', read_table),
+    ('hdf5[x] mmap', '.h5',
+     lambda path: read_columns(path, columns=['x'], memory_map=True)),
+]
+
+
+def _rss_mb():
+    """ Current resident memory, or the peak one if it is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            n_pages = int(f.read().split()[1])
+        return n_pages * resource.getpagesize() / 1024. ** 2
+    except (IOError, OSError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        ## Linux reports kilobytes, macOS bytes
+        if sys.platform == 'darwin':
+            return peak / 1024. ** 2
+        return peak / 1024.
+
+
+def _measure(loader_idx, filepath, queue):
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    data = LOADERS[loader_idx][2](filepath)
+    data['x'].sum()
+    seconds = time.perf_counter() - start
+    queue.put((seconds, _rss_mb() - baseline))
+
+
+def make_table(n_rows, seed=0):
+    """ Synthetic table with `n_rows` rows.
+    """
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({'x': rng.normal(size=n_rows),
+                         'y': rng.normal(size=n_rows),
+                         'z': rng.normal(size=n_rows),
+                         'idx': np.arange(n_rows),
+                         'flag': rng.randint(0, 10, size=n_rows)})
+
+
+@click.command()
+@click.option('--n-rows', type=int, default=10000000, show_default=True)
+@click.option('--skip-csv', is_flag=True, help='Skip the (slow) CSV format.')
+def main(n_rows, skip_csv):
+    ctx = get_context('spawn')
+    df = make_table(n_rows)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepaths = {}
+        for ext in sorted(set(loader[1] for loader in LOADERS)):
+            if skip_csv and ext == '.csv':
+                continue
+            filepath = os.path.join(tmp_dir, 'table' + ext)
+            if ext == '.csv':
+                df.to_csv(filepath, index=False)
+            elif ext == '.pkl':
+                with open(filepath, 'wb') as f:
+                    pickle.dump(df, f, pickle.HIGHEST_PROTOCOL)
+            else:
+                write_table(df, filepath)
+            filepaths[ext] = filepath
+        del df
+
+        print('{0:<18} {1:>10} {2:>10} {3:>15}'.format(
+            'format', 'MB', 'seconds', 'RSS delta (MB)'))
+        for idx, (name, ext, _) in enumerate(LOADERS):
+            if ext not in filepaths:
+                continue
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure,
+                               args=(idx, filepaths[ext], queue))
+            proc.start()
+            seconds, rss = queue.get()
+            proc.join()
+            print('{0:<18} {1:>10.1f} {2:>10.3f} {3:>15.1f}'.format(
+                name, os.path.getsize(filepaths[ext]) / 1024. ** 2, seconds,
+                rss))
+
+
+if __name__ == '__main__':
+    main()
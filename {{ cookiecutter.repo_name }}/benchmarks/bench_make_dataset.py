@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+""" Peak memory of `src.data.make_dataset` as the input grows.
+
+    Writes synthetic raw files of increasing size, streams each one through
+    `process_dataset` with a fixed chunk size and reports the peak memory
+    traced by `tracemalloc`. The peak should stay flat as the input grows.
+
+        $ python benchmarks/bench_make_dataset.py --chunksize 50000
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.data.make_dataset import process_dataset
+
+
+def write_raw_file(filepath, n_rows, chunksize=500000, seed=0):
+    """ Writes a synthetic raw CSV file with `n_rows` rows.
+    """
+    rng = np.random.RandomState(seed)
+    with open(filepath, 'w') as f:
+        for start in range(0, n_rows, chunksize):
+            size = min(chunksize, n_rows - start)
+            chunk = pd.DataFrame({'x': rng.normal(size=size),
+                                  'y': rng.normal(size=size),
+                                  'z': rng.randint(0, 100, size=size)})
+            chunk.to_csv(f, header=(start == 0), index=False)
+
+
+@click.command()
+@click.option('--chunksize', type=int, default=50000, show_default=True)
+@click.option('--sizes', default='100000,200000,400000', show_default=True,
+              help='Comma-separated number of rows of each input file.')
+def main(chunksize, sizes):
+    print('{0:>10} {1:>10} {2:>10} {3:>14}'.format(
+        'rows', 'MB', 'seconds', 'peak mem (MB)'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in [int(size) for size in sizes.split(',')]:
+            raw_filepath = os.path.join(tmp_dir, 'raw.csv')
+            write_raw_file(raw_filepath, n_rows)
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            process_dataset(raw_filepath,
+                            os.path.join(tmp_dir, 'processed.csv'),
+                            chunksize=chunksize)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print('{0:>10d} {1:>10.1f} {2:>10.2f} {3:>14.1f}'.format(
+                n_rows, os.path.getsize(raw_filepath) / 1024. ** 2, seconds,
+                peak / 1024. ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+""" Throughput and memory of the out-of-core training of
+    `src.models.train_model`.
+
+    Writes a synthetic feature store and trains an `SGDRegressor` on it with
+    `train_incremental`, with and without reading the next batch ahead, and
+    reports the rows per second and the peak memory traced by
+    `tracemalloc`. The peak should depend on the batch size and not on the
+    number of rows of the store.
+
+        $ python benchmarks/bench_train.py --n-rows 2000000
+"""
+import tempfile
+import tracemalloc
+
+import click
+import numpy as np
+
+from src.features.store import FeatureStore
+from src.models.train_model import train_incremental
+
+
+def make_store(path, n_rows, n_features, block_size=500000, seed=0):
+    """ Feature store with `n_rows` rows of `n_features` features and a
+        linear `target`.
+    """
+    rng = np.random.RandomState(seed)
+    coefs = rng.normal(size=n_features)
+    store = FeatureStore(path)
+    for start in range(0, n_rows, block_size):
+        size = min(block_size, n_rows - start)
+        X = rng.normal(size=(size, n_features))
+        cols = dict(('x{0}'.format(idx), X[:, idx])
+                    for idx in range(n_features))
+        cols['target'] = X.dot(coefs) + rng.normal(scale=0.1, size=size)
+        store.append(cols)
+    return store
+
+
+@click.command()
+@click.option('--n-rows', type=int, default=2000000, show_default=True)
+@click.option('--n-features', type=int, default=20, show_default=True)
+@click.option('--batch-sizes', default='10000,100000', show_default=True,
+              help='Comma-separated batch sizes.')
+def main(n_rows, n_features, batch_sizes):
+    from sklearn.linear_model import SGDRegressor
+
+    print('{0:>10} {1:>9} {2:>10} {3:>12} {4:>14}'.format(
+        'batch', 'prefetch', 'seconds', 'rows/s', 'peak mem (MB)'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = make_store(tmp_dir, n_rows, n_features)
+        for batch_size in [int(size) for size in batch_sizes.split(',')]:
+            for prefetch_depth in [0, 1]:
+                tracemalloc.start()
+                _, stats = train_incremental(
+                    SGDRegressor(), store, 'target', batch_size=batch_size,
+                    prefetch_depth=prefetch_depth)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print('{0:>10d} {1:>9} {2:>10.2f} {3:>12.0f} '
+                      '{4:>14.1f}'.format(
+                          batch_size, 'yes' if prefetch_depth else 'no',
+                          stats['seconds'], stats['rows_per_s'],
+                          peak / 1024. ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+""" Load generator of the prediction service of `src.models.predict_model`.
+
+    Sends `--requests` requests of `--rows` rows each from `--concurrency`
+    clients, each with its own keep-alive connection, and reports the
+    throughput and the p50/p90/p99 latency seen by the clients, followed by
+    the counters of the service:
+
+        $ make serve &
+        $ python benchmarks/load_predict_server.py --n-features 20 \\
+            --concurrency 32 --requests 20000
+"""
+import json
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+import click
+import numpy as np
+
+
+def _client(url, bodies, latencies, errors):
+    parts = urlsplit(url)
+    conn = HTTPConnection(parts.hostname, parts.port)
+    headers = {'Content-Type': 'application/json'}
+    for body in bodies:
+        start = time.perf_counter()
+        conn.request('POST', '/predict', body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(response.status)
+    conn.close()
+
+
+def run_load(url, n_features, concurrency=16, n_requests=10000, n_rows=1,
+             seed=0):
+    """ Sends the requests and returns the client-side latencies (seconds),
+        the number of errors and the total time.
+    """
+    rng = np.random.RandomState(seed)
+    bodies = [json.dumps({'instances': rng.normal(
+        size=(n_rows, n_features)).tolist()}).encode('utf-8')
+        for _ in range(min(n_requests, 1000))]
+    latencies, errors = [], []
+    threads = []
+    for idx in range(concurrency):
+        client_bodies = [bodies[req % len(bodies)]
+                         for req in range(idx, n_requests, concurrency)]
+        threads.append(threading.Thread(
+            target=_client, args=(url, client_bodies, latencies, errors)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return np.array(latencies), len(errors), time.perf_counter() - start
+
+
+@click.command()
+@click.option('--url', default='http://127.0.0.1:8000', show_default=True)
+@click.option('--n-features', type=int, required=True,
+              help='Number of features of the model.')
+@click.option('--concurrency', type=int, default=16, show_default=True)
+@click.option('--requests', 'n_requests', type=int, default=10000,
+              show_default=True)
+@click.option('--rows', 'n_rows', type=int, default=1, show_default=True,
+              help='Rows per request.')
+def main(url, n_features, concurrency, n_requests, n_rows):
+    latencies, n_errors, seconds = run_load(
+        url, n_features, concurrency=concurrency, n_requests=n_requests,
+        n_rows=n_rows)
+    p50, p90, p99 = np.percentile(latencies * 1000., [50, 90, 99])
+    print('{0} requests ({1} errors) in {2:.2f}s: {3:.0f} requests/s, '
+          '{4:.0f} rows/s'.format(len(latencies), n_errors, seconds,
+                                  len(latencies) / seconds,
+                                  len(latencies) * n_rows / seconds))
+    print('latency (ms): p50 {0:.2f}  p90 {1:.2f}  p99 {2:.2f}'.format(
+        p50, p90, p99))
+
+    parts = urlsplit(url)
+    conn = HTTPConnection(parts.hostname, parts.port)
+    conn.request('GET', '/stats')
+    print('service: {0}'.format(conn.getresponse().read().decode('utf-8')))
+
+
+if __name__ == '__main__':
+    main()
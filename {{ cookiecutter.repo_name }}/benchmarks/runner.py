@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+""" Runs the benchmark suite and compares the results of two commits.
+
+    Benchmarks are the `time_*` and `peakmem_*` functions, or methods of
+    classes, of the modules of `benchmarks/` (see `stages.py`). Each one runs
+    in a fresh process: its `setup` is called, then the benchmark is called
+    once to warm up and `--repeat` more times. Timings are the seconds per
+    call of each sample (calls shorter than 50 ms are repeated within a
+    sample); peak memory is the largest memory allocated during a call by
+    Python objects and NumPy arrays, as traced by `tracemalloc`.
+
+        $ python -m benchmarks.runner run    # benchmarks/results/<commit>.json
+        $ python -m benchmarks.runner run --ref main \\
+            -o benchmarks/results/main.json
+        $ python -m benchmarks.runner compare benchmarks/results/main.json \\
+            benchmarks/results/<commit>.json
+
+    With `--ref`, the `src` of that git ref is checked out in a temporary
+    worktree and benchmarked with the benchmarks of the working tree.
+
+    `compare` reports the ratio of the medians of each benchmark, and flags
+    timings as slower or faster when the ratio is beyond `--threshold` and
+    the Mann-Whitney U test finds the samples different (p < `--alpha`).
+    Peak memory hardly varies between runs, so it is flagged on the ratio
+    alone. It exits with an error when a benchmark regressed.
+"""
+import os
+import ast
+import sys
+import json
+import math
+import time
+import click
+import fnmatch
+import logging
+import platform
+import tempfile
+import traceback
+import subprocess
+import importlib.util
+from collections import OrderedDict
+
+# Directory of the benchmarks
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# Project directory
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+# Directory of the results
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+# Kinds of benchmarks, by prefix, and the unit of their samples
+KINDS = OrderedDict([('time_', 'seconds'), ('peakmem_', 'bytes')])
+# Shortest duration of a timing sample, in seconds
+MIN_SAMPLE_TIME = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def _kind(name):
+    for prefix in KINDS:
+        if name.startswith(prefix):
+            return prefix[:-1]
+    return None
+
+
+def discover(bench_dir=BENCH_DIR):
+    """ Benchmarks of the modules of `bench_dir`.
+
+        Modules are parsed, not imported, so this is fast and does not
+        depend on the code being benchmarked.
+
+        Returns
+        -------
+        benchmarks : OrderedDict
+            `{name: module_filepath}`, where `name` is
+            `module.Class.method` or `module.function`.
+    """
+    benchmarks = OrderedDict()
+    for filename in sorted(os.listdir(bench_dir)):
+        if not filename.endswith('.py') or filename.startswith('_') or \
+                filename == os.path.basename(__file__):
+            continue
+        filepath = os.path.join(bench_dir, filename)
+        module = os.path.splitext(filename)[0]
+        with open(filepath) as f:
+            tree = ast.parse(f.read(), filename=filepath)
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and _kind(node.name):
+                benchmarks['{0}.{1}'.format(module, node.name)] = filepath
+            elif isinstance(node, ast.ClassDef) and \
+                    not node.name.startswith('_'):
+                for item in node.body:
+                    if isinstance(item, ast.FunctionDef) and _kind(item.name):
+                        benchmarks['{0}.{1}.{2}'.format(
+                            module, node.name, item.name)] = filepath
+
+    return benchmarks
+
+
+def _load_module(filepath):
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    spec = importlib.util.spec_from_file_location(name, filepath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _time_samples(func, repeat):
+    start = time.perf_counter()
+    func()
+    warmup = time.perf_counter() - start
+    number = max(1, int(MIN_SAMPLE_TIME / max(warmup, 1e-9)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples, number
+
+
+def _peakmem_samples(func, repeat):
+    import tracemalloc
+
+    func()
+    samples = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        try:
+            func()
+            samples.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return samples, 1
+
+
+def run_benchmark(filepath, name, repeat):
+    """ Runs the benchmark `name` of the module `filepath` in this process.
+
+        Returns a dictionary with its `samples`, or with the `error` that
+        stopped it, or why it was `skipped`.
+    """
+    kind = _kind(name.rsplit('.', 1)[-1])
+    result = {'kind': kind, 'unit': KINDS[kind + '_']}
+    instance = None
+    try:
+        module = _load_module(filepath)
+        parts = name.split('.')[1:]
+        if len(parts) == 2:
+            instance = getattr(module, parts[0])()
+            if hasattr(instance, 'setup'):
+                instance.setup()
+            func = getattr(instance, parts[1])
+        else:
+            func = getattr(module, parts[0])
+        if kind == 'time':
+            samples, number = _time_samples(func, repeat)
+        else:
+            samples, number = _peakmem_samples(func, min(repeat, 3))
+        result.update(samples=samples, number=number)
+    except NotImplementedError as err:
+        result['skipped'] = str(err)
+    except Exception as err:
+        result['error'] = '{0}: {1}'.format(type(err).__name__, err)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        if instance is not None and hasattr(instance, 'teardown'):
+            try:
+                instance.teardown()
+            except Exception:
+                pass
+
+    return result
+
+
+def _git(args, cwd=PROJECT_DIR):
+    return subprocess.check_output(['git'] + list(args), cwd=cwd,
+                                   universal_newlines=True).strip()
+
+
+def commit_info(ref=None, cwd=PROJECT_DIR):
+    """ Commit of `ref` (the working tree by default), and whether the
+        working tree has uncommitted changes.
+    """
+    try:
+        commit = _git(['rev-parse', ref or 'HEAD'], cwd=cwd)
+        dirty = ref is None and bool(_git(
+            ['status', '--porcelain', '--untracked-files=no'], cwd=cwd))
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+
+def run_suite(names, src_dir=PROJECT_DIR, repeat=10, bench_dir=BENCH_DIR):
+    """ Runs each of the benchmarks `names` in its own process, with the
+        `src` package of `src_dir`.
+
+        Returns `{name: result}`.
+    """
+    benchmarks = discover(bench_dir)
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    results = OrderedDict()
+    for name in names:
+        start = time.time()
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'run-one',
+             benchmarks[name], name, '--repeat', str(repeat)],
+            cwd=src_dir, env=env, stdout=subprocess.PIPE,
+            universal_newlines=True)
+        try:
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            result = {'kind': _kind(name.rsplit('.', 1)[-1]),
+                      'error': 'crashed with exit code {0}'.format(
+                          proc.returncode)}
+        results[name] = result
+        if 'samples' in result:
+            status = _format_value(_median(result['samples']),
+                                   result['unit'])
+        elif 'skipped' in result:
+            status = 'skipped ({0})'.format(result['skipped'])
+        else:
+            status = 'failed ({0})'.format(result['error'])
+        logger.info('%-55s %s  [%.1fs]', name, status, time.time() - start)
+
+    return results
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return 0.5 * (values[mid - 1] + values[mid])
+
+
+def _format_value(value, unit):
+    if unit == 'bytes':
+        return '{0:.1f} MB'.format(value / 1024. ** 2)
+    for scale, suffix in [(1., 's'), (1e-3, 'ms'), (1e-6, 'us')]:
+        if value >= scale:
+            break
+    return '{0:.3g} {1}'.format(value / scale, suffix)
+
+
+def mann_whitney_u(x, y):
+    """ Two-sided p-value of the Mann-Whitney U test of the samples `x` and
+        `y`, with the normal approximation corrected for ties.
+    """
+    n_x, n_y = len(x), len(y)
+    values = sorted([(val, 0) for val in x] + [(val, 1) for val in y])
+    ranks = [0.] * len(values)
+    tie_term = 0.
+    start = 0
+    while start < len(values):
+        end = start
+        while end + 1 < len(values) and values[end + 1][0] == values[start][0]:
+            end += 1
+        for idx in range(start, end + 1):
+            ranks[idx] = 0.5 * (start + end) + 1
+        n_ties = end - start + 1
+        tie_term += n_ties ** 3 - n_ties
+        start = end + 1
+    rank_x = sum(rank for rank, (_, group) in zip(ranks, values)
+                 if group == 0)
+    u_x = rank_x - n_x * (n_x + 1) / 2.
+    n = n_x + n_y
+    sigma = math.sqrt(n_x * n_y / 12. *
+                      ((n + 1) - tie_term / float(n * (n - 1))))
+    if sigma == 0:
+        return 1.
+    z = max(abs(u_x - n_x * n_y / 2.) - 0.5, 0.) / sigma
+    return min(1., math.erfc(z / math.sqrt(2)))
+
+
+def compare_results(baseline, contender, threshold=1.1, alpha=0.05):
+    """ Compares the benchmarks common to two results.
+
+        Returns a list of `(name, before, after, ratio, p_value, status)`,
+        where `status` is 'slower', 'faster', 'larger', 'smaller',
+        'unchanged' or why the benchmark could not be compared.
+    """
+    rows = []
+    for name, new in contender['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            rows.append((name, None, None, None, None, 'new'))
+            continue
+        if 'samples' not in old or 'samples' not in new:
+            rows.append((name, None, None, None, None, 'not compared'))
+            continue
+        before, after = _median(old['samples']), _median(new['samples'])
+        ratio = after / before if before else float('inf')
+        if new['kind'] == 'time':
+            p_value = mann_whitney_u(old['samples'], new['samples'])
+            changed = p_value < alpha
+            names = ('slower', 'faster')
+        else:
+            p_value = None
+            changed = True
+            names = ('larger', 'smaller')
+        if changed and ratio >= threshold:
+            status = names[0]
+        elif changed and ratio <= 1. / threshold:
+            status = names[1]
+        else:
+            status = 'unchanged'
+        rows.append((name, before, after, ratio, p_value, status))
+
+    return rows
+
+
+@click.group()
+def main():
+    """ Runs the benchmarks of `benchmarks/` and compares their results.
+    """
+
+
+@main.command()
+@click.argument('patterns', nargs=-1)
+@click.option('--repeat', type=click.IntRange(min=2), default=10,
+              show_default=True, help='Samples of each benchmark.')
+@click.option('--ref', default=None,
+              help='Git ref whose `src` is benchmarked, instead of the '
+                   'working tree.')
+@click.option('-o', '--output', type=click.Path(), default=None,
+              help='JSON file of the results [default: '
+                   'benchmarks/results/<commit>.json].')
+def run(patterns, repeat, ref, output):
+    """ Runs the benchmarks matching the glob PATTERNS (all by default),
+        e.g. 'stages.TrainModel.*'.
+    """
+    names = [name for name in discover()
+             if not patterns or any(fnmatch.fnmatch(name, pattern)
+                                    for pattern in patterns)]
+    if not names:
+        raise click.BadParameter('no benchmarks match', param_hint='PATTERNS')
+    commit, dirty = commit_info(ref)
+    if ref is not None and commit is None:
+        raise click.BadParameter('unknown git ref `{0}`'.format(ref),
+                                 param_hint='--ref')
+
+    if ref is None:
+        results = run_suite(names, repeat=repeat)
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        worktree = os.path.join(tmp_dir, 'src-tree')
+        _git(['worktree', 'add', '--detach', worktree, commit])
+        try:
+            results = run_suite(names, src_dir=worktree, repeat=repeat)
+        finally:
+            _git(['worktree', 'remove', '--force', worktree])
+            os.rmdir(tmp_dir)
+
+    if output is None:
+        output = os.path.join(RESULTS_DIR, '{0}{1}.json'.format(
+            (commit or 'unknown')[:12], '-dirty' if dirty else ''))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, 'w') as f:
+        json.dump({'commit': commit,
+                   'ref': ref,
+                   'dirty': dirty,
+                   'date': time.time(),
+                   'python': platform.python_version(),
+                   'machine': platform.platform(),
+                   'repeat': repeat,
+                   'benchmarks': results}, f, indent=2)
+    logger.info('results written to %s', output)
+
+
+@main.command()
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('contender', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', type=click.FloatRange(min=1), default=1.1,
+              show_default=True,
+              help='Smallest ratio of the medians reported as a change.')
+@click.option('--alpha', type=click.FloatRange(0, 1), default=0.05,
+              show_default=True,
+              help='Significance level of the Mann-Whitney U test.')
+def compare(baseline, contender, threshold, alpha):
+    """ Compares the results in CONTENDER with those in BASELINE.
+    """
+    with open(baseline) as f:
+        baseline = json.load(f)
+    with open(contender) as f:
+        contender = json.load(f)
+    click.echo('{0} -> {1}'.format(
+        (baseline['ref'] or baseline['commit'] or '?')[:12],
+        (contender['ref'] or contender['commit'] or '?')[:12] +
+        (' (dirty)' if contender['dirty'] else '')))
+    click.echo('{0:<50} {1:>10} {2:>10} {3:>7} {4:>7}  {5}'.format(
+        'benchmark', 'before', 'after', 'ratio', 'p', 'status'))
+    rows = compare_results(baseline, contender, threshold=threshold,
+                           alpha=alpha)
+    for name, before, after, ratio, p_value, status in rows:
+        unit = contender['benchmarks'][name].get('unit', 'seconds')
+        click.echo('{0:<50} {1:>10} {2:>10} {3:>7} {4:>7}  {5}'.format(
+            name,
+            '' if before is None else _format_value(before, unit),
+            '' if after is None else _format_value(after, unit),
+            '' if ratio is None else '{0:.2f}'.format(ratio),
+            '' if p_value is None else '{0:.3f}'.format(p_value),
+            status))
+    regressions = [row[0] for row in rows if row[5] in ['slower', 'larger']]
+    if regressions:
+        raise click.ClickException('{0} benchmarks regressed: {1}'.format(
+            len(regressions), ', '.join(regressions)))
+
+
+@main.command('run-one', hidden=True)
+@click.argument('filepath')
+@click.argument('name')
+@click.option('--repeat', type=int, default=10)
+def run_one(filepath, name, repeat):
+    """ Runs one benchmark in this process, and prints its result as JSON.
+    """
+    ## The progress messages of the benchmarked code are not timed
+    logging.getLogger().setLevel(logging.WARNING)
+    result = run_benchmark(filepath, name, repeat)
+    if 'traceback' in result:
+        sys.stderr.write(result.pop('traceback'))
+    click.echo(json.dumps(result))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
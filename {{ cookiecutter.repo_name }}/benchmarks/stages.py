@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+""" Timing and peak-memory benchmarks of the stages of `src`, on synthetic
+    data.
+
+    Benchmarks follow the conventions of airspeed velocity (asv): methods
+    named `time_*` are timed, methods named `peakmem_*` report the peak
+    memory they allocate, `setup` and `teardown` run before and after them,
+    and `setup` raises `NotImplementedError` to skip the benchmarks of a
+    class (e.g. when an optional dependency is missing). They are run, each
+    in a fresh process, with:
+
+        $ python -m benchmarks.runner run
+
+    `src` is imported inside the benchmarks, so that when an older commit is
+    benchmarked (`make bench-compare`), a benchmark of code that did not
+    exist yet fails on its own.
+"""
+import io
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Rows of the synthetic data sets
+N_ROWS = 200000
+# Rows of the data sets read or written as CSV, which is much slower
+N_CSV_ROWS = 50000
+# Rows read, transformed or trained on at a time
+BLOCK_SIZE = 50000
+
+
+def synthetic_frame(n_rows=N_ROWS, n_features=4, seed=0):
+    """ Data set with `n_features` normal features `x<i>` and a linear
+        `target`.
+    """
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(n_rows, n_features))
+    frame = pd.DataFrame(X, columns=['x{0}'.format(idx)
+                                     for idx in range(n_features)])
+    frame['target'] = X.dot(rng.normal(size=n_features)) + \
+        rng.normal(scale=0.1, size=n_rows)
+    return frame
+
+
+def synthetic_store(path, n_rows=N_ROWS, n_features=4, seed=0):
+    """ `FeatureStore` with the columns of `synthetic_frame`.
+    """
+    from src.features.store import FeatureStore
+
+    store = FeatureStore(path)
+    frame = synthetic_frame(n_rows, n_features=n_features, seed=seed)
+    store.append(dict((column, frame[column].to_numpy())
+                      for column in frame.columns))
+    return store
+
+
+def _import_sklearn_sgd():
+    try:
+        from sklearn.linear_model import SGDRegressor
+    except ImportError:
+        raise NotImplementedError('scikit-learn is not installed')
+    return SGDRegressor
+
+
+class _TemporaryDirectory(object):
+    """ Benchmarks whose `setup` writes to a temporary directory.
+    """
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class MakeDataset(_TemporaryDirectory):
+    """ `src.data.make_dataset.process_dataset`: CSV in, registered
+        transform steps, CSV out, one chunk at a time.
+    """
+    def setup(self):
+        super(MakeDataset, self).setup()
+        self.input_filepath = os.path.join(self.tmp_dir, 'raw.csv')
+        self.output_filepath = os.path.join(self.tmp_dir, 'processed.csv')
+        synthetic_frame(N_CSV_ROWS).to_csv(self.input_filepath, index=False)
+
+    def _process(self):
+        from src.data.make_dataset import process_dataset
+
+        process_dataset(self.input_filepath, self.output_filepath,
+                        chunksize=N_CSV_ROWS // 4)
+
+    def time_process_dataset(self):
+        self._process()
+
+    def peakmem_process_dataset(self):
+        self._process()
+
+
+class BuildFeatures(_TemporaryDirectory):
+    """ `src.features`: features of a data set, appended to a feature store.
+    """
+    def setup(self):
+        from src.features.registry import Feature
+
+        super(BuildFeatures, self).setup()
+        self.frame = synthetic_frame()
+        self.features = OrderedDict([
+            ('x01', Feature('x01', lambda x0, x1: x0 * x1, ('x0', 'x1'),
+                            False)),
+            ('x01_sq', Feature('x01_sq', lambda x01: x01 ** 2, ('x01',),
+                               True)),
+            ('x2_x3', Feature('x2_x3', lambda x2, x3: x2 - x3, ('x2', 'x3'),
+                              True))])
+        self.n_stores = 0
+
+    def _build(self):
+        from src.features.registry import compute_features
+        from src.features.store import FeatureStore
+
+        self.n_stores += 1
+        store = FeatureStore(os.path.join(self.tmp_dir, str(self.n_stores)))
+        for start in range(0, len(self.frame), BLOCK_SIZE):
+            block = self.frame.iloc[start:start + BLOCK_SIZE]
+            store.append(compute_features(block, features=self.features))
+
+    def time_build_features(self):
+        self._build()
+
+    def peakmem_build_features(self):
+        self._build()
+
+
+class FeatureStoreRead(_TemporaryDirectory):
+    """ `src.features.store.FeatureStore`: memory-mapped reads.
+    """
+    def setup(self):
+        super(FeatureStoreRead, self).setup()
+        self.store = synthetic_store(self.tmp_dir)
+        self.indices = np.random.RandomState(1).randint(0, N_ROWS, 10000)
+
+    def time_iter_blocks(self):
+        for cols in self.store.iter_blocks(BLOCK_SIZE):
+            sum(values.sum() for values in cols.values())
+
+    def time_take(self):
+        self.store.take(self.indices)
+
+
+class TrainModel(_TemporaryDirectory):
+    """ `src.models.train_model.train_incremental`: out-of-core training.
+    """
+    def setup(self):
+        self.SGDRegressor = _import_sklearn_sgd()
+        super(TrainModel, self).setup()
+        self.store = synthetic_store(self.tmp_dir)
+
+    def _train(self):
+        from src.models.train_model import train_incremental
+
+        train_incremental(self.SGDRegressor(random_state=0), self.store,
+                          'target', batch_size=BLOCK_SIZE)
+
+    def time_train_incremental(self):
+        self._train()
+
+    def peakmem_train_incremental(self):
+        self._train()
+
+
+class PredictModel(_TemporaryDirectory):
+    """ `src.models.predict_model.predict_store`: batch predictions.
+    """
+    def setup(self):
+        SGDRegressor = _import_sklearn_sgd()
+        super(PredictModel, self).setup()
+        self.store = synthetic_store(os.path.join(self.tmp_dir, 'features'),
+                                     n_rows=N_CSV_ROWS)
+        frame = synthetic_frame(10000)
+        self.model = SGDRegressor(random_state=0).fit(
+            frame.drop(columns='target').to_numpy(), frame['target'])
+        self.output_filepath = os.path.join(self.tmp_dir, 'predictions.csv')
+
+    def _predict(self):
+        from src.models.predict_model import predict_store
+
+        predict_store(self.model, self.store, self.output_filepath,
+                      block_size=N_CSV_ROWS // 4)
+
+    def time_predict_store(self):
+        self._predict()
+
+    def peakmem_predict_store(self):
+        self._predict()
+
+
+class ReadColumns(_TemporaryDirectory):
+    """ `src.data.io.read_columns`: columns of a Parquet file.
+
+        Its memory is allocated by Arrow, out of sight of `tracemalloc`, so
+        it has no peak-memory benchmark.
+    """
+    def setup(self):
+        from src.data.io import write_table
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise NotImplementedError('pyarrow is not installed')
+        super(ReadColumns, self).setup()
+        self.filepath = os.path.join(self.tmp_dir, 'catl.parquet')
+        write_table(synthetic_frame(), self.filepath,
+                    row_group_size=BLOCK_SIZE)
+
+    def time_read_columns(self):
+        from src.data.io import read_columns
+
+        read_columns(self.filepath, columns=['x0', 'target'],
+                     memory_map=True)
+
+
+class Density(object):
+    """ `src.visualization.density`: binning and drawing of large
+        catalogues.
+    """
+    def setup(self):
+        rng = np.random.RandomState(0)
+        self.x = rng.normal(size=10 * N_ROWS)
+        self.y = rng.normal(size=10 * N_ROWS)
+
+    def time_bin_points(self):
+        from src.visualization.density import bin_points
+
+        bin_points(self.x, self.y, x_range=(-5, 5), y_range=(-5, 5))
+
+    def peakmem_bin_points(self):
+        from src.visualization.density import bin_points
+
+        bin_points(self.x, self.y, x_range=(-5, 5), y_range=(-5, 5))
+
+    def time_plot_density(self):
+        try:
+            from matplotlib.figure import Figure
+        except ImportError:
+            raise NotImplementedError('matplotlib is not installed')
+        from src.visualization.density import bin_points, plot_density
+
+        grid = bin_points(self.x[:N_ROWS], self.y[:N_ROWS],
+                          x_range=(-5, 5), y_range=(-5, 5))
+        fig = Figure()
+        plot_density(fig.add_subplot(111), grid)
+        fig.savefig(io.BytesIO(), format='png')
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+""" Source code of the project.
+
+    Subpackages are imported when they are first used, so that `import src`
+    stays cheap.
+"""
+from src.utils.lazy import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(
+    __name__, ['data', 'features', 'models', 'utils', 'visualization'])
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+""" Columnar storage for the data sets in `data/processed`.
+
+    Tables are read and written as Parquet, Feather (Arrow IPC) or HDF5
+    files, selected by the file extension:
+
+        =====================  ===========
+        Extension              Format
+        =====================  ===========
+        .parquet, .pq          Parquet
+        .feather, .arrow       Feather / Arrow IPC
+        .h5, .hdf5             HDF5
+        =====================  ===========
+
+    Only the requested columns and rows are read. Feather and HDF5 files
+    written by `write_table` can be memory-mapped, in which case the columns
+    returned by `read_columns` are views of the file and are only read from
+    disk when they are used.
+
+    Usage:
+
+        from src.data.io import read_columns, read_table, write_table
+
+        write_table(catl_df, 'data/processed/catl.feather')
+        catl_df = read_table('data/processed/catl.feather',
+                             columns=['ra', 'dec'], rows=(0, 1000))
+        cols = read_columns('data/processed/catl.h5', memory_map=True)
+"""
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# File extensions of each format
+FORMATS = {'.parquet': 'parquet',
+           '.pq': 'parquet',
+           '.feather': 'feather',
+           '.arrow': 'feather',
+           '.h5': 'hdf5',
+           '.hdf5': 'hdf5'}
+# Group of the HDF5 file that holds the columns
+HDF5_GROUP = 'table'
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        msg = '`pyarrow` is needed for Parquet and Feather files. '
+        msg += 'Please install it beforehand!'
+        raise ImportError(msg)
+    return pyarrow
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        msg = '`h5py` is needed for HDF5 files. Please install it beforehand!'
+        raise ImportError(msg)
+    return h5py
+
+
+def file_format(filepath, fmt=None):
+    """ Format of `filepath`, from its extension unless `fmt` is given.
+    """
+    if fmt is None:
+        fmt = FORMATS.get(os.path.splitext(filepath)[1].lower())
+    if fmt not in set(FORMATS.values()):
+        msg = '`{0}`: unknown format `{1}`! '.format(filepath, fmt)
+        msg += 'Use one of {0}'.format(sorted(set(FORMATS.values())))
+        raise ValueError(msg)
+    return fmt
+
+
+def _row_range(rows, n_rows):
+    """ Converts `rows` (None, `(start, stop)` or a slice) into a
+        `(start, stop)` range within `[0, n_rows]`.
+    """
+    if rows is None:
+        return 0, n_rows
+    if not isinstance(rows, slice):
+        rows = slice(*rows)
+    start, stop, step = rows.indices(n_rows)
+    if step != 1:
+        raise ValueError('`rows` must be a contiguous range of rows!')
+    return start, max(start, stop)
+
+
+def write_table(df, filepath, fmt=None, row_group_size=1000000):
+    """ Writes the `pandas.DataFrame` `df` to `filepath`.
+
+        Parameters
+        ----------
+        df : `pandas.DataFrame`
+            Table to write. The index is not stored.
+
+        filepath : str
+            Path to the output file.
+
+        fmt : {'parquet', 'feather', 'hdf5'}, optional
+            Format of the file. Inferred from the extension by default.
+
+        row_group_size : int, optional
+            Rows per Parquet row group. Smaller groups make row-range reads
+            cheaper.
+    """
+    fmt = file_format(filepath, fmt)
+    part_filepath = filepath + '.part'
+    if fmt == 'parquet':
+        pa = _import_pyarrow()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pa.parquet.write_table(table, part_filepath,
+                               row_group_size=row_group_size)
+    elif fmt == 'feather':
+        pa = _import_pyarrow()
+        ## Uncompressed and in a single record batch, so that the columns
+        ## can be memory-mapped without copies
+        pa.feather.write_feather(df.reset_index(drop=True), part_filepath,
+                                 compression='uncompressed',
+                                 chunksize=max(len(df), 1))
+    else:
+        h5py = _import_h5py()
+        with h5py.File(part_filepath, 'w') as h5_f:
+            group = h5_f.create_group(HDF5_GROUP)
+            group.attrs['columns'] = [str(col) for col in df.columns]
+            for col in df.columns:
+                values = df[col].to_numpy()
+                if values.dtype.kind == 'O':
+                    values = values.astype(str).astype(
+                        h5py.string_dtype())
+                ## Contiguous datasets, so that they can be memory-mapped
+                group.create_dataset(str(col), data=values)
+    os.replace(part_filepath, filepath)
+
+
+def _read_parquet(filepath, columns, rows, memory_map):
+    pa = _import_pyarrow()
+    parquet_file = pa.parquet.ParquetFile(filepath, memory_map=memory_map)
+    metadata = parquet_file.metadata
+    start, stop = _row_range(rows, metadata.num_rows)
+    ##
+    ## Reading only the row groups that overlap with the range of rows
+    row_groups = []
+    offset = 0
+    first_offset = None
+    for idx in range(metadata.num_row_groups):
+        n_group_rows = metadata.row_group(idx).num_rows
+        if offset < stop and offset + n_group_rows > start:
+            row_groups.append(idx)
+            if first_offset is None:
+                first_offset = offset
+        offset += n_group_rows
+    if not row_groups:
+        table = parquet_file.schema_arrow.empty_table()
+        if columns is not None:
+            table = table.select(columns)
+        return table
+    table = parquet_file.read_row_groups(row_groups, columns=columns)
+    return table.slice(start - first_offset, stop - start)
+
+
+def _read_feather(filepath, columns, rows, memory_map):
+    pa = _import_pyarrow()
+    if memory_map:
+        source = pa.memory_map(filepath, 'r')
+    else:
+        source = pa.OSFile(filepath, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    start, stop = _row_range(rows, table.num_rows)
+    return table.slice(start, stop - start)
+
+
+def _read_hdf5(filepath, columns, rows, memory_map):
+    h5py = _import_h5py()
+    arrays = OrderedDict()
+    with h5py.File(filepath, 'r') as h5_f:
+        group = h5_f[HDF5_GROUP]
+        if columns is None:
+            columns = list(group.attrs['columns'])
+        for col in columns:
+            dset = group[col]
+            start, stop = _row_range(rows, dset.shape[0])
+            offset = dset.id.get_offset()
+            if memory_map and dset.dtype.kind != 'O' and stop > start and \
+                    offset is not None and dset.chunks is None:
+                ## Contiguous and uncompressed: view of the file
+                row_nbytes = dset.dtype.itemsize * int(np.prod(dset.shape[1:]))
+                arrays[col] = np.memmap(
+                    filepath, dtype=dset.dtype, mode='r',
+                    offset=offset + start * row_nbytes,
+                    shape=(stop - start,) + dset.shape[1:])
+            elif h5py.check_string_dtype(dset.dtype) is not None:
+                arrays[col] = dset.asstr()[start:stop].astype(object)
+            else:
+                arrays[col] = dset[start:stop]
+
+    return arrays
+
+
+def _column_to_numpy(column):
+    """ Converts an Arrow column to NumPy, without copying it when it is a
+        single chunk of a numeric type without missing values.
+    """
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=False)
+    return column.to_numpy()
+
+
+def read_columns(filepath, columns=None, rows=None, memory_map=False,
+                 fmt=None):
+    """ Reads columns of a table as NumPy arrays.
+
+        Parameters
+        ----------
+        filepath : str
+            Path to the file.
+
+        columns : list of str, optional
+            Columns to read. All of them by default.
+
+        rows : tuple or slice, optional
+            Range of rows to read, e.g. `(1000, 2000)`. All of them by
+            default.
+
+        memory_map : bool, optional
+            Memory-map the file. Numeric columns of Feather and HDF5 files
+            written by `write_table` are then returned without copying.
+
+        fmt : {'parquet', 'feather', 'hdf5'}, optional
+            Format of the file. Inferred from the extension by default.
+
+        Returns
+        -------
+        arrays : `collections.OrderedDict`
+            NumPy array of each column.
+    """
+    fmt = file_format(filepath, fmt)
+    if fmt == 'hdf5':
+        return _read_hdf5(filepath, columns, rows, memory_map)
+
+    if fmt == 'parquet':
+        table = _read_parquet(filepath, columns, rows, memory_map)
+    else:
+        table = _read_feather(filepath, columns, rows, memory_map)
+
+    return OrderedDict((name, _column_to_numpy(table.column(name)))
+                       for name in table.column_names)
+
+
+def read_table(filepath, columns=None, rows=None, memory_map=False,
+               fmt=None):
+    """ Reads a table as a `pandas.DataFrame`.
+
+        See `read_columns` for the parameters. The columns are copied into
+        the `pandas.DataFrame`; use `read_columns` to work on memory-mapped
+        columns directly.
+    """
+    fmt = file_format(filepath, fmt)
+    if fmt == 'parquet':
+        return _read_parquet(filepath, columns, rows, memory_map).to_pandas()
+    if fmt == 'feather':
+        return _read_feather(filepath, columns, rows, memory_map).to_pandas()
+
+    return pd.DataFrame(_read_hdf5(filepath, columns, rows, memory_map))
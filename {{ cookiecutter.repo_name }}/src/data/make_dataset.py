@@ -1,24 +1,284 @@
 # -*- coding: utf-8 -*-
 import os
+import glob
+import time
 import click
 import logging
+import functools
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import find_dotenv, load_dotenv
 
+from src.utils.lazy import lazy_import
+from src.utils.logs import (executor_kwargs, flush_on_error, setup_logging,
+                            throughput)
+from src.utils.profiling import profile_stage
+
+## Imported on first use, so that `--help` does not wait for pandas
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Transform steps of each stage of the raw -> interim -> processed
+# pipeline, applied in order
+TRANSFORMS = OrderedDict([('interim', []), ('processed', [])])
+
+
+def register_transform(func=None, stage='processed'):
+    """ Registers `func` as a step of the `stage` ('interim' or 'processed')
+        of the raw -> interim -> processed pipeline.
+
+        `func` takes a chunk of the raw data set (a `pandas.DataFrame`) and
+        returns the transformed chunk, or `None` to drop it. Steps only see
+        one chunk at a time, so memory use depends on `--chunksize` and not
+        on the size of the input file.
+
+        Steps must be registered when this module, or a module it imports,
+        is loaded, so they are also available in the `--jobs` workers.
+
+        Usage:
+
+            @register_transform(stage='interim')
+            def drop_missing(chunk):
+                return chunk.dropna()
+
+            @register_transform
+            def add_colour(chunk):
+                return chunk.assign(g_r=chunk['g'] - chunk['r'])
+    """
+    if func is None:
+        return functools.partial(register_transform, stage=stage)
+    TRANSFORMS[stage].append(func)
+    return func
+
+
+def stage_transforms(stage='all'):
+    """ Transform steps of `stage`, or of every stage if `stage` is 'all'.
+    """
+    if stage == 'all':
+        return [step for steps in TRANSFORMS.values() for step in steps]
+    return list(TRANSFORMS[stage])
+
+
+def read_chunks(input_filepath, chunksize):
+    """ Reads `input_filepath` lazily, `chunksize` rows at a time.
+    """
+    return pd.read_csv(input_filepath, chunksize=chunksize)
+
+
+def _run_step(step, chunks):
+    empty_chunk = None
+    n_chunks = 0
+    for chunk in chunks:
+        chunk = step(chunk)
+        if chunk is None:
+            continue
+        if len(chunk) > 0:
+            n_chunks += 1
+            yield chunk
+        elif empty_chunk is None:
+            empty_chunk = chunk
+    ## When every row is dropped, an empty chunk still carries the columns
+    ## of the output
+    if n_chunks == 0 and empty_chunk is not None:
+        yield empty_chunk
+
+
+def apply_transforms(chunks, transforms=None):
+    """ Chains the transform steps as generators over `chunks`.
+
+        Nothing is computed until the returned generator is consumed, and
+        each chunk goes through every step before the next one is read.
+        Empty chunks are dropped, unless every chunk is empty: a single
+        empty chunk is then passed on. Defaults to the steps of every stage.
+    """
+    transforms = stage_transforms() if transforms is None else transforms
+    for step in transforms:
+        chunks = _run_step(step, chunks)
+    return chunks
+
+
+def write_chunks(chunks, output_filepath):
+    """ Writes `chunks` incrementally to `output_filepath` (CSV).
+
+        The file is written to `<output_filepath>.part` and renamed once
+        every chunk is written, so a failed run does not leave a truncated
+        data set behind. Missing parent directories are created. The header
+        is written from the first chunk, even if it has no rows.
+
+        Returns the number of (non-empty) chunks and rows written.
+    """
+    filename = os.path.basename(output_filepath)
+    part_filepath = output_filepath + '.part'
+    dirname = os.path.dirname(os.path.abspath(output_filepath))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname, exist_ok=True)
+    n_chunks, n_rows = 0, 0
+    header = True
+    try:
+        with open(part_filepath, 'w') as f:
+            for chunk in chunks:
+                chunk.to_csv(f, header=header, index=False)
+                header = False
+                if len(chunk) == 0:
+                    continue
+                n_chunks += 1
+                n_rows += len(chunk)
+                ## Rate-limited by `setup_logging`
+                logger.info('%s: %d chunks, %d rows written', filename,
+                            n_chunks, n_rows)
+    except BaseException:
+        ## The error of the chunks is the one reported
+        if os.path.exists(part_filepath):
+            os.remove(part_filepath)
+        raise
+    os.replace(part_filepath, output_filepath)
+
+    return n_chunks, n_rows
+
+
+def process_dataset(input_filepath, output_filepath, chunksize=100000,
+                    transforms=None, stage='all'):
+    """ Streams `input_filepath` through the transform steps into
+        `output_filepath`, one chunk at a time.
+
+        The steps are `transforms` if given, or else those of `stage`.
+
+        Returns the number of chunks and rows written.
+    """
+    if transforms is None:
+        transforms = stage_transforms(stage)
+    chunks = read_chunks(input_filepath, chunksize)
+    return write_chunks(apply_transforms(chunks, transforms), output_filepath)
+
+
+# Outcome of the processing of one raw file
+IngestResult = namedtuple('IngestResult', ['input_filepath', 'output_filepath',
+                                           'n_rows', 'n_bytes', 'seconds',
+                                           'error'])
+
+
+def expand_inputs(input_path):
+    """ Expands a file, a directory or a glob pattern into the sorted list
+        of files to process. Hidden files (e.g. `.gitkeep`) are skipped.
+    """
+    if os.path.isdir(input_path):
+        filepaths = [os.path.join(input_path, filename)
+                     for filename in os.listdir(input_path)]
+    else:
+        filepaths = glob.glob(input_path)
+
+    return sorted(filepath for filepath in filepaths
+                  if os.path.isfile(filepath) and
+                  not os.path.basename(filepath).startswith('.'))
+
+
+def _process_file(task):
+    """ Processes a single file, catching its errors so that one bad file
+        does not stop the other ones.
+    """
+    input_filepath, output_filepath, chunksize, stage = task
+    start = time.time()
+    n_rows, n_bytes = 0, 0
+    try:
+        n_bytes = os.path.getsize(input_filepath)
+        _, n_rows = process_dataset(input_filepath, output_filepath,
+                                    chunksize=chunksize, stage=stage)
+        error = None
+    except Exception as err:
+        n_rows = 0
+        error = '{0}: {1}'.format(type(err).__name__, err)
+    result = IngestResult(input_filepath, output_filepath, n_rows, n_bytes,
+                          time.time() - start, error)
+    if error is None:
+        logger.info('processed %s (%d rows) in %.2fs', input_filepath,
+                    n_rows, result.seconds,
+                    extra=throughput('make_dataset.{0}'.format(stage),
+                                     rows=n_rows, n_bytes=result.n_bytes,
+                                     seconds=result.seconds))
+
+    return result
+
+
+def process_files(filepath_pairs, chunksize=100000, jobs=1, stage='all'):
+    """ Processes every `(input_filepath, output_filepath)` pair through the
+        steps of `stage` on a pool of `jobs` processes.
+
+        Returns a list of `IngestResult`, in the same order as
+        `filepath_pairs` regardless of the order in which files finish.
+    """
+    tasks = [(input_filepath, output_filepath, chunksize, stage)
+             for input_filepath, output_filepath in filepath_pairs]
+    if jobs == 1 or len(tasks) <= 1:
+        return [_process_file(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=jobs, **executor_kwargs()) as pool:
+        return list(pool.map(_process_file, tasks))
+
 
 @click.command()
-@click.argument('input_filepath', type=click.Path(exists=True))
+@click.argument('input_filepath', type=click.Path())
 @click.argument('output_filepath', type=click.Path())
-def main(input_filepath, output_filepath):
+@click.option('--chunksize', type=click.IntRange(min=1), default=100000,
+              show_default=True,
+              help='Number of rows read, transformed and written at a time.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help='Number of files processed in parallel.')
+@click.option('--stage', type=click.Choice(['all', 'interim', 'processed']),
+              default='all', show_default=True,
+              help='Stage of the pipeline whose transform steps are run.')
+@flush_on_error
+def main(input_filepath, output_filepath, chunksize, jobs, stage):
     """ Runs data processing scripts to turn raw data from (../raw) into
         cleaned data ready to be analyzed (saved in ../processed).
+
+        INPUT_FILEPATH is a file, a directory or a quoted glob pattern
+        (e.g. 'data/raw/*.csv'). When it matches several files,
+        OUTPUT_FILEPATH is a directory and each file is written to it with
+        the same name.
     """
-    logger = logging.getLogger(__name__)
     logger.info('making final data set from raw data')
 
+    input_filepaths = expand_inputs(input_filepath)
+    if not input_filepaths:
+        raise click.BadParameter('no files found in `{0}`'.format(
+            input_filepath), param_hint='INPUT_FILEPATH')
+
+    if os.path.isfile(input_filepath) and not os.path.isdir(output_filepath):
+        filepath_pairs = [(input_filepath, output_filepath)]
+    else:
+        if not os.path.isdir(output_filepath):
+            os.makedirs(output_filepath)
+        filepath_pairs = [(filepath, os.path.join(output_filepath,
+                                                  os.path.basename(filepath)))
+                          for filepath in input_filepaths]
+
+    start = time.time()
+    with profile_stage('make_dataset.{0}'.format(stage)):
+        results = process_files(filepath_pairs, chunksize=chunksize,
+                                jobs=jobs, stage=stage)
+    seconds = time.time() - start
+
+    failed = [res for res in results if res.error is not None]
+    for res in failed:
+        logger.error('failed to process %s: %s', res.input_filepath,
+                     res.error)
+    processed = [res for res in results if res.error is None]
+    n_mb = sum(res.n_bytes for res in processed) / 1024. ** 2
+    logger.info('processed %d files (%d rows, %.1f MB) in %.2fs: '
+                '%.2f files/s, %.2f MB/s', len(processed),
+                sum(res.n_rows for res in processed), n_mb, seconds,
+                len(processed) / max(seconds, 1e-9),
+                n_mb / max(seconds, 1e-9))
+    if failed:
+        ## Before click prints the error
+        raise click.ClickException('{0} of {1} files failed'.format(
+            len(failed), len(results)))
+
 
 if __name__ == '__main__':
-    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    setup_logging()
 
     # not used in this stub but often useful for finding various files
     project_dir = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
@@ -13,38 +13,39 @@ __maintainer__ =['Victor Calderon']
 """
 
 """
-# Importing Modules
-from cosmo_utils       import mock_catalogues as cm
-from cosmo_utils       import utils           as cu
-from cosmo_utils.utils import file_utils      as cfutils
-from cosmo_utils.utils import file_readers    as cfreaders
-from cosmo_utils.utils import work_paths      as cwpaths
-from cosmo_utils.utils import stats_funcs     as cstats
-from cosmo_utils.utils import geometry        as cgeom
-from cosmo_utils.mock_catalogues import catls_utils as cmcu
-
-import numpy as num
-import math
-import os
-import sys
-import pandas as pd
-import pickle
-import matplotlib
-matplotlib.use( 'Agg' )
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-plt.rc('text', usetex=True)
-import seaborn as sns
-#sns.set()
-from progressbar import (Bar, ETA, FileTransferSpeed, Percentage, ProgressBar,
-                        ReverseBar, RotatingMarker)
-from tqdm import tqdm
-
 # Extra-modules
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
 from argparse import HelpFormatter
 from operator import attrgetter
-from tqdm import tqdm
+
+from src.utils.lazy import lazy_import
+
+## Heavy modules are imported the first time they are used, so that e.g.
+## `--help` and `--version` return at once. Use them as usual, e.g.
+## `num.arange(10)`, `plt.figure()`, `tqdm.tqdm(...)`, `progressbar.Bar()`.
+def _setup_pyplot(plt):
+    plt.switch_backend('Agg')
+    plt.rc('text', usetex=True)
+
+cm        = lazy_import('cosmo_utils.mock_catalogues')
+cu        = lazy_import('cosmo_utils.utils')
+cfutils   = lazy_import('cosmo_utils.utils.file_utils')
+cfreaders = lazy_import('cosmo_utils.utils.file_readers')
+cwpaths   = lazy_import('cosmo_utils.utils.work_paths')
+cstats    = lazy_import('cosmo_utils.utils.stats_funcs')
+cgeom     = lazy_import('cosmo_utils.utils.geometry')
+cmcu      = lazy_import('cosmo_utils.mock_catalogues.catls_utils')
+
+num         = lazy_import('numpy')
+pd          = lazy_import('pandas')
+matplotlib  = lazy_import('matplotlib', setup=lambda mpl: mpl.use('Agg'))
+plt         = lazy_import('matplotlib.pyplot', setup=_setup_pyplot)
+ticker      = lazy_import('matplotlib.ticker')
+sns         = lazy_import('seaborn')
+progressbar = lazy_import('progressbar')
+tqdm        = lazy_import('tqdm')
+runs        = lazy_import('src.utils.runs')
 
 ## Functions
 class SortingHelpFormatter(HelpFormatter):
@@ -61,7 +62,7 @@ def _str2bool(v):
     elif v.lower() in ('no', 'false', 'f', 'n', '0'):
         return False
     else:
-        raise argparse.ArgumentTypeError('Boolean value expected.')
+        raise ArgumentTypeError('Boolean value expected.')
 
 def _check_pos_val(val, val_min=0):
     """
@@ -88,7 +89,7 @@ def _check_pos_val(val, val_min=0):
     if ival <= val_min:
         msg  = '`{0}` is an invalid input!'.format(ival)
         msg += '`val` must be larger than `{0}`!!'.format(val_min)
-        raise argparse.ArgumentTypeError(msg)
+        raise ArgumentTypeError(msg)
 
     return ival
 
@@ -124,12 +125,19 @@ def get_parser():
                         help='Description of variable',
                         type=_str2bool,
                         default=False)
-    ## Program message
+    ## Re-running the script
+    parser.add_argument('--force',
+                        dest='force',
+                        help='Run even if the script already ran with the '
+                             'same arguments and inputs',
+                        action='store_true')
+    ## Program message. Its default comes from `cosmo_utils`, and is only
+    ## computed when the script runs
     parser.add_argument('-progmsg',
                         dest='Prog_msg',
                         help='Program message to use throught the script',
                         type=str,
-                        default=cfutils.Program_Msg(__file__))
+                        default=None)
     ## Parsing Objects
     args = parser.parse_args()
 
@@ -183,6 +191,30 @@ def directory_skeleton(param_dict, proj_dict):
 
     return proj_dict
 
+def analysis(param_dict, proj_dict):
+    """
+    Main analysis of the script
+
+    Parameters
+    ----------
+    param_dict: python dictionary
+        dictionary with `project` variables
+
+    proj_dict: python dictionary
+        Dictionary with current and new paths to project directories
+
+    Returns
+    ---------
+    output_paths: list
+        Paths to the files (or directories) written by the analysis. They
+        are recorded in the manifest of the run, and restored when the
+        script runs again with the same arguments and inputs.
+    """
+    ## This is where the analysis goes
+    output_paths = []
+
+    return output_paths
+
 
 
 def main():
@@ -194,11 +226,15 @@ def main():
     ## Checking for correct input
     param_vals_test(param_dict)
     ## Program message
+    if param_dict['Prog_msg'] is None:
+        param_dict['Prog_msg'] = cfutils.Program_Msg(__file__)
     Prog_msg = param_dict['Prog_msg']
     ##
     ## Creating Folder Structure
-    # proj_dict  = directory_skeleton(param_dict, cwpaths.cookiecutter_paths(__file__))
-    proj_dict  = directory_skeleton(param_dict, cwpaths.cookiecutter_paths('./'))
+    # proj_dict  = directory_skeleton(param_dict,
+    #                                 cwpaths.cookiecutter_paths(__file__))
+    proj_dict  = directory_skeleton(param_dict,
+                                    cwpaths.cookiecutter_paths('./'))
     ##
     ## Printing out project variables
     print('\n'+50*'='+'\n')
@@ -206,6 +242,19 @@ def main():
         if key !='Prog_msg':
             print('{0} `{1}`: {2}'.format(Prog_msg, key, key_val))
     print('\n'+50*'='+'\n')
+    ##
+    ## Run manifest. `inputs` are the files read by the analysis, whose
+    ## contents are part of the key of the run
+    run = runs.RunManifest(__file__, param_dict, inputs=[])
+    if not param_dict['force'] and run.restore():
+        print('{0} Outputs restored from run `{1}`. Use `--force` to run '
+              'again'.format(Prog_msg, run.key[:12]))
+        return
+    ##
+    ## Analysis
+    output_paths = analysis(param_dict, proj_dict)
+    ## Recording the run
+    run.record(output_paths)
 
 
 # Main function
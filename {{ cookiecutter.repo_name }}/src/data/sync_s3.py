@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+""" Delta-only, parallel synchronisation of `data/` with S3.
+
+    Instead of listing the bucket and comparing every object, both sides
+    keep a manifest with the size and SHA-256 hash of every file:
+
+    * `data/.s3_manifest.json` remembers the hash of each local file
+      together with its size and modification time, so unchanged files are
+      not hashed again.
+    * `<prefix>/.s3_manifest.json` in the bucket holds the hash of every
+      object uploaded by this tool.
+
+    Only the files whose hash differs from the other side are transferred.
+    Large files are sent in parts, several at a time, and the state of
+    unfinished transfers is kept in `data/.s3_transfers`, so an interrupted
+    sync resumes where it stopped.
+
+        $ python -m src.data.sync_s3 push --bucket my-bucket --profile default
+        $ python -m src.data.sync_s3 pull --bucket my-bucket --profile default
+
+    Use `--endpoint-url` (or the `S3_ENDPOINT_URL` variable) to point to a
+    local S3 stand-in, e.g. `moto_server -p 5000`.
+"""
+import os
+import json
+import math
+import time
+import click
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import find_dotenv, load_dotenv
+
+from src.utils.logs import flush_on_error, setup_logging
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Directory that is synchronised
+DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+# Name of the manifest, both locally and in the bucket
+MANIFEST_NAME = '.s3_manifest.json'
+# Directory with the state of unfinished transfers
+TRANSFERS_NAME = '.s3_transfers'
+# Suffix of files being downloaded
+PART_SUFFIX = '.s3part'
+# Files larger than this are transferred in parts
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+# Size of each part (S3 requires at least 5 MB)
+PART_SIZE = 64 * 1024 * 1024
+# The remote manifest is saved after this many transferred files
+MANIFEST_SAVE_EVERY = 100
+
+logger = logging.getLogger(__name__)
+
+
+def _import_boto3():
+    try:
+        import boto3
+    except ImportError:
+        msg = '`boto3` is needed to synchronise with S3. '
+        msg += 'Please install it beforehand!'
+        raise ImportError(msg)
+    return boto3
+
+
+def _write_atomic(filepath, data):
+    dirname = os.path.dirname(filepath)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_filepath, filepath)
+
+
+def _hash_file(filepath, blocksize=2 ** 20):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _is_synced_path(relpath):
+    """ Whether `relpath` is a data file, and not a file of this tool.
+    """
+    parts = relpath.split('/')
+    return (parts[0] not in (MANIFEST_NAME, TRANSFERS_NAME) and
+            not relpath.endswith(PART_SUFFIX))
+
+
+def load_manifest(data_dir=DATA_DIR):
+    """ Local manifest: `{relpath: {'size', 'mtime_ns', 'sha256'}}`.
+    """
+    filepath = os.path.join(data_dir, MANIFEST_NAME)
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def save_manifest(manifest, data_dir=DATA_DIR):
+    _write_atomic(os.path.join(data_dir, MANIFEST_NAME),
+                  json.dumps(manifest, sort_keys=True).encode('utf-8'))
+
+
+def _file_entry(filepath, known=None):
+    stat = os.stat(filepath)
+    if known and known['size'] == stat.st_size and \
+            known['mtime_ns'] == stat.st_mtime_ns:
+        sha256 = known['sha256']
+    else:
+        sha256 = _hash_file(filepath)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256}
+
+
+def scan_local(data_dir=DATA_DIR, manifest=None):
+    """ Size, modification time and hash of every local data file.
+
+        Files whose size and modification time match `manifest` are not
+        read again.
+
+        Returns
+        -------
+        entries : dict
+            `{relpath: {'size', 'mtime_ns', 'sha256'}}`, with `/` separated
+            paths relative to `data_dir`.
+    """
+    manifest = load_manifest(data_dir) if manifest is None else manifest
+    entries = {}
+    for root, dirs, files in os.walk(data_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            filepath = os.path.join(root, filename)
+            relpath = os.path.relpath(filepath, data_dir).replace(os.sep, '/')
+            if _is_synced_path(relpath):
+                entries[relpath] = _file_entry(filepath, manifest.get(relpath))
+
+    return entries
+
+
+class S3Sync(object):
+    """ Transfers files between `data_dir` and `s3://bucket/prefix`.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket.
+
+        prefix : str, optional
+            Prefix of the keys in the bucket.
+
+        data_dir : str, optional
+            Local directory to synchronise.
+
+        profile : str, optional
+            AWS profile.
+
+        endpoint_url : str, optional
+            URL of the S3 service, e.g. of a local S3 stand-in.
+
+        jobs : int, optional
+            Number of files transferred at the same time.
+
+        part_jobs : int, optional
+            Number of parts of large files transferred at the same time.
+    """
+    def __init__(self, bucket, prefix='data', data_dir=DATA_DIR,
+                 profile=None, endpoint_url=None, jobs=8, part_jobs=8,
+                 multipart_threshold=MULTIPART_THRESHOLD, part_size=PART_SIZE):
+        boto3 = _import_boto3()
+        session = boto3.session.Session(profile_name=profile)
+        self.client = session.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.data_dir = data_dir
+        self.jobs = jobs
+        self.part_jobs = part_jobs
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.transfers_dir = os.path.join(data_dir, TRANSFERS_NAME)
+        self._lock = threading.Lock()
+
+    def _key(self, relpath):
+        return '/'.join([self.prefix, relpath]) if self.prefix else relpath
+
+    def _part_size(self, size):
+        ## S3 allows at most 10000 parts
+        return max(self.part_size, int(math.ceil(size / 10000.)))
+
+    def _state_path(self, sha256, kind):
+        return os.path.join(self.transfers_dir,
+                            '{0}.{1}.json'.format(sha256, kind))
+
+    def _load_state(self, state_path):
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path) as f:
+            return json.load(f)
+
+    def _save_state(self, state_path, state):
+        with self._lock:
+            _write_atomic(state_path, json.dumps(state).encode('utf-8'))
+
+    ##
+    ## Remote manifest
+
+    def get_remote_manifest(self):
+        """ Remote manifest: `{relpath: {'size', 'sha256'}}`.
+        """
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self._key(MANIFEST_NAME))
+        except self.client.exceptions.NoSuchKey:
+            return {}
+        return json.loads(response['Body'].read().decode('utf-8'))
+
+    def put_remote_manifest(self, manifest):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._key(MANIFEST_NAME),
+            Body=json.dumps(manifest, sort_keys=True).encode('utf-8'))
+
+    ##
+    ## Uploads
+
+    def upload(self, relpath, entry, part_pool):
+        """ Uploads one file, in parts if it is large.
+        """
+        filepath = os.path.join(self.data_dir, relpath)
+        key = self._key(relpath)
+        if entry['size'] < self.multipart_threshold:
+            with open(filepath, 'rb') as f:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=f,
+                                       Metadata={'sha256': entry['sha256']})
+            return
+        ##
+        ## Resuming the multipart upload of this content, if any
+        state_path = self._state_path(entry['sha256'], 'upload')
+        state = self._load_state(state_path)
+        done = {}
+        if state is not None and state['key'] == key:
+            try:
+                paginator = self.client.get_paginator('list_parts')
+                for page in paginator.paginate(Bucket=self.bucket, Key=key,
+                                               UploadId=state['upload_id']):
+                    for part in page.get('Parts', []):
+                        done[part['PartNumber']] = part['ETag']
+            except self.client.exceptions.NoSuchUpload:
+                state = None
+        else:
+            state = None
+        if state is None:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=key,
+                Metadata={'sha256': entry['sha256']})
+            state = {'key': key, 'upload_id': response['UploadId']}
+            self._save_state(state_path, state)
+            done = {}
+
+        part_size = self._part_size(entry['size'])
+        n_parts = int(math.ceil(entry['size'] / float(part_size)))
+
+        def upload_part(part_number):
+            with open(filepath, 'rb') as f:
+                f.seek((part_number - 1) * part_size)
+                body = f.read(part_size)
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=state['upload_id'],
+                PartNumber=part_number, Body=body)
+            return part_number, response['ETag']
+
+        futures = [part_pool.submit(upload_part, part_number)
+                   for part_number in range(1, n_parts + 1)
+                   if part_number not in done]
+        for future in as_completed(futures):
+            part_number, etag = future.result()
+            done[part_number] = etag
+
+        parts = [dict(PartNumber=part_number, ETag=done[part_number])
+                 for part_number in sorted(done)]
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=state['upload_id'],
+            MultipartUpload=dict(Parts=parts))
+        os.remove(state_path)
+
+    ##
+    ## Downloads
+
+    def download(self, relpath, entry, part_pool):
+        """ Downloads one file, in parts if it is large, and checks its hash.
+        """
+        filepath = os.path.join(self.data_dir, relpath)
+        part_filepath = filepath + PART_SUFFIX
+        key = self._key(relpath)
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+
+        if entry['size'] < self.multipart_threshold:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+            with open(part_filepath, 'wb') as f:
+                for block in iter(lambda: response['Body'].read(2 ** 20),
+                                  b''):
+                    f.write(block)
+        else:
+            ##
+            ## Resuming the download of this content, if any
+            state_path = self._state_path(entry['sha256'], 'download')
+            state = self._load_state(state_path)
+            if state is None or not os.path.exists(part_filepath):
+                with open(part_filepath, 'wb') as f:
+                    f.truncate(entry['size'])
+                state = {'key': key, 'done': []}
+                self._save_state(state_path, state)
+
+            part_size = self._part_size(entry['size'])
+            n_parts = int(math.ceil(entry['size'] / float(part_size)))
+
+            def download_part(part_number):
+                start = (part_number - 1) * part_size
+                stop = min(start + part_size, entry['size']) - 1
+                response = self.client.get_object(
+                    Bucket=self.bucket, Key=key,
+                    Range='bytes={0}-{1}'.format(start, stop))
+                body = response['Body'].read()
+                with open(part_filepath, 'r+b') as f:
+                    f.seek(start)
+                    f.write(body)
+                with self._lock:
+                    state['done'].append(part_number)
+                self._save_state(state_path, state)
+
+            futures = [part_pool.submit(download_part, part_number)
+                       for part_number in range(1, n_parts + 1)
+                       if part_number not in state['done']]
+            for future in as_completed(futures):
+                future.result()
+            os.remove(state_path)
+
+        sha256 = _hash_file(part_filepath)
+        if sha256 != entry['sha256']:
+            os.remove(part_filepath)
+            msg = '`{0}`: hash of the downloaded file does not match!'.format(
+                relpath)
+            raise ValueError(msg)
+        os.replace(part_filepath, filepath)
+
+    ##
+    ## Synchronisation
+
+    def _transfer(self, relpaths, entries, func, on_done):
+        n_bytes = 0
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.part_jobs) as part_pool, \
+                ThreadPoolExecutor(max_workers=self.jobs) as file_pool:
+            futures = dict((file_pool.submit(func, relpath, entries[relpath],
+                                             part_pool), relpath)
+                           for relpath in relpaths)
+            for future in as_completed(futures):
+                relpath = futures[future]
+                try:
+                    future.result()
+                except Exception as err:
+                    errors[relpath] = '{0}: {1}'.format(type(err).__name__,
+                                                        err)
+                    logger.error('failed to transfer %s: %s', relpath,
+                                 errors[relpath])
+                    continue
+                n_bytes += entries[relpath]['size']
+                on_done(relpath)
+
+        return n_bytes, errors
+
+    def push(self):
+        """ Uploads the local files that changed since they were last
+            uploaded.
+
+            Returns
+            -------
+            summary : dict
+                Number of files and bytes transferred, errors and seconds.
+        """
+        start = time.time()
+        remote = self.get_remote_manifest()
+        local = scan_local(self.data_dir)
+        save_manifest(local, self.data_dir)
+        relpaths = sorted(relpath for relpath, entry in local.items()
+                          if remote.get(relpath, {}).get('sha256') !=
+                          entry['sha256'])
+        logger.info('%d of %d files to upload', len(relpaths), len(local))
+
+        n_done = [0]
+
+        def on_done(relpath):
+            remote[relpath] = {'size': local[relpath]['size'],
+                               'sha256': local[relpath]['sha256']}
+            n_done[0] += 1
+            if n_done[0] % MANIFEST_SAVE_EVERY == 0:
+                self.put_remote_manifest(remote)
+
+        try:
+            n_bytes, errors = self._transfer(relpaths, local, self.upload,
+                                             on_done)
+        finally:
+            if n_done[0]:
+                self.put_remote_manifest(remote)
+
+        return {'files': n_done[0], 'bytes': n_bytes, 'errors': errors,
+                'seconds': time.time() - start}
+
+    def pull(self):
+        """ Downloads the remote files that differ from the local ones.
+
+            Returns
+            -------
+            summary : dict
+                Number of files and bytes transferred, errors and seconds.
+        """
+        start = time.time()
+        remote = self.get_remote_manifest()
+        local = scan_local(self.data_dir)
+        relpaths = sorted(relpath for relpath, entry in remote.items()
+                          if local.get(relpath, {}).get('sha256') !=
+                          entry['sha256'])
+        logger.info('%d of %d files to download', len(relpaths), len(remote))
+
+        n_done = [0]
+
+        def on_done(relpath):
+            ## The hash was checked by `download`, no need to compute it again
+            stat = os.stat(os.path.join(self.data_dir, relpath))
+            local[relpath] = {'size': stat.st_size,
+                              'mtime_ns': stat.st_mtime_ns,
+                              'sha256': remote[relpath]['sha256']}
+            n_done[0] += 1
+
+        try:
+            n_bytes, errors = self._transfer(relpaths, remote, self.download,
+                                             on_done)
+        finally:
+            save_manifest(local, self.data_dir)
+
+        return {'files': n_done[0], 'bytes': n_bytes, 'errors': errors,
+                'seconds': time.time() - start}
+
+
+@click.group()
+@click.option('--bucket', required=True, help='Name of the S3 bucket.')
+@click.option('--prefix', default='data', show_default=True,
+              help='Prefix of the keys in the bucket.')
+@click.option('--profile', default=None, help='AWS profile.')
+@click.option('--endpoint-url', envvar='S3_ENDPOINT_URL', default=None,
+              help='URL of the S3 service (e.g. a local moto server).')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=8,
+              show_default=True, help='Files transferred at the same time.')
+@click.option('--part-jobs', type=click.IntRange(min=1), default=8,
+              show_default=True,
+              help='Parts of large files transferred at the same time.')
+@click.pass_context
+def main(ctx, bucket, prefix, profile, endpoint_url, jobs, part_jobs):
+    """ Synchronises `data/` with S3, transferring only changed files.
+    """
+    ctx.obj = S3Sync(bucket, prefix=prefix, profile=profile,
+                     endpoint_url=endpoint_url, jobs=jobs,
+                     part_jobs=part_jobs)
+
+
+def _report(summary):
+    seconds = max(summary['seconds'], 1e-6)
+    click.echo('{0} files, {1:.1f} MB in {2:.1f}s ({3:.1f} MB/s)'.format(
+        summary['files'], summary['bytes'] / 1024. ** 2, seconds,
+        summary['bytes'] / 1024. ** 2 / seconds))
+    if summary['errors']:
+        raise click.ClickException('{0} files failed'.format(
+            len(summary['errors'])))
+
+
+@main.command()
+@click.pass_obj
+@flush_on_error
+def push(sync):
+    """ Uploads the changed local files.
+    """
+    _report(sync.push())
+
+
+@main.command()
+@click.pass_obj
+@flush_on_error
+def pull(sync):
+    """ Downloads the changed remote files.
+    """
+    _report(sync.pull())
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    # AWS credentials may be kept in the .env file
+    load_dotenv(find_dotenv())
+
+    main()
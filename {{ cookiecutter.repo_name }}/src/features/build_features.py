@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import time
+import click
+import logging
+from dotenv import find_dotenv, load_dotenv
+
+from src.data.make_dataset import expand_inputs, read_chunks
+from src.features.registry import FEATURES, compute_features
+from src.features.store import FeatureStore
+from src.utils.logs import flush_on_error, setup_logging, throughput
+from src.utils.profiling import profiled
+
+## Features are declared here, or in modules imported here, e.g.:
+##
+##     from src.features.registry import register_feature
+##
+##     @register_feature(keep=False)
+##     def g_r(g, r):
+##         return g - r
+##
+##     @register_feature
+##     def g_r_squared(g_r):
+##         return g_r ** 2
+
+
+def build_features(input_filepath, store, block_size=100000, names=None,
+                   timings=None, keep_columns=()):
+    """ Computes the registered features of `input_filepath` in a single
+        pass, `block_size` rows at a time, and appends them to the
+        `FeatureStore` `store`, along with the columns `keep_columns` of the
+        data set (e.g. the target of the model).
+
+        Returns the number of rows appended.
+    """
+    n_rows = 0
+    for block in read_chunks(input_filepath, block_size):
+        features_df = compute_features(block, names=names, timings=timings)
+        for column in keep_columns:
+            if column not in block:
+                raise ValueError('`{0}` is not a column of {1}'.format(
+                    column, input_filepath))
+            if column in features_df:
+                raise ValueError('`{0}` is both a feature and a kept '
+                                 'column'.format(column))
+            features_df[column] = block[column]
+        store.append(features_df)
+        n_rows += len(block)
+
+    return n_rows
+
+
+@click.command()
+@click.argument('input_filepath')
+@click.argument('output_dir', type=click.Path())
+@click.option('--block-size', type=click.IntRange(min=1), default=100000,
+              show_default=True,
+              help='Number of rows whose features are computed at a time.')
+@click.option('--feature', 'names', multiple=True,
+              help='Feature to build (repeatable). All of them by default.')
+@click.option('--keep-column', 'keep_columns', multiple=True,
+              help='Column of the data set stored as is, e.g. the target '
+                   '(repeatable).')
+@click.option('--append', is_flag=True,
+              help='Append to the feature store instead of rebuilding it.')
+@flush_on_error
+@profiled('build_features')
+def main(input_filepath, output_dir, block_size, names, keep_columns,
+         append):
+    """ Turns the processed data sets (../processed) matched by
+        INPUT_FILEPATH (a file, a directory or a quoted glob pattern) into
+        the features used for modeling, saved in the feature store
+        OUTPUT_DIR (see `src.features.store`).
+    """
+    logger = logging.getLogger(__name__)
+    logger.info('building features from processed data')
+
+    input_filepaths = expand_inputs(input_filepath)
+    if not input_filepaths:
+        raise click.BadParameter('no files found in `{0}`'.format(
+            input_filepath), param_hint='INPUT_FILEPATH')
+    if not FEATURES:
+        logger.warning('no features are registered')
+        if not keep_columns:
+            return
+    store = FeatureStore(output_dir)
+    if not append:
+        store.clear()
+
+    names = list(names) or None
+    timings = {}
+    n_rows = 0
+    start = time.time()
+    for filepath in input_filepaths:
+        try:
+            n_rows += build_features(filepath, store, block_size=block_size,
+                                     names=names, timings=timings,
+                                     keep_columns=keep_columns)
+        except (TypeError, ValueError) as err:
+            raise click.ClickException(str(err))
+    seconds = time.time() - start
+
+    ## Timing of each feature, slowest first, logged with `throughput` so
+    ## the lines are not rate-limited
+    for name, feature_seconds in sorted(timings.items(),
+                                        key=lambda item: -item[1]):
+        logger.info('%-30s %10.3fs%s', name, feature_seconds,
+                    '' if FEATURES[name].keep else '  (intermediate)',
+                    extra=throughput('build_features.' + name,
+                                     seconds=feature_seconds))
+    logger.info('built features of %d files (%d rows) in %.2fs',
+                len(input_filepaths), n_rows, seconds)
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    # find .env automagically by walking up directories until it's found, then
+    # load up the .env entries as environment variables
+    load_dotenv(find_dotenv())
+
+    main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+""" Registry of vectorized features.
+
+    A feature is a function over whole columns (NumPy arrays or
+    `pandas.Series`) that returns a new column. Its arguments name the
+    columns, or the other features, it is computed from, so the features
+    needed to build a set of outputs are found and ordered automatically:
+
+        from src.features.registry import register_feature
+
+        @register_feature(keep=False)
+        def g_r(g, r):
+            return g - r
+
+        @register_feature
+        def g_r_squared(g_r):
+            return g_r ** 2
+
+    Features registered with `keep=False` are intermediate columns: they are
+    computed once, shared by every feature that uses them and dropped from
+    the output.
+"""
+import time
+import inspect
+import functools
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+# Declaration of a feature
+Feature = namedtuple('Feature', ['name', 'func', 'inputs', 'keep'])
+
+# Registered features, by name
+FEATURES = OrderedDict()
+
+
+def register_feature(func=None, name=None, inputs=None, keep=True):
+    """ Registers `func` as a feature.
+
+        Parameters
+        ----------
+        func : callable
+            Function over whole columns that returns the feature column.
+
+        name : str, optional
+            Name of the feature. Defaults to the name of `func`.
+
+        inputs : list of str, optional
+            Columns, or features, passed to `func`, in order. Defaults to
+            the names of the arguments of `func`.
+
+        keep : bool, optional
+            Whether the feature is part of the output, or only an
+            intermediate column used by other features.
+    """
+    if func is None:
+        return functools.partial(register_feature, name=name, inputs=inputs,
+                                 keep=keep)
+    name = func.__name__ if name is None else name
+    if inputs is None:
+        inputs = list(inspect.signature(func).parameters)
+    if name in FEATURES:
+        raise ValueError('feature `{0}` is already registered!'.format(name))
+    FEATURES[name] = Feature(name, func, tuple(inputs), keep)
+    return func
+
+
+def resolve(columns, names=None, features=None):
+    """ Features to compute, in an order where every feature comes after
+        the features it depends on.
+
+        Parameters
+        ----------
+        columns : list of str
+            Columns available in the data set.
+
+        names : list of str, optional
+            Features to build. Defaults to every feature with `keep=True`.
+
+        features : dict, optional
+            Feature declarations. Defaults to the registered features.
+
+        Returns
+        -------
+        plan : list of `Feature`
+            Features to compute, including the intermediate ones.
+    """
+    features = FEATURES if features is None else features
+    if names is None:
+        names = [name for name, feature in features.items() if feature.keep]
+    columns = set(columns)
+    plan = []
+    done = set()
+    visiting = []
+
+    def visit(name, parent):
+        if name in done or (name in columns and name not in features):
+            return
+        if name not in features:
+            msg = '`{0}`: unknown column or feature `{1}`!'.format(parent,
+                                                                 name)
+            raise ValueError(msg)
+        if name in visiting:
+            cycle = visiting[visiting.index(name):] + [name]
+            raise ValueError('circular features: {0}'.format(
+                ' -> '.join(cycle)))
+        visiting.append(name)
+        for input_name in features[name].inputs:
+            visit(input_name, name)
+        visiting.pop()
+        done.add(name)
+        plan.append(features[name])
+
+    for name in names:
+        visit(name, name)
+
+    return plan
+
+
+def _last_uses(plan):
+    """ Index of the last step of `plan` that uses each column.
+    """
+    last_uses = {}
+    for idx, feature in enumerate(plan):
+        for input_name in feature.inputs:
+            last_uses[input_name] = idx
+    return last_uses
+
+
+def compute_features(df, names=None, features=None, timings=None):
+    """ Computes features over the whole columns of `df`.
+
+        Every feature, including intermediate ones, is computed exactly once
+        and intermediate columns are released as soon as the last feature
+        that uses them is computed.
+
+        Parameters
+        ----------
+        df : `pandas.DataFrame`
+            Data set, or a block of rows of it.
+
+        names : list of str, optional
+            Features to build. Defaults to every feature with `keep=True`.
+
+        features : dict, optional
+            Feature declarations. Defaults to the registered features.
+
+        timings : dict, optional
+            Seconds spent on each feature are added to this dictionary.
+
+        Returns
+        -------
+        features_df : `pandas.DataFrame`
+            Requested features, with the index of `df`.
+    """
+    plan = resolve(df.columns, names=names, features=features)
+    if names is None:
+        names = [feature.name for feature in plan if feature.keep]
+    last_uses = _last_uses(plan)
+    computed = {}
+    output = OrderedDict()
+    for idx, feature in enumerate(plan):
+        args = [computed[input_name] if input_name in computed
+                else df[input_name] for input_name in feature.inputs]
+        start = time.perf_counter()
+        values = feature.func(*args)
+        if timings is not None:
+            timings[feature.name] = timings.get(feature.name, 0.) + \
+                time.perf_counter() - start
+        computed[feature.name] = values
+        for input_name in feature.inputs:
+            if last_uses[input_name] == idx and input_name not in names:
+                computed.pop(input_name, None)
+    for name in names:
+        output[name] = computed[name] if name in computed else df[name]
+
+    return pd.DataFrame(output, index=df.index)
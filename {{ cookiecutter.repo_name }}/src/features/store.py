@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+""" Memory-mapped store of feature columns.
+
+    Every column of the store is a `.npy` file, and `meta.json` keeps the
+    number of rows and the name, type and shape of each column:
+
+        data/processed/features/
+        ├── meta.json
+        ├── g_r.npy
+        └── g_r_squared.npy
+
+    New rows are appended to the end of the column files without rewriting
+    the existing ones, and columns are read as memory-mapped arrays, so
+    ranges of rows are views of the files and only the rows that are used
+    are read from disk:
+
+        from src.features.store import FeatureStore
+
+        store = FeatureStore('data/processed/features')
+        store.append(features_df)
+        cols = store.read(columns=['g_r'], rows=(1000, 2000))
+        sample = store.take([5, 17, 42])
+
+    The column files are regular `.npy` files and can also be opened with
+    `numpy.load(filepath, mmap_mode='r')`.
+"""
+import os
+import json
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Default location of the store
+STORE_DIR = os.path.join(PROJECT_DIR, 'data', 'processed', 'features')
+# Name of the metadata file
+META_FILE = 'meta.json'
+# Largest number of rows of a column, used to size the `.npy` headers
+MAX_ROWS = 2 ** 63 - 1
+
+
+def _write_atomic(filepath, data):
+    fd, tmp_filepath = tempfile.mkstemp(dir=os.path.dirname(filepath))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_filepath, filepath)
+
+
+def _npy_header(dtype, shape, size=None):
+    """ Header of a `.npy` file (format 1.0), padded with spaces to `size`
+        bytes, or to a multiple of 64 bytes that fits any number of rows.
+    """
+    if size is None:
+        size = len(_npy_header(dtype, (MAX_ROWS,) + tuple(shape[1:]), 0))
+        size = 64 * int(np.ceil(size / 64.))
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype),
+                   'fortran_order': False,
+                   'shape': tuple(shape)}).encode('latin1')
+    prefix_size = len(np.lib.format.magic(1, 0)) + 2
+    n_pad = max(size - prefix_size - len(header) - 1, 0)
+    header += b' ' * n_pad + b'\n'
+    return (np.lib.format.magic(1, 0) +
+            np.array(len(header), dtype='<u2').tobytes() + header)
+
+
+def _kind_group(dtype):
+    """ Types whose values can be promoted to one another: numbers (and
+        booleans), strings, or any other kind on its own.
+    """
+    for group in ['biufc', 'SU']:
+        if dtype.kind in group:
+            return group
+    return dtype.kind
+
+
+def _to_array(column, values):
+    """ Array of the values of `column`. Object arrays of strings are
+        converted to fixed-width strings.
+    """
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    values = np.asarray(values)
+    if values.dtype.kind == 'O' and values.ndim == 1 and \
+            all(isinstance(value, str) for value in values):
+        values = values.astype(str)
+    if values.dtype.kind in 'OV':
+        msg = '`{0}`: object columns cannot be memory-mapped, '.format(column)
+        msg += 'convert them to a numeric or fixed-width type!'
+        raise TypeError(msg)
+    return values
+
+
+def _check_name(name):
+    if not name or name.startswith('.') or os.sep in name or \
+            name == os.path.splitext(META_FILE)[0]:
+        raise ValueError('invalid column name `{0}`!'.format(name))
+    return name
+
+
+class FeatureStore(object):
+    """ Memory-mapped store of feature columns in `path`.
+
+        Parameters
+        ----------
+        path : str, optional
+            Directory of the store. Defaults to `data/processed/features`.
+    """
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        self._meta = None
+        self._arrays = {}
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            meta_path = os.path.join(self.path, META_FILE)
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    self._meta = json.load(f,
+                                           object_pairs_hook=OrderedDict)
+            else:
+                self._meta = OrderedDict([('n_rows', 0),
+                                          ('columns', OrderedDict())])
+        return self._meta
+
+    @property
+    def columns(self):
+        return list(self.meta['columns'])
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def __contains__(self, column):
+        return column in self.meta['columns']
+
+    def __getitem__(self, column):
+        return self.column(column)
+
+    def clear(self):
+        """ Removes every column of the store.
+        """
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        self._meta = None
+        self._arrays = {}
+
+    def _column_path(self, column):
+        return os.path.join(self.path, column + '.npy')
+
+    def _column_dtype(self, column):
+        return np.dtype(self.meta['columns'][column]['dtype'])
+
+    def _to_arrays(self, data):
+        """ Converts a `pandas.DataFrame` or a dictionary of columns into
+            contiguous arrays with the types of the columns of the store, or
+            with the types the columns must be promoted to.
+        """
+        arrays = OrderedDict()
+        for column in data:
+            values = _to_array(column, data[column])
+            if column in self.meta['columns']:
+                dtype = self._column_dtype(column)
+                ## e.g. floats with NaN for an integer column, or longer
+                ## strings than those of the first rows
+                if not np.can_cast(values.dtype, dtype, 'safe'):
+                    if _kind_group(values.dtype) != _kind_group(dtype):
+                        msg = '`{0}`: cannot store {1} values in a column ' \
+                              'of {2}!'
+                        raise ValueError(msg.format(column, values.dtype,
+                                                    dtype))
+                    dtype = np.promote_types(dtype, values.dtype)
+                values = values.astype(dtype, copy=False)
+                shape = self.meta['columns'][column]['shape']
+                if list(values.shape[1:]) != shape:
+                    msg = '`{0}`: rows of shape {1} instead of {2}!'.format(
+                        column, values.shape[1:], tuple(shape))
+                    raise ValueError(msg)
+            arrays[_check_name(str(column))] = np.ascontiguousarray(values)
+        n_rows = set(len(values) for values in arrays.values())
+        if len(n_rows) > 1:
+            raise ValueError('columns with different numbers of rows!')
+        if self.meta['columns'] and \
+                set(arrays) != set(self.meta['columns']):
+            msg = 'columns {0} instead of {1}!'.format(sorted(arrays),
+                                                       sorted(self.columns))
+            raise ValueError(msg)
+        return arrays
+
+    def _promote(self, column, dtype):
+        """ Rewrites the rows of `column` with the type `dtype`.
+        """
+        values = np.array(self.column(column), dtype=dtype)
+        self._arrays = {}
+        filepath = self._column_path(column)
+        _write_atomic(filepath, _npy_header(dtype, values.shape) +
+                      values.tobytes())
+        self.meta['columns'][column]['dtype'] = np.dtype(dtype).str
+        self._write_meta()
+
+    def _write_meta(self):
+        _write_atomic(os.path.join(self.path, META_FILE),
+                      json.dumps(self.meta, indent=2).encode('utf-8'))
+
+    def append(self, data):
+        """ Appends rows to the store.
+
+            The first call defines the columns, their types and shapes.
+            Later calls must provide the same columns, with values of the
+            same kind (numbers or strings). Columns whose type cannot hold
+            the new values without loss (e.g. floats or NaN in an integer
+            column, or longer strings) are promoted to a type that holds
+            both, which rewrites their rows once; otherwise, only the new
+            rows are written and the existing ones are not read or
+            rewritten.
+
+            Parameters
+            ----------
+            data : `pandas.DataFrame` or dict
+                Rows to append, by column.
+
+            Returns
+            -------
+            n_rows : int
+                Number of rows of the store.
+        """
+        arrays = self._to_arrays(data)
+        if not arrays:
+            return len(self)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        meta = self.meta
+        if not meta['columns']:
+            for column, values in arrays.items():
+                meta['columns'][column] = OrderedDict([
+                    ('dtype', values.dtype.str),
+                    ('shape', list(values.shape[1:]))])
+        for column, values in arrays.items():
+            if values.dtype != self._column_dtype(column):
+                self._promote(column, values.dtype)
+        n_rows = meta['n_rows']
+        n_new = len(next(iter(arrays.values())))
+        for column, values in arrays.items():
+            filepath = self._column_path(column)
+            header = _npy_header(values.dtype,
+                                 (n_rows + n_new,) + values.shape[1:])
+            row_nbytes = values.dtype.itemsize * int(np.prod(values.shape[1:]))
+            mode = 'r+b' if os.path.exists(filepath) else 'w+b'
+            with open(filepath, mode) as f:
+                ## Rows beyond `n_rows` are left-overs of a failed append
+                f.seek(len(header) + n_rows * row_nbytes)
+                f.truncate()
+                f.write(values.data if values.size else b'')
+                f.seek(0)
+                f.write(header)
+        ## The new rows only become visible once the metadata is updated
+        meta['n_rows'] = n_rows + n_new
+        self._write_meta()
+        self._arrays = {}
+
+        return meta['n_rows']
+
+    def column(self, column):
+        """ Memory-mapped array with every row of `column`.
+        """
+        if column not in self.meta['columns']:
+            raise KeyError('unknown column `{0}`!'.format(column))
+        if column not in self._arrays:
+            dtype = self._column_dtype(column)
+            shape = (len(self),) + tuple(self.meta['columns'][column]['shape'])
+            if len(self) == 0:
+                self._arrays[column] = np.empty(shape, dtype=dtype)
+            else:
+                header = _npy_header(dtype, shape)
+                self._arrays[column] = np.memmap(
+                    self._column_path(column), dtype=dtype, mode='r',
+                    offset=len(header), shape=shape)
+        return self._arrays[column]
+
+    def read(self, columns=None, rows=None):
+        """ Reads a range of rows of some columns, without copying them.
+
+            Parameters
+            ----------
+            columns : list of str, optional
+                Columns to read. All of them by default.
+
+            rows : tuple or slice, optional
+                Range of rows to read, e.g. `(1000, 2000)`. All of them by
+                default.
+
+            Returns
+            -------
+            arrays : `collections.OrderedDict`
+                Memory-mapped view of each column.
+        """
+        columns = self.columns if columns is None else columns
+        if rows is None:
+            rows = slice(None)
+        elif not isinstance(rows, slice):
+            rows = slice(*rows)
+        return OrderedDict((column, self.column(column)[rows])
+                           for column in columns)
+
+    def take(self, indices, columns=None):
+        """ Reads the rows `indices` of some columns. Only the pages of the
+            files that hold these rows are read.
+        """
+        columns = self.columns if columns is None else columns
+        indices = np.asarray(indices)
+        return OrderedDict((column, np.asarray(self.column(column)[indices]))
+                           for column in columns)
+
+    def iter_blocks(self, block_size, columns=None):
+        """ Iterates over the store `block_size` rows at a time, yielding
+            the memory-mapped views returned by `read`.
+        """
+        for start in range(0, len(self), block_size):
+            yield self.read(columns=columns, rows=(start, start + block_size))
+
+    def to_frame(self, columns=None, rows=None):
+        """ Reads some rows and columns as a `pandas.DataFrame` (a copy).
+        """
+        arrays = self.read(columns=columns, rows=rows)
+        return pd.DataFrame(OrderedDict((column, values)
+                                        for column, values in arrays.items()
+                                        if values.ndim == 1))
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+""" Saving and lazy, memory-mapped loading of the models in `models/`.
+
+    Models are saved with `joblib`, uncompressed, so that the NumPy arrays
+    they hold (coefficients, trees, embeddings, ...) are memory-mapped when
+    they are loaded instead of being read into memory: loading a large model
+    only reads its small Python objects, and the pages of its arrays are
+    read from disk when they are used, and shared by every process using
+    the same model.
+
+    `ModelCache` keeps the most recently used models loaded, within a number
+    of models and of bytes:
+
+        from src.models.loader import ModelCache, save_model
+
+        save_model(model, 'models/catl_rf.joblib')
+
+        cache = ModelCache(max_models=8, max_bytes=2 * 1024 ** 3)
+        model = cache.get('models/catl_rf.joblib')
+        cache.stats()
+
+    Plain pickle files are loaded too, but without memory-mapping.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Directory of the models
+MODELS_DIR = os.path.join(PROJECT_DIR, 'models')
+
+
+def _import_joblib():
+    try:
+        import joblib
+    except ImportError:
+        msg = '`joblib` is needed to save and load models. '
+        msg += 'Please install it beforehand!'
+        raise ImportError(msg)
+    return joblib
+
+
+def save_model(model, model_filepath):
+    """ Saves `model` to `model_filepath`, uncompressed so that its arrays
+        can be memory-mapped by `load_model`.
+
+        The file is written to `<model_filepath>.part` and renamed once
+        complete, so processes that mapped the previous version keep using
+        it safely.
+    """
+    joblib = _import_joblib()
+    dirname = os.path.dirname(os.path.abspath(model_filepath))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    part_filepath = model_filepath + '.part'
+    try:
+        joblib.dump(model, part_filepath, compress=0)
+    except BaseException:
+        if os.path.exists(part_filepath):
+            os.remove(part_filepath)
+        raise
+    os.replace(part_filepath, model_filepath)
+
+
+def load_model(model_filepath, mmap_mode='r'):
+    """ Loads the model in `model_filepath`.
+
+        Parameters
+        ----------
+        model_filepath : str
+            Path to a model saved with `save_model` (or pickled).
+
+        mmap_mode : {'r', 'c', None}, optional
+            Memory-map the arrays of the model read-only ('r'), copy-on-write
+            ('c'), or read them into memory (None).
+
+        Returns
+        -------
+        model : object
+            The model.
+    """
+    joblib = _import_joblib()
+    return joblib.load(model_filepath, mmap_mode=mmap_mode)
+
+
+class ModelCache(object):
+    """ Least recently used models, loaded with `load_model`.
+
+        Models are evicted, least recently used first, when more than
+        `max_models` models or more than `max_bytes` bytes (the size of
+        their files) are loaded. A model whose file changed is loaded again.
+
+        Parameters
+        ----------
+        max_models : int, optional
+            Largest number of loaded models.
+
+        max_bytes : int, optional
+            Largest total size of the files of the loaded models.
+
+        mmap_mode : {'r', 'c', None}, optional
+            Passed to `load_model`.
+
+        models_dir : str, optional
+            Directory of the models whose paths are relative.
+    """
+    def __init__(self, max_models=16, max_bytes=4 * 1024 ** 3, mmap_mode='r',
+                 models_dir=MODELS_DIR):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.mmap_mode = mmap_mode
+        self.models_dir = models_dir
+        self._models = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, model_filepath):
+        return os.path.abspath(os.path.join(self.models_dir, model_filepath))
+
+    def __contains__(self, model_filepath):
+        return self._path(model_filepath) in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    @property
+    def nbytes(self):
+        return sum(entry[1] for entry in self._models.values())
+
+    def get(self, model_filepath):
+        """ The model in `model_filepath`, loaded if it is not cached.
+        """
+        path = self._path(model_filepath)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._models.get(path)
+            if entry is not None and entry[0] == stat.st_mtime_ns:
+                self._models.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            model = load_model(path, mmap_mode=self.mmap_mode)
+            self._models[path] = (stat.st_mtime_ns, stat.st_size, model)
+            self._models.move_to_end(path)
+            self._evict(keep=path)
+            return model
+
+    def _evict(self, keep):
+        while len(self._models) > 1 and (
+                len(self._models) > self.max_models or
+                self.nbytes > self.max_bytes):
+            path = next(iter(self._models))
+            if path == keep:
+                break
+            del self._models[path]
+            self.evictions += 1
+
+    def evict(self, model_filepath):
+        """ Removes a model from the cache.
+        """
+        with self._lock:
+            self._models.pop(self._path(model_filepath), None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        """ Hits, misses, evictions, and number and size of the cached
+            models.
+        """
+        with self._lock:
+            n_requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / float(max(n_requests, 1)),
+                    'evictions': self.evictions,
+                    'models': len(self._models),
+                    'bytes': self.nbytes}
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+""" Predictions of a trained model, in batch or from a local HTTP service.
+
+        $ python -m src.models.predict_model batch models/model.joblib \\
+            data/processed/features models/predictions.csv
+        $ python -m src.models.predict_model serve models/model.joblib \\
+            --port 8000
+
+    The service loads the model once, memory-mapping its arrays (see
+    `src.models.loader`), and gathers the rows of concurrent
+    requests into micro-batches (of up to `--max-batch-size` rows, waiting at
+    most `--max-wait-ms` for more requests) that are predicted in a single
+    vectorized call:
+
+        POST /predict   {"instances": [[0.1, 2.3], [0.5, 1.2]]}
+                        -> {"predictions": [1.7, 0.9]}
+        GET  /stats     latency percentiles and throughput counters
+        GET  /health
+"""
+import os
+import json
+import time
+import click
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from queue import Empty, Queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import find_dotenv, load_dotenv
+
+import numpy as np
+
+from src.features.store import FeatureStore
+from src.models.loader import load_model
+from src.utils.logs import flush_on_error, setup_logging
+from src.utils.profiling import profiled
+
+logger = logging.getLogger(__name__)
+
+
+def predict_store(model, store, output_filepath, features=None,
+                  target='target', block_size=100000):
+    """ Predicts every row of the feature store `store`, `block_size` rows
+        at a time, and writes the predictions to `output_filepath` (CSV).
+
+        Returns the number of predictions.
+    """
+    if features is None:
+        features = [column for column in store.columns if column != target]
+    part_filepath = output_filepath + '.part'
+    n_rows = 0
+    try:
+        with open(part_filepath, 'w') as f:
+            f.write('prediction\n')
+            for cols in store.iter_blocks(block_size, columns=features):
+                X = np.column_stack([cols[column] for column in features])
+                np.savetxt(f, model.predict(X), fmt='%.10g')
+                n_rows += len(X)
+    except BaseException:
+        ## The error of the predictions is the one reported
+        if os.path.exists(part_filepath):
+            os.remove(part_filepath)
+        raise
+    os.replace(part_filepath, output_filepath)
+
+    return n_rows
+
+
+class ServiceStats(object):
+    """ Latency and throughput counters of the prediction service.
+
+        Parameters
+        ----------
+        window : int, optional
+            Number of latest requests the latency percentiles are computed
+            from.
+    """
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.batches = 0
+
+    def record_request(self, seconds, n_rows, error=False):
+        with self._lock:
+            self._latencies.append(seconds)
+            self.requests += 1
+            self.rows += n_rows
+            self.errors += int(error)
+
+    def record_batch(self):
+        with self._lock:
+            self.batches += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.
+            uptime = time.time() - self.started
+            summary = {'uptime_s': uptime,
+                       'requests': self.requests,
+                       'errors': self.errors,
+                       'rows': self.rows,
+                       'batches': self.batches,
+                       'mean_batch_rows': self.rows / max(self.batches, 1),
+                       'requests_per_s': self.requests / uptime,
+                       'rows_per_s': self.rows / uptime}
+        for pct in [50, 90, 99]:
+            summary['latency_p{0}_ms'.format(pct)] = float(
+                np.percentile(latencies, pct)) if len(latencies) else None
+
+        return summary
+
+
+class MicroBatcher(object):
+    """ Gathers the rows of concurrent requests into batches predicted by
+        `model` in a single call, on a background thread.
+
+        Parameters
+        ----------
+        model : estimator
+            Model with a vectorized `predict` method.
+
+        max_batch_size : int, optional
+            Largest number of rows of a batch.
+
+        max_wait : float, optional
+            Longest time, in seconds, the first request of a batch waits for
+            other requests.
+
+        stats : `ServiceStats`, optional
+            Counters updated with every batch.
+    """
+    def __init__(self, model, max_batch_size=256, max_wait=0.005,
+                 stats=None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = stats
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, X):
+        """ Queues the rows `X`, returning a `Future` of their predictions.
+        """
+        future = Future()
+        self._queue.put((np.asarray(X, dtype=float), future))
+        return future
+
+    def predict(self, X, timeout=None):
+        return self.submit(X).result(timeout)
+
+    def _collect(self):
+        """ Waits for a request, then for more requests until the batch is
+            full or `max_wait` elapsed.
+        """
+        pending = [self._queue.get()]
+        n_rows = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            pending.append(item)
+            n_rows += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            try:
+                X = np.concatenate([rows for rows, _ in pending])
+                predictions = np.asarray(self.model.predict(X))
+            except Exception:
+                ## One bad request must not fail the others of its batch
+                for rows, future in pending:
+                    try:
+                        future.set_result(np.asarray(self.model.predict(rows)))
+                    except Exception as err:
+                        future.set_exception(err)
+                continue
+            if self.stats is not None:
+                self.stats.record_batch()
+            start = 0
+            for rows, future in pending:
+                future.set_result(predictions[start:start + len(rows)])
+                start += len(rows)
+
+
+def _json_values(predictions):
+    """ Predictions as JSON values, with `null` for NaN and infinities,
+        which JSON does not have.
+    """
+    if predictions.dtype.kind != 'f':
+        return predictions.tolist()
+    values = predictions.astype(object)
+    values[~np.isfinite(predictions)] = None
+    return values.tolist()
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """ HTTP handler of the prediction service.
+    """
+    protocol_version = 'HTTP/1.1'
+    ## Headers and body are sent separately: without this, Nagle's algorithm
+    ## and delayed ACKs add ~40 ms to every keep-alive request
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.stats.summary())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': 'not found'})
+            return
+        start = time.perf_counter()
+        n_rows = 0
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            instances = json.loads(self.rfile.read(length))['instances']
+            X = np.atleast_2d(np.asarray(instances, dtype=float))
+            n_rows = len(X)
+            predictions = self.server.batcher.predict(X)
+        except (KeyError, TypeError, ValueError) as err:
+            self.server.stats.record_request(time.perf_counter() - start,
+                                             n_rows, error=True)
+            self._send_json(400, {'error': '{0}: {1}'.format(
+                type(err).__name__, err)})
+            return
+        except Exception as err:
+            self.server.stats.record_request(time.perf_counter() - start,
+                                             n_rows, error=True)
+            self._send_json(500, {'error': '{0}: {1}'.format(
+                type(err).__name__, err)})
+            return
+        ## Counted before the response, so that the client sees it in /stats
+        self.server.stats.record_request(time.perf_counter() - start, n_rows)
+        self._send_json(200, {'predictions': _json_values(predictions)})
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """ Threaded HTTP server of the prediction service.
+    """
+    daemon_threads = True
+    ## Many clients may connect at once
+    request_queue_size = 128
+
+
+def make_server(model, host='127.0.0.1', port=8000, max_batch_size=256,
+                max_wait=0.005):
+    """ Prediction service of `model`, listening on `host:port`.
+
+        Call `serve_forever` on the returned server to start it; port 0
+        picks a free port, available as `server.server_address[1]`.
+    """
+    server = PredictionServer((host, port), PredictionHandler)
+    server.stats = ServiceStats()
+    server.batcher = MicroBatcher(model, max_batch_size=max_batch_size,
+                                  max_wait=max_wait, stats=server.stats)
+    return server
+
+
+@click.group()
+def main():
+    """ Makes predictions with a trained model.
+    """
+
+
+@main.command()
+@click.argument('model_filepath', type=click.Path(exists=True))
+@click.argument('features_dir', type=click.Path(exists=True))
+@click.argument('output_filepath', type=click.Path())
+@click.option('--target', default='target', show_default=True,
+              help='Column of the feature store that is not a feature.')
+@click.option('--feature', 'features', multiple=True,
+              help='Column used as a feature (repeatable). Every column but '
+                   'the target by default.')
+@click.option('--block-size', type=click.IntRange(min=1), default=100000,
+              show_default=True, help='Number of rows predicted at a time.')
+@flush_on_error
+@profiled('predict_model')
+def batch(model_filepath, features_dir, output_filepath, target, features,
+          block_size):
+    """ Uses the model in MODEL_FILEPATH to make predictions for the
+        features in FEATURES_DIR, saved in OUTPUT_FILEPATH.
+    """
+    logger.info('making predictions')
+
+    store = FeatureStore(features_dir)
+    logger.info('%d rows and %d features in %s', len(store),
+                len(store.columns), features_dir)
+    n_rows = predict_store(load_model(model_filepath), store, output_filepath,
+                           features=list(features) or None, target=target,
+                           block_size=block_size)
+    logger.info('wrote %d predictions to %s', n_rows, output_filepath)
+
+
+@main.command()
+@click.argument('model_filepath', type=click.Path(exists=True))
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=8000, show_default=True)
+@click.option('--max-batch-size', type=click.IntRange(min=1), default=256,
+              show_default=True, help='Largest number of rows of a batch.')
+@click.option('--max-wait-ms', type=click.FloatRange(min=0), default=5.,
+              show_default=True,
+              help='Longest wait for more requests to fill a batch.')
+@flush_on_error
+def serve(model_filepath, host, port, max_batch_size, max_wait_ms):
+    """ Serves the predictions of the model in MODEL_FILEPATH over HTTP.
+    """
+    server = make_server(load_model(model_filepath), host=host, port=port,
+                         max_batch_size=max_batch_size,
+                         max_wait=max_wait_ms / 1000.)
+    logger.info('serving %s on http://%s:%d', model_filepath,
+                *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info('stats: %s', json.dumps(server.stats.summary()))
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    # find .env automagically by walking up directories until it's found, then
+    # load up the .env entries as environment variables
+    load_dotenv(find_dotenv())
+
+    main()
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+""" Parallel hyperparameter sweeps with cached trials and successive halving.
+
+    The objective is a function of the parameters of a trial and of its
+    budget (e.g. the number of epochs), that returns the score of the trial:
+
+        def objective(params, budget):
+            model = SGDRegressor(alpha=params['alpha'])
+            ...
+            return validation_loss
+
+    Trials are run on a pool of processes. With successive halving, every
+    trial first runs with `min_budget`, and only the best `1 / eta` of them
+    are run again with `eta` times more budget, up to `max_budget`, so
+    hopeless trials are stopped early.
+
+    The result of every trial is stored in the `trials` table of
+    `reports/sweeps.sqlite`, under a key made of the objective, the
+    parameters, the budget and the fingerprint of the data, so a sweep that
+    is run again (e.g. after being interrupted) skips the finished trials.
+    Every run is a new sweep, with a name of its own, and the `sweep_trials`
+    table maps its trials and rungs to the keys of their results, which are
+    shared by every sweep that runs them:
+
+        $ python -m src.models.sweep run src.models.objectives:sgd \\
+            --space space.json --search random --n-trials 200 \\
+            --min-budget 1 --max-budget 27 --data data/processed/features
+        $ python -m src.models.sweep show --top 10
+        $ sqlite3 reports/sweeps.sqlite \\
+            'SELECT * FROM sweep_trials JOIN trials USING (key)'
+
+    The search space maps every parameter to a list of values, or, for
+    random searches, to a range `{"low": 1e-5, "high": 1e-1, "log": true}`.
+"""
+import os
+import json
+import math
+import time
+import uuid
+import click
+import sqlite3
+import hashlib
+import logging
+import itertools
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.utils.cache import file_fingerprint
+from src.utils.lazy import lazy_import
+from src.utils.logs import executor_kwargs, flush_on_error, setup_logging
+
+## Imported on first use, so that `--help` and `show` do not wait for NumPy
+np = lazy_import('numpy')
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Database with the results of the trials
+RESULTS_DB = os.path.join(PROJECT_DIR, 'reports', 'sweeps.sqlite')
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    key TEXT PRIMARY KEY,
+    objective TEXT NOT NULL,
+    params TEXT NOT NULL,
+    budget REAL NOT NULL,
+    score REAL,
+    status TEXT NOT NULL,
+    error TEXT,
+    seconds REAL,
+    data_fingerprint TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    sweep TEXT PRIMARY KEY,
+    objective TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sweep_trials (
+    sweep TEXT NOT NULL REFERENCES sweeps (sweep),
+    trial INTEGER NOT NULL,
+    rung INTEGER NOT NULL,
+    key TEXT NOT NULL REFERENCES trials (key),
+    PRIMARY KEY (sweep, trial, rung)
+);
+"""
+
+
+def grid_search(space):
+    """ Every combination of the values of `space`, a dictionary of lists.
+    """
+    names = sorted(space)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[space[name] for name in names])]
+
+
+def _sample(spec, rng):
+    if isinstance(spec, dict):
+        low, high = spec['low'], spec['high']
+        if spec.get('log', False):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        if spec.get('integer', False):
+            value = int(round(value))
+        return value
+    return spec[rng.randint(len(spec))]
+
+
+def random_search(space, n_trials, seed=0):
+    """ `n_trials` random combinations of the values of `space`.
+
+        Each parameter is a list of values, sampled uniformly, or a range
+        `{'low', 'high', 'log', 'integer'}`.
+    """
+    rng = np.random.RandomState(seed)
+    names = sorted(space)
+    return [dict((name, _sample(space[name], rng)) for name in names)
+            for _ in range(n_trials)]
+
+
+def budgets(min_budget, max_budget, eta=3):
+    """ Budgets of the rungs of successive halving: `min_budget`, then `eta`
+        times more at each rung, and `max_budget` for the last one.
+    """
+    if min_budget >= max_budget:
+        return [max_budget]
+    n_rungs = int(math.floor(math.log(max_budget / float(min_budget), eta) +
+                             1e-9)) + 1
+    rung_budgets = [min_budget * eta ** rung for rung in range(n_rungs)]
+    ## e.g. 1, 3, 9 and then 10, rather than stopping at 9
+    if rung_budgets[-1] < max_budget:
+        if max_budget / float(rung_budgets[-1]) < math.sqrt(eta):
+            rung_budgets[-1] = max_budget
+        else:
+            rung_budgets.append(max_budget)
+    return rung_budgets
+
+
+def _objective_name(objective):
+    if isinstance(objective, str):
+        return objective
+    return '{0}:{1}'.format(objective.__module__, objective.__qualname__)
+
+
+def load_objective(name):
+    """ Function `module:function`.
+    """
+    module_name, _, func_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def trial_key(objective_name, params, budget, data_fingerprint=None):
+    """ Key of the result of a trial.
+    """
+    sha = hashlib.sha256()
+    sha.update(objective_name.encode('utf-8'))
+    sha.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    sha.update(repr(float(budget)).encode('utf-8'))
+    sha.update((data_fingerprint or '').encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _run_trial(task):
+    """ Runs one trial, catching its errors so one bad trial does not stop
+        the sweep.
+    """
+    objective_name, params, budget = task
+    start = time.time()
+    try:
+        score = float(load_objective(objective_name)(params, budget))
+        error = None
+    except Exception as err:
+        score = None
+        error = '{0}: {1}'.format(type(err).__name__, err)
+
+    return score, error, time.time() - start
+
+
+def connect(db_filepath=RESULTS_DB):
+    """ Connection to the results database, creating it if needed.
+    """
+    dirname = os.path.dirname(os.path.abspath(db_filepath))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    conn = sqlite3.connect(db_filepath)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def sweep_name():
+    """ New name of a sweep, from the current time.
+    """
+    return 'sweep-{0}-{1}'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                  uuid.uuid4().hex[:6])
+
+
+def _add_sweep(conn, name, objective_name):
+    try:
+        with conn:
+            conn.execute('INSERT INTO sweeps (sweep, objective, created) '
+                         'VALUES (?, ?, ?)', (name, objective_name,
+                                              time.time()))
+    except sqlite3.IntegrityError:
+        raise ValueError('sweep `{0}` already exists!'.format(name))
+
+
+def _add_sweep_trial(conn, name, trial, rung, key):
+    with conn:
+        conn.execute('INSERT INTO sweep_trials (sweep, trial, rung, key) '
+                     'VALUES (?, ?, ?, ?)', (name, trial, rung, key))
+
+
+def run_sweep(objective, trials, name=None, min_budget=1, max_budget=1,
+              eta=3, mode='min', jobs=None, data=None,
+              db_filepath=RESULTS_DB):
+    """ Runs a sweep over `trials` with successive halving.
+
+        Parameters
+        ----------
+        objective : callable or str
+            Module-level function `objective(params, budget)` returning the
+            score of a trial, or its name `module:function`.
+
+        trials : list of dict
+            Parameters of each trial, e.g. from `grid_search` or
+            `random_search`.
+
+        name : str, optional
+            Name of the sweep, which must not be used by another sweep of
+            the database. Defaults to a new name from `sweep_name`.
+
+        min_budget, max_budget : float, optional
+            Budget of the first and last rungs. Every trial runs with
+            `min_budget`; the best `1 / eta` of each rung run again with
+            `eta` times more budget.
+
+        eta : int, optional
+            Reduction factor of successive halving.
+
+        mode : {'min', 'max'}, optional
+            Whether lower or higher scores are better.
+
+        jobs : int, optional
+            Number of processes. Defaults to the number of cores.
+
+        data : str, optional
+            File or directory the objective reads. Its fingerprint is part
+            of the key of the results, so trials are run again when the data
+            changes.
+
+        db_filepath : str, optional
+            Results database. Defaults to `reports/sweeps.sqlite`.
+
+        Returns
+        -------
+        results : list of dict
+            Result of the last rung of every trial, best first, with the
+            `sweep`, `trial` and `rung` it belongs to in this sweep.
+    """
+    objective_name = _objective_name(objective)
+    name = sweep_name() if name is None else name
+    data_fingerprint = None if data is None else file_fingerprint(data)
+    sign = 1. if mode == 'min' else -1.
+    conn = connect(db_filepath)
+    alive = list(range(len(trials)))
+    latest = {}
+    try:
+        _add_sweep(conn, name, objective_name)
+        logger.info('sweep %s', name)
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 **executor_kwargs()) as pool:
+            rung_budgets = budgets(min_budget, max_budget, eta)
+            for rung, budget in enumerate(rung_budgets):
+                scores = {}
+                futures = {}
+                for trial in alive:
+                    key = trial_key(objective_name, trials[trial], budget,
+                                    data_fingerprint)
+                    row = conn.execute(
+                        'SELECT * FROM trials WHERE key = ?',
+                        (key,)).fetchone()
+                    if row is not None and row['status'] == 'ok':
+                        ## The result may come from another sweep with the
+                        ## same objective, parameters and budget
+                        _add_sweep_trial(conn, name, trial, rung, key)
+                        scores[trial] = row['score']
+                        latest[trial] = dict(row, sweep=name, trial=trial,
+                                             rung=rung)
+                        continue
+                    task = (objective_name, trials[trial], budget)
+                    futures[pool.submit(_run_trial, task)] = (trial, key)
+                logger.info('rung %d (budget %g): %d trials, %d cached',
+                            rung, budget, len(alive),
+                            len(alive) - len(futures))
+
+                for future in as_completed(futures):
+                    trial, key = futures[future]
+                    score, error, seconds = future.result()
+                    record = {'key': key, 'objective': objective_name,
+                              'params': json.dumps(trials[trial],
+                                                   sort_keys=True),
+                              'budget': budget, 'score': score,
+                              'status': 'ok' if error is None else 'error',
+                              'error': error, 'seconds': seconds,
+                              'data_fingerprint': data_fingerprint,
+                              'created': time.time()}
+                    ## Stored as soon as it finishes, so an interrupted
+                    ## sweep does not run it again
+                    with conn:
+                        conn.execute(
+                            'INSERT OR REPLACE INTO trials ({0}) '
+                            'VALUES ({1})'.format(
+                                ', '.join(record),
+                                ', '.join('?' * len(record))),
+                            list(record.values()))
+                    _add_sweep_trial(conn, name, trial, rung, key)
+                    latest[trial] = dict(record, sweep=name, trial=trial,
+                                         rung=rung)
+                    if error is None:
+                        scores[trial] = score
+                    else:
+                        logger.error('trial %d failed: %s', trial, error)
+
+                ranked = sorted(scores, key=lambda trial: sign * scores[trial])
+                if rung < len(rung_budgets) - 1:
+                    alive = ranked[:max(1, int(math.ceil(len(alive) /
+                                                         float(eta))))]
+    finally:
+        conn.close()
+
+    results = [latest[trial] for trial in latest]
+    ok = [res for res in results if res['status'] == 'ok']
+    failed = [res for res in results if res['status'] != 'ok']
+    ok.sort(key=lambda res: (-res['rung'], sign * res['score']))
+
+    return ok + failed
+
+
+def query(sweep=None, top=None, db_filepath=RESULTS_DB, mode='min'):
+    """ Best result of every trial of `sweep` (of every sweep by default),
+        at its highest rung.
+    """
+    conn = connect(db_filepath)
+    try:
+        sql = ('SELECT s.sweep, s.trial, s.rung, t.* FROM sweep_trials s '
+               'JOIN trials t ON t.key = s.key WHERE t.status = \'ok\' '
+               'AND s.rung = (SELECT MAX(u.rung) FROM sweep_trials u '
+               'JOIN trials v ON v.key = u.key WHERE u.sweep = s.sweep '
+               'AND u.trial = s.trial AND v.status = \'ok\')')
+        args = []
+        if sweep is not None:
+            sql += ' AND s.sweep = ?'
+            args.append(sweep)
+        sql += ' ORDER BY t.budget DESC, t.score {0}'.format(
+            'ASC' if mode == 'min' else 'DESC')
+        if top is not None:
+            sql += ' LIMIT {0:d}'.format(top)
+        return [dict(row) for row in conn.execute(sql, args)]
+    finally:
+        conn.close()
+
+
+@click.group()
+@click.option('--db', 'db_filepath', type=click.Path(), default=RESULTS_DB,
+              show_default=True, help='Results database.')
+@click.pass_context
+def main(ctx, db_filepath):
+    """ Runs hyperparameter sweeps and queries their results.
+    """
+    ctx.obj = db_filepath
+
+
+@main.command()
+@click.argument('objective')
+@click.option('--space', 'space_filepath', type=click.Path(exists=True),
+              required=True, help='JSON file with the search space.')
+@click.option('--search', type=click.Choice(['grid', 'random']),
+              default='grid', show_default=True)
+@click.option('--n-trials', type=click.IntRange(min=1), default=100,
+              show_default=True, help='Number of trials of random searches.')
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('--name', default=None,
+              help='Name of the sweep, not used by another sweep '
+                   '[default: from the current time].')
+@click.option('--min-budget', type=float, default=1, show_default=True)
+@click.option('--max-budget', type=float, default=1, show_default=True)
+@click.option('--eta', type=click.IntRange(min=2), default=3,
+              show_default=True, help='Reduction factor of the rungs.')
+@click.option('--mode', type=click.Choice(['min', 'max']), default='min',
+              show_default=True, help='Whether lower or higher is better.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help='Number of processes [default: number of cores].')
+@click.option('--data', type=click.Path(exists=True), default=None,
+              help='Data of the objective, part of the key of the results.')
+@click.pass_obj
+@flush_on_error
+def run(db_filepath, objective, space_filepath, search, n_trials, seed, name,
+        min_budget, max_budget, eta, mode, jobs, data):
+    """ Runs the sweep of OBJECTIVE (`module:function`).
+    """
+    with open(space_filepath) as f:
+        space = json.load(f)
+    if search == 'grid':
+        trials = grid_search(space)
+    else:
+        trials = random_search(space, n_trials, seed=seed)
+    start = time.time()
+    name = sweep_name() if name is None else name
+    try:
+        results = run_sweep(objective, trials, name=name,
+                            min_budget=min_budget, max_budget=max_budget,
+                            eta=eta, mode=mode, jobs=jobs, data=data,
+                            db_filepath=db_filepath)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    failed = [res for res in results if res['status'] != 'ok']
+    logger.info('sweep %s: %d trials in %.1fs, %d failed', name, len(trials),
+                time.time() - start, len(failed))
+    _print_results([res for res in results if res['status'] == 'ok'][:10])
+
+
+def _print_results(results):
+    click.echo('{0:>6} {1:>8} {2:>12} {3:>9}  {4}'.format(
+        'trial', 'budget', 'score', 'seconds', 'params'))
+    for res in results:
+        click.echo('{0:>6d} {1:>8g} {2:>12.6g} {3:>9.2f}  {4}'.format(
+            res['trial'], res['budget'], res['score'], res['seconds'],
+            res['params']))
+
+
+@main.command()
+@click.option('--name', default=None, help='Only show this sweep.')
+@click.option('--top', type=int, default=10, show_default=True)
+@click.option('--mode', type=click.Choice(['min', 'max']), default='min',
+              show_default=True, help='Whether lower or higher is better.')
+@click.pass_obj
+@flush_on_error
+def show(db_filepath, name, top, mode):
+    """ Shows the best trials.
+    """
+    _print_results(query(sweep=name, top=top, db_filepath=db_filepath,
+                         mode=mode))
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    main()
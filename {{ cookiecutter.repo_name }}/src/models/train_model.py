@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import click
+import pickle
+import logging
+import tempfile
+import importlib
+import threading
+from queue import Full, Queue
+from dotenv import find_dotenv, load_dotenv
+
+import numpy as np
+
+from src.features.store import FeatureStore
+from src.models.loader import save_model
+from src.utils.logs import flush_on_error, setup_logging
+from src.utils.profiling import profiled
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Directory of the models and of their checkpoints
+MODELS_DIR = os.path.join(PROJECT_DIR, 'models')
+
+logger = logging.getLogger(__name__)
+
+
+def _write_atomic(filepath, data):
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_filepath, filepath)
+
+
+def iter_batches(store, target, features=None, batch_size=100000,
+                 shuffle=False, seed=None, skip=0):
+    """ Mini-batches `(X, y)` of the rows of the feature store `store`.
+
+        Only one batch is copied out of the memory-mapped columns at a time,
+        so memory use depends on `batch_size` and not on the size of the
+        store. With `shuffle`, the order of the batches is shuffled but the
+        rows of each batch are still read contiguously. The first `skip`
+        batches are not read.
+    """
+    features = [column for column in store.columns if column != target] \
+        if features is None else list(features)
+    starts = np.arange(0, len(store), batch_size)
+    if shuffle:
+        np.random.RandomState(seed).shuffle(starts)
+    for start in starts[skip:]:
+        cols = store.read(columns=features + [target],
+                          rows=(start, start + batch_size))
+        X = np.column_stack([cols[column] for column in features])
+        yield X, np.asarray(cols[target])
+
+
+def prefetch(iterable, depth=1):
+    """ Iterates over `iterable` on a background thread, keeping up to
+        `depth` items ready, so the next batch is read while the current
+        one is used. Errors of the background thread are raised here.
+    """
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        ## Gives up when the consumer stopped iterating
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as err:
+            put((done, err))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, err = queue.get()
+            if err is not None:
+                raise err
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _target_classes(store, target, batch_size):
+    classes = set()
+    for cols in store.iter_blocks(batch_size, columns=[target]):
+        classes.update(np.unique(cols[target]).tolist())
+    return np.array(sorted(classes))
+
+
+def load_estimator(name, **params):
+    """ Instance of the estimator class `name`, e.g.
+        'sklearn.linear_model.SGDRegressor'.
+    """
+    module_name, _, class_name = name.rpartition('.')
+    estimator = getattr(importlib.import_module(module_name), class_name)
+    if not hasattr(estimator, 'partial_fit'):
+        raise ValueError('`{0}` does not support `partial_fit`!'.format(name))
+    return estimator(**params)
+
+
+def train_incremental(model, store, target, features=None, batch_size=100000,
+                      n_epochs=1, checkpoint_every=None,
+                      checkpoint_filepath=None, resume=False, shuffle=False,
+                      seed=None, prefetch_depth=1):
+    """ Trains `model` out of core with `partial_fit`, one mini-batch of the
+        feature store `store` at a time.
+
+        Parameters
+        ----------
+        model : estimator
+            Estimator with a `partial_fit` method.
+
+        store : `src.features.store.FeatureStore`
+            Features and target.
+
+        target : str
+            Column of the target.
+
+        features : list of str, optional
+            Columns used as features. Every other column by default.
+
+        batch_size : int, optional
+            Number of rows of each mini-batch.
+
+        n_epochs : int, optional
+            Number of passes over the store.
+
+        checkpoint_every : int, optional
+            Saves `model` to `checkpoint_filepath` every this many batches.
+
+        checkpoint_filepath : str, optional
+            File of the checkpoint. Required with `checkpoint_every`.
+
+        resume : bool, optional
+            Resume from the checkpoint, if there is one.
+
+        shuffle : bool, optional
+            Shuffle the order of the batches in every epoch.
+
+        seed : int, optional
+            Seed of the shuffling. The order of the batches of each epoch is
+            reproducible, so a resumed run skips the same batches.
+
+        prefetch_depth : int, optional
+            Number of batches read ahead on a background thread. 0 reads
+            each batch when it is needed.
+
+        Returns
+        -------
+        model : estimator
+            Trained model.
+
+        stats : dict
+            Number of `rows` and `batches` used, `seconds` and `rows_per_s`.
+    """
+    if checkpoint_every and checkpoint_filepath is None:
+        raise ValueError('`checkpoint_filepath` is needed to checkpoint!')
+    fit_kwargs = {}
+    try:
+        from sklearn.base import is_classifier
+    except ImportError:
+        is_classifier = None
+    if is_classifier is not None and is_classifier(model):
+        fit_kwargs['classes'] = _target_classes(store, target, batch_size)
+
+    first_epoch, first_batch = 0, 0
+    if resume and checkpoint_filepath and os.path.exists(checkpoint_filepath):
+        with open(checkpoint_filepath, 'rb') as f:
+            checkpoint = pickle.load(f)
+        model = checkpoint['model']
+        first_epoch, first_batch = checkpoint['epoch'], checkpoint['batch']
+        logger.info('resuming from epoch %d, batch %d', first_epoch,
+                    first_batch)
+
+    n_rows, n_batches = 0, 0
+    start = time.time()
+    for epoch in range(first_epoch, n_epochs):
+        batches = iter_batches(store, target, features=features,
+                               batch_size=batch_size, shuffle=shuffle,
+                               seed=None if seed is None else seed + epoch,
+                               skip=first_batch)
+        if prefetch_depth:
+            batches = prefetch(batches, depth=prefetch_depth)
+        for batch, (X, y) in enumerate(batches, first_batch):
+            model.partial_fit(X, y, **fit_kwargs)
+            n_rows += len(y)
+            n_batches += 1
+            if checkpoint_every and n_batches % checkpoint_every == 0:
+                checkpoint = {'model': model, 'epoch': epoch,
+                              'batch': batch + 1}
+                _write_atomic(checkpoint_filepath,
+                              pickle.dumps(checkpoint,
+                                           pickle.HIGHEST_PROTOCOL))
+                logger.info('checkpoint at epoch %d, batch %d', epoch,
+                            batch + 1)
+        first_batch = 0
+    seconds = time.time() - start
+
+    return model, {'rows': n_rows, 'batches': n_batches, 'seconds': seconds,
+                   'rows_per_s': n_rows / max(seconds, 1e-9)}
+
+
+@click.command()
+@click.argument('features_dir', type=click.Path(exists=True))
+@click.argument('model_filepath', type=click.Path())
+@click.option('--target', default='target', show_default=True,
+              help='Column of the feature store with the target.')
+@click.option('--feature', 'features', multiple=True,
+              help='Column used as a feature (repeatable). Every other '
+                   'column by default.')
+@click.option('--estimator', default='sklearn.linear_model.SGDRegressor',
+              show_default=True,
+              help='Estimator class supporting `partial_fit`.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=100000,
+              show_default=True, help='Number of rows of each mini-batch.')
+@click.option('--epochs', type=click.IntRange(min=1), default=1,
+              show_default=True, help='Number of passes over the features.')
+@click.option('--checkpoint-every', type=click.IntRange(min=1), default=None,
+              help='Checkpoint the model every this many batches.')
+@click.option('--resume', is_flag=True,
+              help='Resume from the last checkpoint of the model.')
+@click.option('--shuffle/--no-shuffle', default=True, show_default=True,
+              help='Shuffle the order of the batches in every epoch.')
+@click.option('--seed', type=int, default=0, show_default=True)
+@flush_on_error
+@profiled('train_model')
+def main(features_dir, model_filepath, target, features, estimator,
+         batch_size, epochs, checkpoint_every, resume, shuffle, seed):
+    """ Trains a model on the features in FEATURES_DIR and saves it to
+        MODEL_FILEPATH (../models).
+
+        The feature store is streamed in mini-batches, read ahead on a
+        background thread, and fed to the `partial_fit` method of the
+        estimator, so the features do not need to fit in memory.
+    """
+    logger.info('training model from features')
+
+    store = FeatureStore(features_dir)
+    logger.info('%d rows and %d features in %s', len(store),
+                len(store.columns), features_dir)
+    if target not in store:
+        raise click.BadParameter('no column `{0}` in the feature store'.format(
+            target), param_hint='--target')
+    if not features and store.columns == [target]:
+        raise click.ClickException('no features in {0} besides the target, '
+                                   'register some in '
+                                   'src/features/build_features.py'.format(
+                                       features_dir))
+
+    model = load_estimator(estimator)
+    checkpoint_filepath = os.path.join(
+        MODELS_DIR, 'checkpoints',
+        os.path.basename(model_filepath) + '.checkpoint')
+    model, stats = train_incremental(
+        model, store, target, features=list(features) or None,
+        batch_size=batch_size, n_epochs=epochs,
+        checkpoint_every=checkpoint_every,
+        checkpoint_filepath=checkpoint_filepath, resume=resume,
+        shuffle=shuffle, seed=seed)
+    save_model(model, model_filepath)
+    logger.info('trained on %d rows (%d batches) in %.2fs: %.0f rows/s',
+                stats['rows'], stats['batches'], stats['seconds'],
+                stats['rows_per_s'])
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    # find .env automagically by walking up directories until it's found, then
+    # load up the .env entries as environment variables
+    load_dotenv(find_dotenv())
+
+    main()
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+""" Content-addressed cache for the outputs of pipeline stages.
+
+    The output of a stage is stored under a key made of the hash of its
+    input files, its parameters (e.g. the `param_dict` of a script) and its
+    source code. Running the stage again with the same inputs, parameters
+    and code returns the stored output without recomputing it.
+
+    Usage:
+
+        from src.utils.cache import cached_stage
+
+        @cached_stage(inputs=['catl_path'], ignore=['param_dict.Prog_msg'])
+        def clean_catalogue(catl_path, param_dict):
+            ...
+            return catl_df
+
+    The cache is kept in `data/interim/.cache` and can be inspected and
+    purged with:
+
+        $ python -m src.utils.cache list
+        $ python -m src.utils.cache purge --stage clean_catalogue
+"""
+import os
+import sys
+import time
+import json
+import click
+import pickle
+import shutil
+import hashlib
+import inspect
+import logging
+import functools
+import tempfile
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Default location of the cache
+CACHE_DIR = os.path.join(PROJECT_DIR, 'data', 'interim', '.cache')
+# Name of the file that remembers the hash of already hashed input files
+FINGERPRINTS_FILE = 'fingerprints.json'
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_file(filepath, blocksize=2 ** 20):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(functools.partial(f.read, blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _load_fingerprints(cache_dir):
+    filepath = os.path.join(cache_dir, FINGERPRINTS_FILE)
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _save_fingerprints(cache_dir, fingerprints):
+    _write_atomic(os.path.join(cache_dir, FINGERPRINTS_FILE),
+                  json.dumps(fingerprints, sort_keys=True).encode('utf-8'))
+
+
+def _write_atomic(filepath, data):
+    dirname = os.path.dirname(filepath)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_filepath, filepath)
+
+
+def file_fingerprint(path, cache_dir=CACHE_DIR):
+    """ Hash of the contents of a file, or of every file in a directory.
+
+        The hash of each file is remembered together with its size and
+        modification time, so unchanged files are not read again.
+
+        Parameters
+        ----------
+        path : str
+            Path to a file or a directory.
+
+        cache_dir : str, optional
+            Directory where the remembered hashes are kept.
+
+        Returns
+        -------
+        fingerprint : str
+            Hexadecimal SHA-256 digest.
+    """
+    if os.path.isdir(path):
+        filepaths = sorted(os.path.join(root, filename)
+                           for root, _, files in os.walk(path)
+                           for filename in files)
+    else:
+        filepaths = [path]
+
+    fingerprints = _load_fingerprints(cache_dir)
+    updated = False
+    sha = hashlib.sha256()
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        abspath = os.path.abspath(filepath)
+        known = fingerprints.get(abspath)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            file_hash = known[2]
+        else:
+            file_hash = _hash_file(filepath)
+            fingerprints[abspath] = [stat.st_size, stat.st_mtime_ns, file_hash]
+            updated = True
+        sha.update(os.path.relpath(filepath, path).encode('utf-8'))
+        sha.update(file_hash.encode('utf-8'))
+    if updated:
+        _save_fingerprints(cache_dir, fingerprints)
+
+    return sha.hexdigest()
+
+
+def _source_code(func):
+    try:
+        return inspect.getsource(func)
+    except (IOError, OSError, TypeError):
+        return func.__code__.co_code.hex()
+
+
+def _drop_ignored(name, value, ignore):
+    """ Removes the ignored entries (`name.key`) of dictionary arguments.
+    """
+    if not isinstance(value, dict):
+        return value
+    prefix = name + '.'
+    ignored_keys = [item[len(prefix):] for item in ignore
+                    if item.startswith(prefix)]
+    return dict((key, val) for key, val in value.items()
+                if key not in ignored_keys)
+
+
+def _hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _key_default(value):
+    """ JSON-serializable stand-in of the arguments `json` cannot serialize.
+
+        NumPy arrays and pandas objects are hashed by their type, shape and
+        contents, since their `repr` is truncated. Objects that have no
+        stable representation raise `TypeError`.
+    """
+    ## NumPy and pandas are only imported by the stages that pass them
+    np = sys.modules.get('numpy')
+    pd = sys.modules.get('pandas')
+    if np is not None:
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError('arrays of objects cannot be part of a cache '
+                                'key')
+            return {'ndarray': [value.dtype.str, list(value.shape),
+                                _hash_bytes(np.ascontiguousarray(value))]}
+        if isinstance(value, np.generic):
+            return value.item()
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series,
+                                             pd.Index)):
+        hashes = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        if isinstance(value, pd.DataFrame):
+            names = [str(column) for column in value.columns]
+            dtypes = [str(dtype) for dtype in value.dtypes]
+        else:
+            names, dtypes = [str(value.name)], [str(value.dtype)]
+        return {type(value).__name__: [names, dtypes, list(value.shape),
+                                       _hash_bytes(hashes)]}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, bytes):
+        return {'bytes': _hash_bytes(value)}
+    raise TypeError('`{0}` objects cannot be part of a cache key'.format(
+        type(value).__name__))
+
+
+def params_digest(params):
+    """ Hexadecimal SHA-256 digest of the parameters `params` (a dictionary
+        of JSON-serializable values, NumPy arrays or pandas objects).
+
+        Raises `TypeError` for values without a stable representation.
+    """
+    text = json.dumps(params, sort_keys=True, default=_key_default)
+    return _hash_bytes(text.encode('utf-8'))
+
+
+def stage_key(func, bound_args, inputs=(), ignore=(), cache_dir=CACHE_DIR):
+    """ Key of a call to the stage `func`.
+
+        Parameters
+        ----------
+        func : callable
+            Stage function.
+
+        bound_args : dict
+            Arguments of the call, by name. They must be serializable to
+            JSON, or be NumPy arrays or pandas objects.
+
+        inputs : list of str, optional
+            Names of the arguments that are paths to input files or
+            directories. Their contents, and not their paths, are hashed.
+
+        ignore : list of str, optional
+            Names of the arguments that do not change the output. Entries
+            of dictionary arguments are ignored with `name.key`.
+
+        Returns
+        -------
+        key : str
+            Hexadecimal SHA-256 digest.
+    """
+    params = {}
+    for name, value in bound_args.items():
+        if name in ignore:
+            continue
+        if name in inputs:
+            paths = value if isinstance(value, (list, tuple)) else [value]
+            value = [file_fingerprint(path, cache_dir=cache_dir)
+                     for path in paths]
+        params[name] = _drop_ignored(name, value, ignore)
+
+    sha = hashlib.sha256()
+    sha.update(func.__module__.encode('utf-8'))
+    sha.update(func.__name__.encode('utf-8'))
+    sha.update(_source_code(func).encode('utf-8'))
+    sha.update(params_digest(params).encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+def _entry_dir(key, cache_dir):
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def cached_stage(inputs=(), ignore=(), cache_dir=CACHE_DIR):
+    """ Decorator that caches the output of a pipeline stage.
+
+        The output of the stage must be picklable. Pass `_force=True` to the
+        decorated function to recompute and overwrite the stored output.
+
+        Parameters
+        ----------
+        inputs : list of str, optional
+            Names of the arguments that are paths to input files or
+            directories.
+
+        ignore : list of str, optional
+            Names of the arguments, or `name.key` entries of dictionary
+            arguments, that do not change the output.
+
+        cache_dir : str, optional
+            Location of the cache. Defaults to `data/interim/.cache`.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            force = kwargs.pop('_force', False)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = stage_key(func, bound.arguments, inputs=inputs,
+                            ignore=ignore, cache_dir=cache_dir)
+            entry_dir = _entry_dir(key, cache_dir)
+            artifact_path = os.path.join(entry_dir, 'artifact.pkl')
+            if not force and os.path.exists(artifact_path):
+                logger.info('%s: cache hit (%s)', func.__name__, key[:12])
+                os.utime(artifact_path, None)
+                with open(artifact_path, 'rb') as f:
+                    return pickle.load(f)
+
+            start = time.time()
+            output = func(*args, **kwargs)
+            seconds = time.time() - start
+            _write_atomic(artifact_path,
+                          pickle.dumps(output, pickle.HIGHEST_PROTOCOL))
+            meta = {'stage': func.__name__,
+                    'module': func.__module__,
+                    'created': time.time(),
+                    'seconds': seconds}
+            _write_atomic(os.path.join(entry_dir, 'meta.json'),
+                          json.dumps(meta, sort_keys=True).encode('utf-8'))
+            logger.info('%s: stored output in cache (%s)', func.__name__,
+                        key[:12])
+            return output
+
+        wrapper.cache_dir = cache_dir
+        return wrapper
+
+    return decorator
+
+
+def list_entries(cache_dir=CACHE_DIR):
+    """ Entries of the cache.
+
+        Returns
+        -------
+        entries : list of dict
+            Metadata of each entry, with its `key`, `size` (bytes) and
+            `last_used` time.
+    """
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for prefix in sorted(os.listdir(cache_dir)):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for key in sorted(os.listdir(prefix_dir)):
+            entry_dir = os.path.join(prefix_dir, key)
+            try:
+                with open(os.path.join(entry_dir, 'meta.json')) as f:
+                    meta = json.load(f)
+                artifact_stat = os.stat(os.path.join(entry_dir,
+                                                     'artifact.pkl'))
+            except (IOError, OSError, ValueError):
+                continue
+            meta.update(key=key, size=artifact_stat.st_size,
+                        last_used=artifact_stat.st_mtime)
+            entries.append(meta)
+
+    return entries
+
+
+def purge(stage=None, older_than=None, cache_dir=CACHE_DIR):
+    """ Removes entries from the cache.
+
+        Parameters
+        ----------
+        stage : str, optional
+            Only remove the entries of this stage.
+
+        older_than : float, optional
+            Only remove the entries not used in this many days.
+
+        Returns
+        -------
+        removed : list of dict
+            Metadata of the removed entries.
+    """
+    removed = []
+    for entry in list_entries(cache_dir):
+        if stage is not None and entry['stage'] != stage:
+            continue
+        if older_than is not None and \
+                time.time() - entry['last_used'] < older_than * 86400:
+            continue
+        entry_dir = _entry_dir(entry['key'], cache_dir)
+        shutil.rmtree(entry_dir)
+        if not os.listdir(os.path.dirname(entry_dir)):
+            os.rmdir(os.path.dirname(entry_dir))
+        removed.append(entry)
+
+    return removed
+
+
+def _format_size(n_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1024.:
+            break
+        n_bytes /= 1024.
+    return '{0:.1f} {1}'.format(n_bytes, unit)
+
+
+@click.group()
+@click.option('--cache-dir', type=click.Path(), default=CACHE_DIR,
+              show_default=True, help='Location of the cache.')
+@click.pass_context
+def main(ctx, cache_dir):
+    """ Inspects and purges the cache of pipeline stage outputs.
+    """
+    ctx.obj = cache_dir
+
+
+@main.command('list')
+@click.option('--stage', default=None, help='Only list this stage.')
+@click.pass_obj
+def list_command(cache_dir, stage):
+    """ Lists the cached outputs.
+    """
+    entries = [entry for entry in list_entries(cache_dir)
+               if stage is None or entry['stage'] == stage]
+    for entry in sorted(entries, key=lambda entry: entry['last_used']):
+        click.echo('{0}  {1:<30} {2:>10}  {3:>8.1f}s  {4}'.format(
+            entry['key'][:12], entry['stage'], _format_size(entry['size']),
+            entry['seconds'],
+            time.strftime('%Y-%m-%d %H:%M',
+                          time.localtime(entry['last_used']))))
+    click.echo('{0} entries, {1}'.format(
+        len(entries), _format_size(sum(entry['size'] for entry in entries))))
+
+
+@main.command('purge')
+@click.option('--stage', default=None, help='Only purge this stage.')
+@click.option('--older-than', type=float, default=None,
+              help='Only purge the entries not used in this many days.')
+@click.pass_obj
+def purge_command(cache_dir, stage, older_than):
+    """ Removes cached outputs.
+    """
+    removed = purge(stage=stage, older_than=older_than, cache_dir=cache_dir)
+    click.echo('Removed {0} entries, {1}'.format(
+        len(removed), _format_size(sum(entry['size'] for entry in removed))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+""" Lazy imports, so scripts and command-line tools start quickly.
+
+    `lazy_import` returns a stand-in for a module that imports it the first
+    time one of its attributes is used. Heavy modules (NumPy, pandas,
+    matplotlib, `cosmo_utils`, ...) can be imported at the top of a script
+    as usual, but are only loaded by the code paths that use them, and not
+    by e.g. `--help`:
+
+        from src.utils.lazy import lazy_import
+
+        np = lazy_import('numpy')
+        plt = lazy_import('matplotlib.pyplot',
+                          setup=lambda plt: plt.switch_backend('Agg'))
+
+    `lazy_submodules` gives a package the module-level `__getattr__` and
+    `__dir__` (PEP 562) that import its submodules when they are accessed.
+
+    `python benchmarks/bench_import.py` checks the import time of the
+    project's modules and scripts against `benchmarks/import_budget.json`.
+"""
+import sys
+import types
+import importlib
+import threading
+
+__all__ = ['LazyModule', 'lazy_import', 'lazy_submodules']
+
+
+class LazyModule(types.ModuleType):
+    """ Stand-in for the module `name`, imported on first attribute access.
+
+        Parameters
+        ----------
+        name : str
+            Absolute name of the module.
+
+        setup : callable, optional
+            Function called with the module right after it is imported, e.g.
+            to configure it.
+    """
+    def __init__(self, name, setup=None):
+        super(LazyModule, self).__init__(name)
+        ## Set through `__dict__`, so these attributes never trigger
+        ## the import
+        self.__dict__['_lazy_setup'] = setup
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_lock'] = threading.RLock()
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is not None:
+            return module
+        with self.__dict__['_lazy_lock']:
+            module = self.__dict__['_lazy_module']
+            if module is None:
+                module = importlib.import_module(self.__name__)
+                setup = self.__dict__['_lazy_setup']
+                if setup is not None:
+                    setup(module)
+                self.__dict__['_lazy_module'] = module
+        return module
+
+    @property
+    def is_loaded(self):
+        """ Whether the module was imported.
+        """
+        return self.__dict__['_lazy_module'] is not None
+
+    def __getattr__(self, attr):
+        ## Only called for attributes missing from the stand-in itself
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else 'not loaded'
+        return '<lazy module {0!r} ({1})>'.format(self.__name__, state)
+
+
+def lazy_import(name, setup=None):
+    """ The module `name`, imported the first time one of its attributes is
+        used.
+
+        Modules that are already imported are returned as they are (after
+        calling `setup`), at no cost.
+
+        Parameters
+        ----------
+        name : str
+            Absolute name of the module, e.g. 'matplotlib.pyplot'.
+
+        setup : callable, optional
+            Function called with the module right after it is imported.
+
+        Returns
+        -------
+        module : module or `LazyModule`
+            The module, or its stand-in.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        if setup is not None:
+            setup(module)
+        return module
+    return LazyModule(name, setup=setup)
+
+
+def lazy_submodules(package, submodules):
+    """ `__getattr__` and `__dir__` functions of the package `package` that
+        import its `submodules` when they are first accessed.
+
+        Usage, in the `__init__.py` of a package:
+
+            __getattr__, __dir__ = lazy_submodules(__name__, ['data', 'io'])
+    """
+    submodules = frozenset(submodules)
+
+    def __getattr__(attr):
+        if attr in submodules:
+            ## Importing the submodule also sets it as an attribute of the
+            ## package, so this is only called once per submodule
+            return importlib.import_module('{0}.{1}'.format(package, attr))
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(
+            package, attr))
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | submodules)
+
+    return __getattr__, __dir__
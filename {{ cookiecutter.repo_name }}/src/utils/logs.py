@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+""" Non-blocking logging of the scripts and of their worker processes.
+
+    `setup_logging` replaces `logging.basicConfig` in the scripts. The
+    loggers of the process, and of the workers of a `ProcessPoolExecutor`
+    created with `executor_kwargs()`, only put their records on a queue: a
+    listener thread of the main process formats and writes them, so logging
+    does not block hot loops and the lines of different processes do not
+    interleave.
+
+        from src.utils.logs import setup_logging, executor_kwargs, throughput
+
+        setup_logging()
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 **executor_kwargs()) as pool:
+            ...
+        logger.info('processed %s', filepath,
+                    extra=throughput('make_dataset', rows=n_rows,
+                                     n_bytes=n_bytes, seconds=seconds))
+
+    Records are written asynchronously: call `flush_logging()` before
+    writing to the console directly, so the messages keep their order.
+    Commands decorated with `flush_on_error` do it before their errors
+    (e.g. a `click.ClickException`) are reported.
+
+    Records with the same message template are rate-limited in every process
+    (one per second by default, for levels up to INFO, except those logged
+    with `throughput`), so per-chunk progress messages are cheap. When the
+    `SRC_LOG_JSON` environment variable is set to a file, every record is
+    also appended to it as a JSON line, with the `stage`, `rows`, `bytes`
+    and `seconds` of the records logged with `throughput`. Their throughput
+    per stage is reported with:
+
+        $ python -m src.utils.logs throughput reports/logs/pipeline.jsonl
+"""
+import os
+import sys
+import json
+import time
+import click
+import atexit
+import logging
+import functools
+import threading
+import multiprocessing
+import logging.handlers
+from collections import OrderedDict
+
+# Format of the log messages on the console
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Environment variable with the file of the JSON lines, if any
+LOG_JSON_ENV = 'SRC_LOG_JSON'
+# Throughput fields of the records, as passed to `throughput`
+THROUGHPUT_FIELDS = ('stage', 'rows', 'bytes', 'seconds')
+
+# Queue and listener of the process, once `setup_logging` is called
+_STATE = {'queue': None, 'listener': None, 'level': None, 'rate_limit': None}
+
+
+class RateLimitFilter(logging.Filter):
+    """ Lets through at most one record per `interval` seconds of each
+        logger, level and message template.
+
+        The number of records suppressed since the last one let through is
+        set in its `suppressed` attribute. Records above `max_level` (e.g.
+        warnings and errors), and records logged with `throughput`, which
+        every stage summary needs, are never suppressed.
+    """
+    def __init__(self, interval=1., max_level=logging.INFO):
+        super(RateLimitFilter, self).__init__()
+        self.interval = interval
+        self.max_level = max_level
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.interval <= 0 or record.levelno > self.max_level or \
+                getattr(record, 'stage', None) is not None:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return False
+            self._last[key] = (now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class ConsoleFormatter(logging.Formatter):
+    """ `LOG_FORMAT`, with the number of similar records suppressed by
+        `RateLimitFilter`.
+    """
+    def __init__(self, fmt=LOG_FORMAT, **kwargs):
+        super(ConsoleFormatter, self).__init__(fmt, **kwargs)
+
+    def format(self, record):
+        text = super(ConsoleFormatter, self).format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += ' ({0} similar messages suppressed)'.format(suppressed)
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats records as JSON objects, on a single line.
+
+        Besides the time, level, logger, process and message of the record,
+        the objects have the throughput fields of the records logged with
+        `throughput`, and their `rows_per_s` and `mb_per_s`.
+    """
+    def format(self, record):
+        entry = OrderedDict([('time', record.created),
+                             ('level', record.levelname),
+                             ('name', record.name),
+                             ('process', record.process),
+                             ('message', record.getMessage())])
+        for field in THROUGHPUT_FIELDS + ('suppressed',):
+            if getattr(record, field, None) is not None:
+                entry[field] = getattr(record, field)
+        seconds = entry.get('seconds')
+        if seconds:
+            if entry.get('rows') is not None:
+                entry['rows_per_s'] = entry['rows'] / seconds
+            if entry.get('bytes') is not None:
+                entry['mb_per_s'] = entry['bytes'] / 1024. ** 2 / seconds
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry, default=repr)
+
+
+def throughput(stage, rows=None, n_bytes=None, seconds=None):
+    """ `extra` of a record with the throughput of `stage`: `rows` and
+        `n_bytes` processed in `seconds`.
+    """
+    return {'stage': stage, 'rows': rows, 'bytes': n_bytes,
+            'seconds': seconds}
+
+
+def _queue_handler(queue, rate_limit):
+    handler = logging.handlers.QueueHandler(queue)
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit))
+    return handler
+
+
+def _set_root_handler(handler, level):
+    root = logging.getLogger()
+    for old_handler in list(root.handlers):
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def setup_logging(level=logging.INFO, json_filepath=None, rate_limit=1.):
+    """ Routes the records of the process through a queue to the console
+        and, optionally, to a file of JSON lines.
+
+        Calling it again returns the listener already running.
+
+        Parameters
+        ----------
+        level : int, optional
+            Level of the root logger.
+
+        json_filepath : str, optional
+            File the records are appended to as JSON lines. Defaults to
+            `$SRC_LOG_JSON`, if set.
+
+        rate_limit : float, optional
+            Seconds between two records with the same message template, up
+            to the INFO level. 0 disables rate limiting.
+
+        Returns
+        -------
+        listener : `logging.handlers.QueueListener`
+            Listener writing the records. It is stopped, after writing the
+            records still queued, at exit or by `stop_logging`.
+    """
+    if _STATE['listener'] is not None:
+        return _STATE['listener']
+    if json_filepath is None:
+        json_filepath = os.environ.get(LOG_JSON_ENV) or None
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(ConsoleFormatter())
+    handlers = [console]
+    if json_filepath is not None:
+        dirname = os.path.dirname(os.path.abspath(json_filepath))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        json_handler = logging.FileHandler(json_filepath, mode='a')
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+
+    ## A multiprocessing queue, so that pool workers can share it
+    queue = multiprocessing.Queue(-1)
+    listener = logging.handlers.QueueListener(queue, *handlers,
+                                              respect_handler_level=True)
+    listener.start()
+    _set_root_handler(_queue_handler(queue, rate_limit), level)
+    _STATE.update(queue=queue, listener=listener, level=level,
+                  rate_limit=rate_limit)
+    atexit.register(stop_logging)
+
+    return listener
+
+
+def flush_logging():
+    """ Waits until the records logged so far are written.
+    """
+    listener = _STATE['listener']
+    if listener is None:
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+        return
+    ## The listener writes every record queued before it stops
+    listener.stop()
+    listener.start()
+
+
+def flush_on_error(func):
+    """ Decorator that flushes the records logged by `func`, e.g. a click
+        command, before its errors or exit status are reported.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            flush_logging()
+            raise
+
+    return wrapper
+
+
+def stop_logging():
+    """ Writes the records still queued and stops the listener.
+    """
+    listener = _STATE['listener']
+    if listener is None:
+        return
+    _STATE.update(queue=None, listener=None)
+    logging.getLogger().handlers = []
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def _init_worker(queue, level, rate_limit):
+    _set_root_handler(_queue_handler(queue, rate_limit), level)
+
+
+def executor_kwargs():
+    """ Keyword arguments of `concurrent.futures.ProcessPoolExecutor` that
+        send the records of its workers to the listener of `setup_logging`.
+
+        Empty if logging was not set up with `setup_logging`.
+    """
+    if _STATE['queue'] is None:
+        return {}
+    return {'initializer': _init_worker,
+            'initargs': (_STATE['queue'], _STATE['level'],
+                         _STATE['rate_limit'])}
+
+
+def load_records(filepath):
+    """ Records of a file of JSON lines written by `setup_logging`.
+    """
+    records = []
+    with open(filepath) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def throughput_summary(records):
+    """ Total rows, bytes and seconds, and throughput, of every stage of the
+        `records` logged with `throughput`.
+
+        Seconds are summed over the records, so the throughput of a stage
+        run by several workers is that of a single worker.
+
+        Returns
+        -------
+        summary : `collections.OrderedDict`
+            `{stage: {'records', 'rows', 'bytes', 'seconds', 'rows_per_s',
+            'mb_per_s'}}`, in the order the stages were first logged.
+            Throughputs are `None` when unknown.
+    """
+    summary = OrderedDict()
+    for record in records:
+        if record.get('stage') is None or record.get('seconds') is None:
+            continue
+        stage = summary.setdefault(record['stage'], {
+            'records': 0, 'rows': 0, 'bytes': 0, 'seconds': 0.})
+        stage['records'] += 1
+        stage['seconds'] += record['seconds']
+        for field in ['rows', 'bytes']:
+            if stage[field] is not None and record.get(field) is not None:
+                stage[field] += record[field]
+            else:
+                stage[field] = None
+    for stage in summary.values():
+        seconds = stage['seconds']
+        stage['rows_per_s'] = stage['rows'] / seconds \
+            if seconds and stage['rows'] is not None else None
+        stage['mb_per_s'] = stage['bytes'] / 1024. ** 2 / seconds \
+            if seconds and stage['bytes'] is not None else None
+
+    return summary
+
+
+def plot_throughput(summary, filepath):
+    """ Bar charts of the rows/s and MB/s of the stages of `summary`, saved
+        to `filepath`.
+    """
+    from matplotlib.figure import Figure
+
+    stages = list(summary)
+    fig = Figure(figsize=(10, 0.5 * len(stages) + 1.5))
+    for idx, (field, label) in enumerate([('rows_per_s', 'rows / s'),
+                                          ('mb_per_s', 'MB / s')]):
+        ax = fig.add_subplot(1, 2, idx + 1)
+        ax.barh(range(len(stages)),
+                [summary[stage][field] or 0. for stage in stages])
+        ax.set_yticks(range(len(stages)))
+        ax.set_yticklabels(stages if idx == 0 else [])
+        ax.invert_yaxis()
+        ax.set_xlabel(label)
+    fig.tight_layout()
+    fig.savefig(filepath)
+
+
+def _format_rate(value, fmt):
+    return 'n/a' if value is None else fmt.format(value)
+
+
+@click.group()
+def main():
+    """ Reports the JSON lines written by the scripts.
+    """
+
+
+@main.command('throughput')
+@click.argument('log_filepath', type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--output', type=click.Path(), default=None,
+              help='File the chart of the throughputs is saved to.')
+def throughput_command(log_filepath, output):
+    """ Reports the throughput of every stage logged in LOG_FILEPATH.
+    """
+    summary = throughput_summary(load_records(log_filepath))
+    click.echo('{0:<40} {1:>8} {2:>12} {3:>10} {4:>10} {5:>12} {6:>8}'.format(
+        'stage', 'records', 'rows', 'MB', 'seconds', 'rows/s', 'MB/s'))
+    for name, stage in summary.items():
+        click.echo('{0:<40} {1:>8} {2:>12} {3:>10} {4:>10.2f} {5:>12} '
+                   '{6:>8}'.format(
+                       name, stage['records'],
+                       _format_rate(stage['rows'], '{0:d}'),
+                       _format_rate(None if stage['bytes'] is None else
+                                    stage['bytes'] / 1024. ** 2, '{0:.1f}'),
+                       stage['seconds'],
+                       _format_rate(stage['rows_per_s'], '{0:.0f}'),
+                       _format_rate(stage['mb_per_s'], '{0:.2f}')))
+    if output is not None:
+        if not summary:
+            raise click.ClickException('no throughput records in {0}'.format(
+                log_filepath))
+        plot_throughput(summary, output)
+        click.echo('Chart saved to {0}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
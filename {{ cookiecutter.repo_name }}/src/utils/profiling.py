@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+""" Timing and profiling of the pipeline stages.
+
+    `profile_stage` (a context manager) and `profiled` (a decorator) record
+    the wall time, CPU time (of the process and of its finished child
+    processes) and peak resident memory (RSS) of a stage:
+
+        from src.utils.profiling import profile_stage, profiled
+
+        @profiled('train_model')
+        def main(...):
+            ...
+
+        with profile_stage('load_catalogue'):
+            catl_df = pd.read_csv(catl_path)
+
+    When the `SRC_PROFILE_DIR` environment variable is set (as done by
+    `make profile`), stages are also run under `cProfile` and `tracemalloc`:
+    the statistics of every stage are appended to
+    `$SRC_PROFILE_DIR/stages.jsonl`, and its profile dumped to
+    `$SRC_PROFILE_DIR/<stage>.<pid>.prof`. The ranked hot spots of all of
+    them are reported with:
+
+        $ python -m src.utils.profiling report reports/profile
+
+    Stages run inside another stage of the same process only record their
+    times and RSS, since a single profiler can be active at a time.
+"""
+import io
+import os
+import sys
+import json
+import time
+import click
+import pstats
+import cProfile
+import logging
+import functools
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    ## Not available on Windows
+    resource = None
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Default directory of the profiles written by `make profile`
+PROFILE_DIR = os.path.join(PROJECT_DIR, 'reports', 'profile')
+# Environment variable that enables profiling, set to the profile directory
+PROFILE_ENV = 'SRC_PROFILE_DIR'
+# File of the statistics of every stage, in the profile directory
+STAGES_FILE = 'stages.jsonl'
+
+logger = logging.getLogger(__name__)
+
+# Stage currently profiled by `cProfile` and `tracemalloc` in this process
+_ACTIVE = {'stage': None}
+
+
+def _peak_rss_mb():
+    """ Peak resident memory of the process so far, in MB.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## Kilobytes on Linux, bytes on macOS
+    return max_rss / (1024. ** 2 if sys.platform == 'darwin' else 1024.)
+
+
+def _children_cpu_s():
+    if resource is None:
+        return 0.
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageProfile(object):
+    """ Context manager that records the times and memory of a stage.
+
+        The statistics are available in the `stats` attribute once the
+        stage is finished.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+
+        profile_dir : str, optional
+            Directory of the profiles. Defaults to `$SRC_PROFILE_DIR`; if
+            neither is set, the stage is only timed.
+
+        cprofile : bool, optional
+            Run the stage under `cProfile`. Defaults to whether
+            `profile_dir` is set.
+
+        trace_memory : bool, optional
+            Trace the peak memory allocated by Python objects with
+            `tracemalloc`, which slows the stage down. Defaults to whether
+            `profile_dir` is set.
+    """
+    def __init__(self, name, profile_dir=None, cprofile=None,
+                 trace_memory=None):
+        self.name = name
+        if profile_dir is None:
+            profile_dir = os.environ.get(PROFILE_ENV) or None
+        self.profile_dir = profile_dir
+        enabled = profile_dir is not None
+        self.cprofile = enabled if cprofile is None else cprofile
+        self.trace_memory = enabled if trace_memory is None else trace_memory
+        self.stats = None
+        self._profiler = None
+        self._tracing = False
+
+    def __enter__(self):
+        if _ACTIVE['stage'] is None:
+            _ACTIVE['stage'] = self
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            if self.cprofile:
+                self._profiler = cProfile.Profile()
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._start_children_cpu = _children_cpu_s()
+        self._started = time.time()
+        if self._profiler is not None:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.stats = {
+            'stage': self.name,
+            'pid': os.getpid(),
+            'started': self._started,
+            'wall_s': time.perf_counter() - self._start,
+            'cpu_s': time.process_time() - self._start_cpu,
+            'children_cpu_s': _children_cpu_s() - self._start_children_cpu,
+            'peak_rss_mb': _peak_rss_mb(),
+            'traced_peak_mb': None,
+            'failed': exc_type is not None}
+        if self._tracing:
+            self.stats['traced_peak_mb'] = \
+                tracemalloc.get_traced_memory()[1] / 1024. ** 2
+            tracemalloc.stop()
+        if _ACTIVE['stage'] is self:
+            _ACTIVE['stage'] = None
+        self._save()
+        logger.log(logging.INFO if self.profile_dir else logging.DEBUG,
+                   'stage %s: %.2fs wall, %.2fs CPU, %s MB peak RSS%s',
+                   self.name, self.stats['wall_s'], self.stats['cpu_s'],
+                   _format_mb(self.stats['peak_rss_mb']),
+                   '' if self.stats['traced_peak_mb'] is None else
+                   ', {0} MB traced peak'.format(
+                       _format_mb(self.stats['traced_peak_mb'])))
+        ## Exceptions of the stage are not swallowed
+        return False
+
+    def _save(self):
+        if self.profile_dir is None:
+            return
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir, exist_ok=True)
+        if self._profiler is not None:
+            filename = '{0}.{1}.prof'.format(self.name, os.getpid())
+            self._profiler.dump_stats(os.path.join(self.profile_dir,
+                                                   filename))
+            self.stats['profile'] = filename
+        ## Single appends of a line, so concurrent stages do not mix
+        with open(os.path.join(self.profile_dir, STAGES_FILE), 'a') as f:
+            f.write(json.dumps(self.stats, sort_keys=True) + '\n')
+
+
+def profile_stage(name, **kwargs):
+    """ Context manager that records the times and memory of the stage
+        `name`. See `StageProfile` for the other arguments.
+    """
+    return StageProfile(name, **kwargs)
+
+
+def profiled(name=None, **kwargs):
+    """ Decorator that runs a function as a stage, in `profile_stage`.
+
+        `name` defaults to the module and name of the function. Other
+        arguments are passed to `profile_stage`.
+    """
+    if callable(name):
+        return profiled(**kwargs)(name)
+
+    def decorator(func):
+        stage_name = name or '{0}.{1}'.format(func.__module__, func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **func_kwargs):
+            with profile_stage(stage_name, **kwargs):
+                return func(*args, **func_kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_mb(value):
+    return 'n/a' if value is None else '{0:.1f}'.format(value)
+
+
+def load_stages(profile_dir):
+    """ Statistics of the stages recorded in `profile_dir`.
+    """
+    filepath = os.path.join(profile_dir, STAGES_FILE)
+    if not os.path.exists(filepath):
+        return []
+    stages = []
+    with open(filepath) as f:
+        for line in f:
+            try:
+                stages.append(json.loads(line))
+            except ValueError:
+                continue
+    return stages
+
+
+def hotspot_report(profile_dir, top=30):
+    """ Report of the stages and of the ranked hot spots of the profiles in
+        `profile_dir`.
+
+        Parameters
+        ----------
+        profile_dir : str
+            Directory of the profiles.
+
+        top : int, optional
+            Number of functions listed by cumulative and by own time.
+
+        Returns
+        -------
+        report : str
+            Text of the report.
+    """
+    stream = io.StringIO()
+    stages = load_stages(profile_dir)
+    stream.write('Stages\n======\n\n')
+    stream.write('{0:<40} {1:>9} {2:>9} {3:>12} {4:>12} {5:>14}\n'.format(
+        'stage', 'wall (s)', 'CPU (s)', 'child CPU (s)', 'peak RSS (MB)',
+        'traced (MB)'))
+    for stage in sorted(stages, key=lambda stage: -stage['wall_s']):
+        stream.write('{0:<40} {1:>9.2f} {2:>9.2f} {3:>12.2f} {4:>12} '
+                     '{5:>14}{6}\n'.format(
+                         stage['stage'], stage['wall_s'], stage['cpu_s'],
+                         stage['children_cpu_s'],
+                         _format_mb(stage['peak_rss_mb']),
+                         _format_mb(stage['traced_peak_mb']),
+                         '  (failed)' if stage['failed'] else ''))
+
+    profiles = sorted(os.path.join(profile_dir, filename)
+                      for filename in os.listdir(profile_dir)
+                      if filename.endswith('.prof'))
+    if profiles:
+        stats = pstats.Stats(*profiles, stream=stream)
+        stats.strip_dirs()
+        for sort, title in [('cumulative', 'cumulative time'),
+                            ('tottime', 'own time')]:
+            header = 'Hot spots by {0} ({1} profiles)'.format(title,
+                                                              len(profiles))
+            stream.write('\n\n{0}\n{1}\n'.format(header, '=' * len(header)))
+            stats.sort_stats(sort).print_stats(top)
+
+    return stream.getvalue()
+
+
+@click.group()
+def main():
+    """ Reports the profiles of the pipeline stages.
+    """
+
+
+@main.command()
+@click.argument('profile_dir', type=click.Path(exists=True, file_okay=False),
+                default=PROFILE_DIR)
+@click.option('--top', type=click.IntRange(min=1), default=30,
+              show_default=True, help='Number of hot spots listed.')
+@click.option('-o', '--output', type=click.Path(), default=None,
+              help='File the report is written to, instead of the output.')
+def report(profile_dir, top, output):
+    """ Ranks the stages and the hot spots of the profiles in PROFILE_DIR.
+    """
+    text = hotspot_report(profile_dir, top=top)
+    if output is None:
+        click.echo(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text)
+        click.echo('Report written to {0}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+""" Run manifests, so scripts are not run again with the same arguments.
+
+    The key of a run is the hash of the script's source code, its
+    `param_dict` and the contents of its input files. Once a run finishes,
+    its manifest (parameters, input fingerprints, output files and timing)
+    and a copy of its output files are kept in `data/interim/.runs`. Running
+    the script again with the same key restores the outputs instead of
+    running it:
+
+        from src.utils.runs import RunManifest
+
+        run = RunManifest(__file__, param_dict, inputs=[param_dict['catl']])
+        if not param_dict['force'] and run.restore():
+            return
+        output_paths = analysis(param_dict)
+        run.record(output_paths)
+
+    A batch of runs (e.g. over a grid of parameters) that stopped half-way
+    only runs the missing ones when started again. Runs can be inspected
+    and purged with:
+
+        $ python -m src.utils.runs list
+        $ python -m src.utils.runs purge --script example_script
+"""
+import os
+import time
+import json
+import click
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from src.utils.cache import CACHE_DIR, file_fingerprint, params_digest
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Default location of the manifests and outputs of the runs
+RUNS_DIR = os.path.join(PROJECT_DIR, 'data', 'interim', '.runs')
+# Entries of `param_dict` that never change the outputs of a run
+IGNORE = ('Prog_msg', 'force')
+
+logger = logging.getLogger(__name__)
+
+
+def _relpath(path):
+    """ `path` relative to the project directory, if it is inside it.
+    """
+    path = os.path.abspath(path)
+    if path.startswith(PROJECT_DIR + os.sep):
+        return os.path.relpath(path, PROJECT_DIR)
+    return path
+
+
+def _list_files(paths):
+    filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            filepaths.extend(sorted(os.path.join(root, filename)
+                                    for root, _, files in os.walk(path)
+                                    for filename in files))
+        else:
+            filepaths.append(path)
+    return filepaths
+
+
+def _copy_atomic(src_filepath, dst_filepath):
+    dirname = os.path.dirname(os.path.abspath(dst_filepath))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirname)
+    os.close(fd)
+    try:
+        shutil.copy2(src_filepath, tmp_filepath)
+    except BaseException:
+        os.remove(tmp_filepath)
+        raise
+    os.replace(tmp_filepath, dst_filepath)
+
+
+def run_key(script, param_dict, inputs=(), ignore=IGNORE,
+            cache_dir=CACHE_DIR):
+    """ Key of a run of `script`.
+
+        Parameters
+        ----------
+        script : str
+            Path to the script.
+
+        param_dict : dict
+            Arguments of the run, e.g. `vars(args)`. They must be
+            serializable to JSON, or be NumPy arrays or pandas objects.
+
+        inputs : list of str, optional
+            Paths to the input files or directories of the run. Their
+            contents, and not their paths, are hashed.
+
+        ignore : list of str, optional
+            Entries of `param_dict` that do not change the outputs.
+
+        cache_dir : str, optional
+            Directory where the hashes of unchanged files are remembered.
+
+        Returns
+        -------
+        key : str
+            Hexadecimal SHA-256 digest.
+    """
+    params = dict((key, val) for key, val in param_dict.items()
+                  if key not in ignore)
+    sha = hashlib.sha256()
+    sha.update(os.path.basename(script).encode('utf-8'))
+    sha.update(file_fingerprint(script, cache_dir=cache_dir).encode('utf-8'))
+    sha.update(params_digest(params).encode('utf-8'))
+    for path in inputs:
+        sha.update(file_fingerprint(path, cache_dir=cache_dir).encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+class RunManifest(object):
+    """ Manifest of a run of a script.
+
+        Parameters
+        ----------
+        script : str
+            Path to the script, usually `__file__`.
+
+        param_dict : dict
+            Arguments of the run.
+
+        inputs : list of str, optional
+            Paths to the input files or directories of the run.
+
+        ignore : list of str, optional
+            Entries of `param_dict` that do not change the outputs.
+
+        runs_dir : str, optional
+            Location of the manifests. Defaults to `data/interim/.runs`.
+    """
+    def __init__(self, script, param_dict, inputs=(), ignore=IGNORE,
+                 runs_dir=RUNS_DIR):
+        self.script = os.path.splitext(os.path.basename(script))[0]
+        self.params = dict((key, val) for key, val in param_dict.items()
+                           if key not in ignore)
+        self.inputs = list(inputs)
+        self.key = run_key(script, param_dict, inputs=self.inputs,
+                           ignore=ignore)
+        self.run_dir = os.path.join(runs_dir, self.script, self.key)
+        self.manifest_path = os.path.join(self.run_dir, 'manifest.json')
+        self.started = time.time()
+
+    def load(self):
+        """ Contents of the manifest, or `None` if the run never finished.
+        """
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def restore(self):
+        """ Restores the outputs of a finished run with the same key.
+
+            Outputs that are already in place are left untouched.
+
+            Returns
+            -------
+            restored : bool
+                Whether the run had finished and its outputs were restored.
+                If not, the script has to run.
+        """
+        manifest = self.load()
+        if manifest is None:
+            return False
+        stored = [os.path.join(self.run_dir, output['stored'])
+                  for output in manifest['outputs']]
+        if not all(os.path.exists(path) for path in stored):
+            logger.warning('%s: outputs of run %s are missing, running again',
+                           self.script, self.key[:12])
+            return False
+        for output, stored_path in zip(manifest['outputs'], stored):
+            path = os.path.join(PROJECT_DIR, output['path'])
+            if os.path.exists(path) and \
+                    file_fingerprint(path) == output['fingerprint']:
+                continue
+            _copy_atomic(stored_path, path)
+        os.utime(self.manifest_path, None)
+        logger.info('%s: restored %d outputs of run %s (%.1fs saved)',
+                    self.script, len(stored), self.key[:12],
+                    manifest['seconds'])
+
+        return True
+
+    def record(self, outputs, seconds=None):
+        """ Records a finished run, with a copy of its `outputs`.
+
+            Parameters
+            ----------
+            outputs : list of str
+                Paths to the output files or directories of the run.
+
+            seconds : float, optional
+                Duration of the run. Defaults to the time since the
+                manifest was created.
+
+            Returns
+            -------
+            manifest : dict
+                Contents of the manifest.
+        """
+        if seconds is None:
+            seconds = time.time() - self.started
+        ## Outputs of an earlier, interrupted attempt are replaced
+        if os.path.isdir(self.run_dir):
+            shutil.rmtree(self.run_dir)
+        entries = []
+        for idx, filepath in enumerate(_list_files(outputs)):
+            stored = os.path.join('outputs', str(idx),
+                                  os.path.basename(filepath))
+            _copy_atomic(filepath, os.path.join(self.run_dir, stored))
+            entries.append({'path': _relpath(filepath),
+                            'stored': stored,
+                            'fingerprint': file_fingerprint(filepath),
+                            'size': os.path.getsize(filepath)})
+        manifest = {'script': self.script,
+                    'key': self.key,
+                    'params': self.params,
+                    'inputs': dict((_relpath(path), file_fingerprint(path))
+                                   for path in self.inputs),
+                    'outputs': entries,
+                    'started': self.started,
+                    'seconds': seconds}
+        ## Written last, so that only complete runs have a manifest
+        fd, tmp_filepath = tempfile.mkstemp(dir=self.run_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True, default=repr)
+        os.replace(tmp_filepath, self.manifest_path)
+        logger.info('%s: recorded run %s (%d outputs, %.1fs)', self.script,
+                    self.key[:12], len(entries), seconds)
+
+        return manifest
+
+
+def list_runs(script=None, runs_dir=RUNS_DIR):
+    """ Manifests of the finished runs, with their `last_used` time.
+    """
+    runs = []
+    if not os.path.isdir(runs_dir):
+        return runs
+    scripts = sorted(os.listdir(runs_dir)) if script is None else [script]
+    for name in scripts:
+        script_dir = os.path.join(runs_dir, name)
+        if not os.path.isdir(script_dir):
+            continue
+        for key in sorted(os.listdir(script_dir)):
+            manifest_path = os.path.join(script_dir, key, 'manifest.json')
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                manifest['last_used'] = os.path.getmtime(manifest_path)
+            except (IOError, OSError, ValueError):
+                continue
+            runs.append(manifest)
+
+    return runs
+
+
+def purge(script=None, older_than=None, runs_dir=RUNS_DIR):
+    """ Removes runs, with their outputs.
+
+        Parameters
+        ----------
+        script : str, optional
+            Only remove the runs of this script (name without extension).
+
+        older_than : float, optional
+            Only remove the runs not used in this many days.
+
+        Returns
+        -------
+        removed : list of dict
+            Manifests of the removed runs.
+    """
+    removed = []
+    for run in list_runs(script=script, runs_dir=runs_dir):
+        if older_than is not None and \
+                time.time() - run['last_used'] < older_than * 86400:
+            continue
+        shutil.rmtree(os.path.join(runs_dir, run['script'], run['key']))
+        removed.append(run)
+
+    return removed
+
+
+@click.group()
+@click.option('--runs-dir', type=click.Path(), default=RUNS_DIR,
+              show_default=True, help='Location of the runs.')
+@click.pass_context
+def main(ctx, runs_dir):
+    """ Inspects and purges the recorded runs of the scripts.
+    """
+    ctx.obj = runs_dir
+
+
+@main.command('list')
+@click.option('--script', default=None, help='Only list this script.')
+@click.pass_obj
+def list_command(runs_dir, script):
+    """ Lists the recorded runs.
+    """
+    runs = list_runs(script=script, runs_dir=runs_dir)
+    for run in sorted(runs, key=lambda run: run['last_used']):
+        click.echo('{0}  {1:<25} {2:>4} outputs  {3:>8.1f}s  {4}'.format(
+            run['key'][:12], run['script'], len(run['outputs']),
+            run['seconds'], json.dumps(run['params'], sort_keys=True,
+                                       default=repr)))
+    click.echo('{0} runs'.format(len(runs)))
+
+
+@main.command('purge')
+@click.option('--script', default=None, help='Only purge this script.')
+@click.option('--older-than', type=float, default=None,
+              help='Only purge the runs not used in this many days.')
+@click.pass_obj
+def purge_command(runs_dir, script, older_than):
+    """ Removes recorded runs and their outputs.
+    """
+    removed = purge(script=script, older_than=older_than, runs_dir=runs_dir)
+    click.echo('Removed {0} runs'.format(len(removed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+""" Density images of catalogues too large to scatter-plot.
+
+    Points are counted in a 2D grid of bins, chunk by chunk, so the whole
+    catalogue never needs to be in memory, and the grid is drawn as a single
+    image. The time to draw, and the size of the PDF, depend on the number of
+    bins and not on the number of points:
+
+        from src.visualization.density import bin_table, plot_density
+
+        grid = bin_table('data/processed/catl.parquet', 'ra', 'dec',
+                         bins=(1024, 512))
+        plot_density(ax, grid)
+
+    Tables are read in chunks of rows: CSV files with `pandas`, and Parquet,
+    Feather and HDF5 files with `src.data.io` (memory-mapped when possible).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data.io import FORMATS, read_columns
+
+
+class DensityGrid(object):
+    """ Counts (or sums of weights) of points in a regular 2D grid.
+
+        Parameters
+        ----------
+        x_range, y_range : tuple
+            `(min, max)` of each axis. Points outside are ignored.
+
+        bins : int or tuple, optional
+            Number of bins of each axis.
+    """
+    def __init__(self, x_range, y_range, bins=512):
+        if np.isscalar(bins):
+            bins = (bins, bins)
+        self.nx, self.ny = int(bins[0]), int(bins[1])
+        self.x_range = tuple(float(val) for val in x_range)
+        self.y_range = tuple(float(val) for val in y_range)
+        for low, high in [self.x_range, self.y_range]:
+            if not high > low:
+                raise ValueError('empty range ({0}, {1})!'.format(low, high))
+        self.counts = np.zeros((self.nx, self.ny))
+        self.n_points = 0
+
+    @property
+    def extent(self):
+        """ `(xmin, xmax, ymin, ymax)`, as used by `imshow`.
+        """
+        return self.x_range + self.y_range
+
+    def _bin_index(self, values, value_range, n_bins):
+        low, high = value_range
+        ## NaNs and points outside of the range are masked out
+        with np.errstate(invalid='ignore'):
+            index = ((values - low) * (n_bins / (high - low))).astype(np.intp)
+            inside = (values >= low) & (values <= high)
+        ## Points on the upper edge go to the last bin, as in `histogram2d`
+        return np.minimum(index, n_bins - 1), inside
+
+    def add(self, x, y, weights=None):
+        """ Adds the points `(x, y)`, with `weights` if given.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        ix, x_inside = self._bin_index(x, self.x_range, self.nx)
+        iy, y_inside = self._bin_index(y, self.y_range, self.ny)
+        inside = x_inside & y_inside
+        flat_index = ix[inside] * self.ny + iy[inside]
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)[inside]
+        self.counts += np.bincount(flat_index, weights=weights,
+                                   minlength=self.nx * self.ny).reshape(
+                                       self.nx, self.ny)
+        self.n_points += len(flat_index)
+        return self
+
+
+def bin_points(x, y, x_range=None, y_range=None, bins=512, weights=None):
+    """ `DensityGrid` of the points `(x, y)` held in memory.
+    """
+    x_range = (np.nanmin(x), np.nanmax(x)) if x_range is None else x_range
+    y_range = (np.nanmin(y), np.nanmax(y)) if y_range is None else y_range
+    return DensityGrid(x_range, y_range, bins=bins).add(x, y, weights=weights)
+
+
+def iter_columns(filepath, columns, chunksize=1000000):
+    """ Iterates over `columns` of a table, `chunksize` rows at a time.
+
+        Yields dictionaries of NumPy arrays.
+    """
+    if os.path.splitext(filepath)[1].lower() not in FORMATS:
+        for chunk in pd.read_csv(filepath, usecols=columns,
+                                 chunksize=chunksize):
+            yield dict((col, chunk[col].to_numpy()) for col in columns)
+        return
+    start = 0
+    while True:
+        cols = read_columns(filepath, columns=columns,
+                            rows=(start, start + chunksize), memory_map=True)
+        n_rows = len(cols[columns[0]])
+        if n_rows == 0:
+            return
+        yield cols
+        if n_rows < chunksize:
+            return
+        start += chunksize
+
+
+def _table_range(filepath, columns, chunksize):
+    ranges = dict((col, [np.inf, -np.inf]) for col in columns)
+    for cols in iter_columns(filepath, columns, chunksize):
+        for col in columns:
+            if len(cols[col]):
+                ranges[col][0] = min(ranges[col][0], np.nanmin(cols[col]))
+                ranges[col][1] = max(ranges[col][1], np.nanmax(cols[col]))
+    return ranges
+
+
+def bin_table(filepath, x, y, x_range=None, y_range=None, bins=512,
+              weights=None, chunksize=1000000):
+    """ `DensityGrid` of the columns `x` and `y` of a table, read in chunks.
+
+        Parameters
+        ----------
+        filepath : str
+            Path to a CSV, Parquet, Feather or HDF5 file.
+
+        x, y : str
+            Columns of the axes.
+
+        x_range, y_range : tuple, optional
+            `(min, max)` of each axis. When missing, the table is read once
+            more to find them.
+
+        bins : int or tuple, optional
+            Number of bins of each axis.
+
+        weights : str, optional
+            Column with the weight of each point.
+
+        chunksize : int, optional
+            Number of rows read at a time.
+
+        Returns
+        -------
+        grid : `DensityGrid`
+            Binned points.
+    """
+    if x_range is None or y_range is None:
+        ranges = _table_range(filepath, [col for col, col_range in
+                                         [(x, x_range), (y, y_range)]
+                                         if col_range is None], chunksize)
+        x_range = ranges[x] if x_range is None else x_range
+        y_range = ranges[y] if y_range is None else y_range
+    grid = DensityGrid(x_range, y_range, bins=bins)
+    columns = [x, y] + ([] if weights is None else [weights])
+    for cols in iter_columns(filepath, columns, chunksize):
+        grid.add(cols[x], cols[y],
+                 weights=None if weights is None else cols[weights])
+
+    return grid
+
+
+def plot_density(ax, grid, log=True, cmap='viridis', colorbar=False,
+                 **kwargs):
+    """ Draws `grid` on the axes `ax` as an image.
+
+        Parameters
+        ----------
+        ax : `matplotlib.axes.Axes`
+            Axes to draw on.
+
+        grid : `DensityGrid`
+            Binned points.
+
+        log : bool, optional
+            Logarithmic color scale. Empty bins are left blank.
+
+        cmap : str, optional
+            Colormap.
+
+        colorbar : bool, optional
+            Adds a colorbar to the figure of `ax`.
+
+        kwargs
+            Passed to `imshow`.
+
+        Returns
+        -------
+        image : `matplotlib.image.AxesImage`
+            The image.
+    """
+    from matplotlib.colors import LogNorm, Normalize
+
+    counts = np.ma.masked_less_equal(grid.counts.T, 0) if log \
+        else grid.counts.T
+    if log and counts.count():
+        norm = LogNorm(vmin=counts.min(), vmax=counts.max())
+    else:
+        norm = Normalize()
+    kwargs.setdefault('interpolation', 'nearest')
+    kwargs.setdefault('aspect', 'auto')
+    image = ax.imshow(counts, origin='lower', extent=grid.extent, norm=norm,
+                      cmap=cmap, **kwargs)
+    if colorbar:
+        ax.figure.colorbar(image, ax=ax)
+
+    return image
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+""" Registry of the figures of the project.
+
+    Figures are functions that draw on a `matplotlib.figure.Figure`, and are
+    registered together with the data files they read, in the modules of
+    `src/visualization/figures`:
+
+        from src.visualization.registry import register_figure
+
+        @register_figure(inputs=['data/processed/catl.csv'], figsize=(6, 4))
+        def mass_function(fig, catl_path):
+            catl_df = pd.read_csv(catl_path)
+            ax = fig.add_subplot(111)
+            ax.hist(catl_df['logm'], bins=50)
+            ax.set_xlabel(r'$\\log M_{\\odot}$')
+
+    `python -m src.visualization.visualize` imports those modules with
+    `load_figures` before rendering the figures.
+"""
+import os
+import pkgutil
+import functools
+import importlib
+from collections import OrderedDict
+
+# Project directory
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, os.pardir))
+# Package of the modules declaring the figures
+FIGURES_PACKAGE = 'src.visualization.figures'
+
+# Registered figures, by name
+FIGURES = OrderedDict()
+
+
+def register_figure(func=None, name=None, inputs=(), formats=('png', 'pdf'),
+                    figsize=None, dpi=300):
+    """ Registers `func` as a figure.
+
+        Parameters
+        ----------
+        func : callable
+            Function `func(fig, *inputs)` that draws on the
+            `matplotlib.figure.Figure` `fig`.
+
+        name : str, optional
+            Name of the figure, and of its files. Defaults to the name of
+            `func`.
+
+        inputs : list of str, optional
+            Paths to the files or directories the figure reads, relative to
+            the project directory. They are passed to `func` as absolute
+            paths, and their contents are part of the cache key.
+
+        formats : list of str, optional
+            Formats the figure is saved to.
+
+        figsize : tuple, optional
+            Size of the figure, in inches.
+
+        dpi : int, optional
+            Resolution of raster formats.
+    """
+    if func is None:
+        return functools.partial(register_figure, name=name, inputs=inputs,
+                                 formats=formats, figsize=figsize, dpi=dpi)
+    name = func.__name__ if name is None else name
+    FIGURES[name] = {'func': func,
+                     'inputs': [os.path.join(PROJECT_DIR, path)
+                                for path in inputs],
+                     'formats': list(formats),
+                     'figsize': figsize,
+                     'dpi': dpi}
+    return func
+
+
+def load_figures(package=FIGURES_PACKAGE):
+    """ Imports every module of `package`, so that the figures they declare
+        are registered.
+
+        Returns the registered figures.
+    """
+    package_module = importlib.import_module(package)
+    for module_info in pkgutil.iter_modules(package_module.__path__):
+        importlib.import_module('{0}.{1}'.format(package, module_info.name))
+
+    return FIGURES
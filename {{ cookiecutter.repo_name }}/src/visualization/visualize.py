@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+""" Figures of the project, rendered in parallel and cached.
+
+    Figures are functions that draw on a `matplotlib.figure.Figure`, and are
+    registered together with the data files they read, in the modules of
+    `src/visualization/figures` (see `src.visualization.registry`):
+
+        from src.visualization.registry import register_figure
+
+        @register_figure(inputs=['data/processed/catl.csv'], figsize=(6, 4))
+        def mass_function(fig, catl_path):
+            catl_df = pd.read_csv(catl_path)
+            ax = fig.add_subplot(111)
+            ax.hist(catl_df['logm'], bins=50)
+            ax.set_xlabel(r'$\\log M_{\\odot}$')
+
+    `python -m src.visualization.visualize` imports those modules, renders
+    every figure in its own worker process, and saves it to
+    `reports/figures` in each format (PNG and PDF by default) from the same
+    figure, without drawing it again.
+    Figures whose input files, code and options did not change since they
+    were last rendered are skipped.
+
+    Text is typeset with LaTeX when it is available. `--preview` renders
+    PNG files only, with matplotlib's mathtext and a lower resolution, to
+    `reports/figures/preview`, which is much faster.
+"""
+import os
+import json
+import time
+import click
+import shutil
+import hashlib
+import inspect
+import logging
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.utils.cache import file_fingerprint
+from src.utils.logs import (executor_kwargs, flush_on_error, setup_logging,
+                            throughput)
+from src.utils.profiling import profile_stage, profiled
+from src.visualization.registry import FIGURES, PROJECT_DIR, load_figures
+
+# Directory of the figures
+FIGURES_DIR = os.path.join(PROJECT_DIR, 'reports', 'figures')
+# File with the keys of the rendered figures
+CACHE_FILE = '.figures_cache.json'
+
+logger = logging.getLogger(__name__)
+
+
+def has_latex():
+    """ Whether LaTeX is available to typeset the text of the figures.
+    """
+    return all(shutil.which(tool) is not None for tool in ['latex', 'dvipng'])
+
+
+def _options(name, preview, usetex):
+    figure = FIGURES[name]
+    if preview:
+        return {'formats': ['png'], 'dpi': 72, 'usetex': False,
+                'figsize': figure['figsize']}
+    return {'formats': figure['formats'], 'dpi': figure['dpi'],
+            'usetex': usetex, 'figsize': figure['figsize']}
+
+
+def figure_key(name, options):
+    """ Hash of the input files, the code and the options of a figure.
+    """
+    figure = FIGURES[name]
+    sha = hashlib.sha256()
+    sha.update(name.encode('utf-8'))
+    try:
+        source = inspect.getsource(figure['func'])
+    except (IOError, OSError, TypeError):
+        source = figure['func'].__code__.co_code.hex()
+    sha.update(source.encode('utf-8'))
+    for path in figure['inputs']:
+        sha.update(file_fingerprint(path).encode('utf-8'))
+    sha.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def render_figure(name, output_dir, options):
+    """ Draws the figure `name` once and saves it in every format.
+
+        Returns the paths to the files of the figure.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    figure = FIGURES[name]
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with matplotlib.rc_context({'text.usetex': options['usetex']}):
+        fig = Figure(figsize=options['figsize'])
+        figure['func'](fig, *figure['inputs'])
+        filepaths = []
+        for fmt in options['formats']:
+            filepath = os.path.join(output_dir, '{0}.{1}'.format(name, fmt))
+            ## Saved to a temporary file, so a failed figure does not leave
+            ## a truncated file behind
+            fd, tmp_filepath = tempfile.mkstemp(dir=output_dir,
+                                                suffix='.' + fmt)
+            os.close(fd)
+            try:
+                fig.savefig(tmp_filepath, format=fmt, dpi=options['dpi'])
+            except BaseException:
+                os.remove(tmp_filepath)
+                raise
+            os.replace(tmp_filepath, filepath)
+            filepaths.append(filepath)
+
+    return filepaths
+
+
+def _render_task(task):
+    """ Renders one figure in a worker, catching its errors so that one bad
+        figure does not stop the other ones.
+    """
+    name, output_dir, options = task
+    start = time.time()
+    try:
+        ## Workers that do not inherit the registry (e.g. spawned ones)
+        ## import the modules of the figures themselves
+        if name not in FIGURES:
+            load_figures()
+        ## Figures are drawn in the workers, so they are profiled there
+        with profile_stage('figure.' + name):
+            render_figure(name, output_dir, options)
+        error = None
+    except Exception as err:
+        error = '{0}: {1}'.format(type(err).__name__, err)
+    return name, time.time() - start, error
+
+
+def _load_cache(output_dir):
+    filepath = os.path.join(output_dir, CACHE_FILE)
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _save_cache(output_dir, cache):
+    fd, tmp_filepath = tempfile.mkstemp(dir=output_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_filepath, os.path.join(output_dir, CACHE_FILE))
+
+
+def build_figures(names=None, output_dir=FIGURES_DIR, preview=False,
+                  force=False, jobs=None):
+    """ Renders the figures whose inputs, code or options changed.
+
+        Parameters
+        ----------
+        names : list of str, optional
+            Figures to render. All of them by default.
+
+        output_dir : str, optional
+            Directory of the figures. Previews go to its `preview`
+            subdirectory.
+
+        preview : bool, optional
+            Fast PNG previews, typeset with mathtext.
+
+        force : bool, optional
+            Render the figures even if they did not change.
+
+        jobs : int, optional
+            Number of worker processes. Defaults to the number of cores.
+
+        Returns
+        -------
+        results : dict
+            `{name: (status, seconds, error)}`, where `status` is 'cached',
+            'rendered' or 'failed'.
+    """
+    names = list(FIGURES) if not names else list(names)
+    unknown = [name for name in names if name not in FIGURES]
+    if unknown:
+        raise ValueError('unknown figures: {0}'.format(', '.join(unknown)))
+    if preview:
+        output_dir = os.path.join(output_dir, 'preview')
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    usetex = has_latex()
+    if not usetex and not preview:
+        logger.warning('LaTeX is not available, using mathtext')
+
+    cache = _load_cache(output_dir)
+    results = OrderedDict()
+    tasks = []
+    keys = {}
+    for name in names:
+        options = _options(name, preview, usetex)
+        keys[name] = figure_key(name, options)
+        outputs = [os.path.join(output_dir, '{0}.{1}'.format(name, fmt))
+                   for fmt in options['formats']]
+        if not force and cache.get(name) == keys[name] and \
+                all(os.path.exists(path) for path in outputs):
+            results[name] = ('cached', 0., None)
+        else:
+            tasks.append((name, output_dir, options))
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 **executor_kwargs()) as pool:
+            futures = [pool.submit(_render_task, task) for task in tasks]
+            for future in as_completed(futures):
+                name, seconds, error = future.result()
+                if error is None:
+                    cache[name] = keys[name]
+                    results[name] = ('rendered', seconds, None)
+                else:
+                    cache.pop(name, None)
+                    results[name] = ('failed', seconds, error)
+        _save_cache(output_dir, cache)
+
+    return results
+
+
+@click.command()
+@click.argument('names', nargs=-1)
+@click.option('--output-dir', type=click.Path(), default=FIGURES_DIR,
+              show_default=True, help='Directory of the figures.')
+@click.option('--preview', is_flag=True,
+              help='Fast, low-resolution PNG previews typeset with mathtext.')
+@click.option('--force', is_flag=True,
+              help='Render the figures even if they did not change.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help='Number of worker processes [default: number of cores].')
+@flush_on_error
+@profiled('visualize')
+def main(names, output_dir, preview, force, jobs):
+    """ Renders the figures NAMES (all of them by default) declared in the
+        modules of `src/visualization/figures` that changed since they were
+        last rendered.
+    """
+    try:
+        load_figures()
+    except Exception as err:
+        raise click.ClickException('could not load the figures: {0}: '
+                                   '{1}'.format(type(err).__name__, err))
+    if not FIGURES:
+        logger.warning('no figures are registered')
+        return
+    try:
+        results = build_figures(names, output_dir=output_dir,
+                                preview=preview, force=force, jobs=jobs)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint='NAMES')
+    ## Logged with `throughput`, so the lines are not rate-limited
+    for name, (status, seconds, error) in results.items():
+        logger.info('%-30s %-9s %7.2fs%s', name, status, seconds,
+                    '' if error is None else '  ' + error,
+                    extra=throughput('visualize.' + name, seconds=seconds))
+    failed = [name for name, res in results.items() if res[0] == 'failed']
+    if failed:
+        raise click.ClickException('{0} of {1} figures failed'.format(
+            len(failed), len(results)))
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    main()
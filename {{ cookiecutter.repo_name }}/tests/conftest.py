@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.abspath(
+                os.path.join(
+                    __file__,
+                    os.pardir,
+                    os.pardir
+                )
+            )
+
+# `src` is importable however pytest is started
+sys.path.insert(0, PROJECT_DIR)
+
+
+@pytest.fixture
+def features():
+    """
+    Registry of the features, emptied for the test and restored after it.
+    """
+    pytest.importorskip('pandas')
+    from src.features.registry import FEATURES
+
+    saved = FEATURES.copy()
+    FEATURES.clear()
+    yield FEATURES
+    FEATURES.clear()
+    FEATURES.update(saved)
+
+
+@pytest.fixture
+def figures():
+    """
+    Registry of the figures, emptied for the test and restored after it.
+    """
+    pytest.importorskip('matplotlib')
+    from src.visualization.registry import FIGURES
+
+    saved = FIGURES.copy()
+    FIGURES.clear()
+    yield FIGURES
+    FIGURES.clear()
+    FIGURES.update(saved)
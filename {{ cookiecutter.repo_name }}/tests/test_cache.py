@@ -0,0 +1,47 @@
+import pytest
+
+
+def test_stage_cache(tmpdir):
+    pytest.importorskip('click')
+    from src.utils.cache import cached_stage, list_entries
+
+    cache_dir = str(tmpdir.join('cache'))
+    input_path = tmpdir.join('input.txt')
+    input_path.write('abc')
+    calls = []
+
+    @cached_stage(inputs=['path'], cache_dir=cache_dir)
+    def stage(path, n):
+        calls.append(n)
+        with open(path) as f:
+            return f.read() * n
+
+    assert stage(str(input_path), 2) == stage(str(input_path), 2)
+    assert calls == [2]
+    assert len(list_entries(cache_dir)) == 1
+
+
+def test_cache_key():
+    pytest.importorskip('pandas')
+    import numpy as np
+    import pandas as pd
+    from src.utils.cache import params_digest
+
+    x, y = np.zeros(10000), np.zeros(10000)
+    y[5000] = 1
+    # Same repr, different contents
+    assert repr(x) == repr(y)
+    assert params_digest({'x': x}) != params_digest({'x': y})
+    assert params_digest({'x': x}) == params_digest({'x': x.copy()})
+    assert params_digest({'x': x}) != params_digest({'x': x.astype('f4')})
+
+    df = pd.DataFrame({'x': x})
+    assert params_digest({'df': df}) == params_digest({'df': df.copy()})
+    assert params_digest({'df': df}) != \
+        params_digest({'df': pd.DataFrame({'x': y})})
+    assert params_digest({'df': df}) != \
+        params_digest({'df': df.rename(columns={'x': 'z'})})
+    assert params_digest({'n': np.int64(3)}) == params_digest({'n': 3})
+
+    with pytest.raises(TypeError):
+        params_digest({'f': object()})
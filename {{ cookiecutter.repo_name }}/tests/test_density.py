@@ -0,0 +1,23 @@
+import pytest
+
+
+def test_density(tmpdir):
+    pytest.importorskip('matplotlib')
+    import numpy as np
+    import pandas as pd
+    from src.visualization.density import bin_table
+
+    filepath = str(tmpdir.join('catl.csv'))
+    rng = np.random.RandomState(0)
+    x, y = rng.normal(size=10000), rng.uniform(size=10000)
+    x[:10] = np.nan
+    pd.DataFrame(dict(x=x, y=y)).to_csv(filepath, index=False)
+
+    grid = bin_table(filepath, 'x', 'y', y_range=(0, 1), bins=(20, 10),
+                     chunksize=999)
+
+    expected = np.histogram2d(x[10:], y[10:], bins=(20, 10),
+                              range=[grid.x_range, (0, 1)])[0]
+    assert np.array_equal(grid.counts, expected)
+    # Points with missing coordinates are not counted
+    assert grid.n_points == 9990
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def test_feature_registry(features, tmpdir):
+    from src.features.build_features import build_features
+    from src.features.registry import register_feature, resolve
+    from src.features.store import FeatureStore
+
+    input_filepath = str(tmpdir.join('catl.csv'))
+    store_dir = str(tmpdir.join('features'))
+    with open(input_filepath, 'w') as f:
+        f.write('g,r\n' + ''.join('{0},{1}\n'.format(idx, 2 * idx)
+                                  for idx in range(10)))
+    calls = []
+
+    @register_feature(keep=False)
+    def g_r(g, r):
+        calls.append(len(g))
+        return g - r
+
+    @register_feature
+    def g_r_squared(g_r):
+        return g_r ** 2
+
+    @register_feature(name='g_r_abs', inputs=['g_r'])
+    def absolute(values):
+        return values.abs()
+
+    timings = {}
+    n_rows = build_features(input_filepath, FeatureStore(store_dir),
+                            block_size=4, timings=timings)
+
+    assert n_rows == 10 and calls == [4, 4, 2]
+    assert sorted(timings) == ['g_r', 'g_r_abs', 'g_r_squared']
+    df = FeatureStore(store_dir).to_frame()
+    assert list(df.columns) == ['g_r_squared', 'g_r_abs']
+    assert df['g_r_abs'].tolist() == list(range(10))
+    with pytest.raises(ValueError):
+        resolve(['g'])
+
+
+def test_build_features_types(tmpdir):
+    pytest.importorskip('pandas')
+    pytest.importorskip('dotenv')
+    from src.features.store import FeatureStore
+
+    input_filepath = str(tmpdir.join('catl.csv'))
+    store_dir = str(tmpdir.join('features'))
+    # Integers in the first block of rows, and a missing value later
+    with open(input_filepath, 'w') as f:
+        f.write('g,kind\n1,a\n2,b\n3,c\n,dd\n')
+
+    subprocess.check_call([sys.executable, '-m',
+                           'src.features.build_features', input_filepath,
+                           store_dir, '--block-size', '2', '--keep-column',
+                           'g', '--keep-column', 'kind'],
+                          cwd=PROJECT_DIR)
+
+    store = FeatureStore(store_dir)
+    assert store['g'].tolist()[:3] == [1., 2., 3.]
+    assert store['kind'].tolist() == ['a', 'b', 'c', 'dd']
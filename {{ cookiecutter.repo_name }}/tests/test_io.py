@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'feather', 'h5'])
+def test_columnar_io(tmpdir, extension):
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('h5py')
+    import numpy as np
+    import pandas as pd
+    from src.data.io import read_columns, read_table, write_table
+
+    filepath = str(tmpdir.join('table.' + extension))
+    df = pd.DataFrame({'x': np.arange(10.), 'n': np.arange(10)})
+    write_table(df, filepath)
+
+    assert read_table(filepath).equals(df)
+    cols = read_columns(filepath, columns=['x'], rows=(2, 5),
+                        memory_map=True)
+    assert list(cols) == ['x']
+    assert cols['x'].tolist() == [2., 3., 4.]
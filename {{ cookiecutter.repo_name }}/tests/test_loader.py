@@ -0,0 +1,35 @@
+import os
+import time
+
+import pytest
+
+
+def test_model_cache(tmpdir):
+    pytest.importorskip('joblib')
+    import numpy as np
+    from src.models.loader import ModelCache, save_model
+
+    models_dir = str(tmpdir)
+    for idx in range(4):
+        save_model({'coefs': np.full(100000, float(idx))},
+                   os.path.join(models_dir, 'm{0}.joblib'.format(idx)))
+    size = os.path.getsize(os.path.join(models_dir, 'm0.joblib'))
+    cache = ModelCache(max_models=3, max_bytes=int(2.5 * size),
+                       models_dir=models_dir)
+
+    model = cache.get('m0.joblib')
+    assert isinstance(model['coefs'], np.memmap)
+    assert cache.get('m0.joblib') is model
+    cache.get('m1.joblib')
+    cache.get('m0.joblib')
+    cache.get('m2.joblib')
+    # The least recently used model is evicted to fit in `max_bytes`
+    assert 'm1.joblib' not in cache and 'm0.joblib' in cache
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 1)
+    assert stats['models'] == 2 and stats['bytes'] <= 2.5 * size
+
+    # Models saved again are loaded again
+    time.sleep(0.01)
+    save_model({'coefs': np.zeros(3)}, os.path.join(models_dir, 'm0.joblib'))
+    assert cache.get('m0.joblib')['coefs'].tolist() == [0., 0., 0.]
@@ -0,0 +1,47 @@
+import json
+import logging
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def work(idx):
+    from src.utils.logs import throughput
+
+    logger = logging.getLogger('work')
+    for chunk in range(1000):
+        logger.info('chunk %d', chunk)
+    logger.info('done %d', idx, extra=throughput(
+        'work', rows=1000, n_bytes=2 ** 20, seconds=0.5))
+
+
+def test_logging(tmpdir):
+    pytest.importorskip('click')
+    from src.utils.logs import executor_kwargs, setup_logging, stop_logging
+
+    log_filepath = tmpdir.join('logs', 'pipeline.jsonl')
+    setup_logging(json_filepath=str(log_filepath))
+    try:
+        with ProcessPoolExecutor(2, **executor_kwargs()) as pool:
+            list(pool.map(work, range(4)))
+    finally:
+        stop_logging()
+
+    records = [json.loads(line) for line in log_filepath.readlines()]
+    # Repeated messages are rate limited, but not the throughput records
+    chunks = [rec for rec in records if rec['message'].startswith('chunk')]
+    assert 0 < len(chunks) < 100
+    done = [rec for rec in records if rec['message'].startswith('done')]
+    assert len(done) == 4
+    assert all(rec['stage'] == 'work' and rec['rows_per_s'] == 2000 and
+               rec['mb_per_s'] == 2 for rec in done)
+
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'src.utils.logs', 'throughput',
+         str(log_filepath)], cwd=PROJECT_DIR).decode()
+    assert output.splitlines()[1].split() == [
+        'work', '4', '4000', '4.0', '2.00', '2000', '2.00']
@@ -0,0 +1,84 @@
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def test_make_dataset_streaming(tmpdir):
+    pytest.importorskip('pandas')
+    pytest.importorskip('dotenv')
+    raw_path = tmpdir.join('raw.csv')
+    raw_path.write('a,b\n' + ''.join('{0},{1}\n'.format(i, 2 * i)
+                                     for i in range(10)))
+    # Missing directories of the output are created
+    processed_path = tmpdir.join('processed', 'catl', 'processed.csv')
+
+    subprocess.check_call([sys.executable, '-m', 'src.data.make_dataset',
+                           str(raw_path), str(processed_path),
+                           '--chunksize', '3'],
+                          cwd=PROJECT_DIR)
+
+    assert processed_path.read() == raw_path.read()
+
+
+@pytest.fixture
+def raw_dir(tmpdir):
+    raw_dir = tmpdir.mkdir('raw')
+    # Larger files first, so that they finish last
+    for idx, n_rows in enumerate([20000, 2000, 200, 20]):
+        raw_dir.join('{0}.csv'.format(idx)).write(
+            'a,b\n' + ''.join('{0},{1}\n'.format(row, idx)
+                              for row in range(n_rows)))
+    raw_dir.join('bad.csv').write('a,b\n1,2\n"3')
+    return raw_dir
+
+
+def test_make_dataset_jobs(raw_dir, tmpdir):
+    pytest.importorskip('pandas')
+    pytest.importorskip('dotenv')
+    output_dir = tmpdir.join('processed')
+
+    proc = subprocess.run([sys.executable, '-m', 'src.data.make_dataset',
+                           str(raw_dir), str(output_dir), '--jobs', '3'],
+                          cwd=PROJECT_DIR, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    assert proc.returncode == 1
+    assert '1 of 5 files failed' in proc.stderr
+    assert 'failed to process {0}'.format(raw_dir.join('bad.csv')) in \
+        proc.stderr
+    assert 'processed 4 files (22220 rows' in proc.stderr
+    # The queued log records are written before the error
+    assert proc.stderr.index('processed 4 files') < \
+        proc.stderr.index('1 of 5 files failed')
+    assert sorted(path.basename for path in output_dir.listdir()) == [
+        '0.csv', '1.csv', '2.csv', '3.csv']
+    for idx in range(4):
+        assert output_dir.join('{0}.csv'.format(idx)).read() == \
+            raw_dir.join('{0}.csv'.format(idx)).read()
+
+
+def test_process_files(raw_dir, tmpdir):
+    pytest.importorskip('pandas')
+    from src.data.make_dataset import process_dataset, process_files
+
+    output_dir = tmpdir.mkdir('processed')
+    pairs = [(str(raw_dir.join('{0}.csv'.format(idx))),
+              str(output_dir.join('{0}.csv'.format(idx))))
+             for idx in [0, 1, 'bad', 2, 'missing', 3]]
+    results = process_files(pairs, jobs=3)
+
+    assert [res.input_filepath for res in results] == \
+        [pair[0] for pair in pairs]
+    assert [res.error is None for res in results] == \
+        [True, True, False, True, False, True]
+    assert [res.n_rows for res in results] == [20000, 2000, 0, 200, 0, 20]
+    assert results[4].n_bytes == 0
+
+    # The header is written even if every row is dropped
+    output_filepath = str(output_dir.join('empty.csv'))
+    assert process_dataset(pairs[0][0], output_filepath,
+                           transforms=[lambda df: df[df.a < 0]]) == (0, 0)
+    with open(output_filepath) as f:
+        assert f.read() == 'a,b\n'
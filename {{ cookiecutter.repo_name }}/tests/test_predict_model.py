@@ -0,0 +1,54 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+
+import pytest
+
+
+class Model(object):
+    def predict(self, X):
+        return X.sum(axis=1)
+
+
+@pytest.fixture
+def port():
+    """
+    Port of a prediction server of `Model`, stopped after the test.
+    """
+    pytest.importorskip('numpy')
+    from src.models.predict_model import make_server
+
+    server = make_server(Model(), port=0, max_batch_size=64, max_wait=0.05)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+
+
+def request(port, method, path, body=None):
+    conn = HTTPConnection('127.0.0.1', port)
+    conn.request(method, path, body=body)
+    return conn.getresponse()
+
+
+@pytest.mark.filterwarnings('ignore:overflow:RuntimeWarning')
+def test_prediction_server(port):
+    def post(idx):
+        body = json.dumps({'instances': [[idx, 1.], [idx, 2.]]})
+        response = request(port, 'POST', '/predict', body)
+        return json.loads(response.read())['predictions']
+
+    with ThreadPoolExecutor(16) as pool:
+        predictions = list(pool.map(post, range(32)))
+    assert predictions == [[idx + 1., idx + 2.] for idx in range(32)]
+
+    assert request(port, 'POST', '/predict', '{}').status == 400
+    # Predictions that are not finite are sent as null
+    response = request(port, 'POST', '/predict',
+                       json.dumps({'instances': [[1e308, 1e308]]}))
+    assert json.loads(response.read()) == {'predictions': [None]}
+
+    stats = json.loads(request(port, 'GET', '/stats').read())
+    assert stats['requests'] == 34 and stats['errors'] == 1
+    assert stats['rows'] == 65 and stats['batches'] < 33
+    assert stats['latency_p99_ms'] >= stats['latency_p50_ms']
@@ -0,0 +1,37 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def test_profiling(tmpdir, monkeypatch):
+    pytest.importorskip('click')
+    from src.utils.profiling import profile_stage, profiled
+
+    profile_dir = tmpdir.join('profile')
+    monkeypatch.setenv('SRC_PROFILE_DIR', str(profile_dir))
+
+    @profiled('outer')
+    def outer():
+        with profile_stage('inner') as inner:
+            data = [list(range(1000)) for _ in range(100)]
+        # Only the outermost stage traces memory
+        assert inner.stats['traced_peak_mb'] is None
+        return sum(map(len, data))
+
+    assert outer() == 100000
+    stages = [json.loads(line) for line in
+              profile_dir.join('stages.jsonl').read().splitlines()]
+    assert [stage['stage'] for stage in stages] == ['inner', 'outer']
+    assert stages[1]['traced_peak_mb'] > 0
+    assert [path.basename.split('.')[0] for path in
+            profile_dir.listdir('*.prof')] == ['outer']
+
+    report = subprocess.check_output(
+        [sys.executable, '-m', 'src.utils.profiling', 'report',
+         str(profile_dir)], cwd=PROJECT_DIR).decode()
+    assert 'Hot spots by cumulative time' in report
+    assert '(outer)' in report
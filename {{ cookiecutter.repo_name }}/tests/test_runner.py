@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def test_benchmarks(tmpdir):
+    pytest.importorskip('click')
+    pytest.importorskip('pandas')
+    run = [sys.executable, '-m', 'benchmarks.runner', 'run',
+           'stages.FeatureStoreRead.*', '--repeat', '3']
+    subprocess.check_call(run + ['--ref', 'HEAD', '-o',
+                                 str(tmpdir.join('ref.json'))],
+                          cwd=PROJECT_DIR)
+    subprocess.check_call(run + ['-o', str(tmpdir.join('current.json'))],
+                          cwd=PROJECT_DIR)
+    results = json.loads(tmpdir.join('current.json').read())
+    assert sorted(results['benchmarks']) == [
+        'stages.FeatureStoreRead.time_iter_blocks',
+        'stages.FeatureStoreRead.time_take']
+    for result in results['benchmarks'].values():
+        assert len(result['samples']) == 3
+
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.runner', 'compare',
+         str(tmpdir.join('ref.json')), str(tmpdir.join('current.json')),
+         '--threshold', '10'], cwd=PROJECT_DIR).decode()
+    assert 'stages.FeatureStoreRead.time_take' in output
+
+
+def test_mann_whitney_u():
+    pytest.importorskip('click')
+    from benchmarks.runner import mann_whitney_u
+
+    assert mann_whitney_u(range(10), range(100, 110)) < 0.001
+    assert mann_whitney_u(range(10), range(10)) > 0.5
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def test_run_manifest(tmpdir):
+    pytest.importorskip('click')
+    pytest.importorskip('numpy')
+    script = tmpdir.join('job.py')
+    script.write(
+        'import os, sys\n'
+        'from src.utils.runs import RunManifest\n'
+        'value, force = sys.argv[1], "--force" in sys.argv\n'
+        'param_dict = dict(value=value, force=force, Prog_msg="job")\n'
+        'input_path, runs_dir = os.environ["INPUT"], os.environ["RUNS"]\n'
+        'run = RunManifest(__file__, param_dict, inputs=[input_path],\n'
+        '                  runs_dir=runs_dir)\n'
+        'if not force and run.restore():\n'
+        '    print("restored")\n'
+        '    sys.exit()\n'
+        'output_path = os.path.join(os.environ["OUTPUT"], value + ".txt")\n'
+        'with open(input_path) as f_in, open(output_path, "w") as f_out:\n'
+        '    f_out.write(f_in.read() * int(value))\n'
+        'run.record([output_path])\n'
+        'print("ran")\n')
+    input_file = tmpdir.join('input.txt')
+    input_file.write('a')
+    output_dir = tmpdir.mkdir('output')
+    env = dict(os.environ, INPUT=str(input_file),
+               RUNS=str(tmpdir.join('runs')), OUTPUT=str(output_dir),
+               PYTHONPATH=PROJECT_DIR)
+
+    def run(*args):
+        return subprocess.check_output(
+            [sys.executable, str(script)] + list(args),
+            cwd=PROJECT_DIR, env=env).decode().strip()
+
+    assert run('2') == 'ran'
+    assert run('2') == 'restored'
+    # Deleted outputs are restored too
+    output_dir.join('2.txt').remove()
+    assert run('2') == 'restored'
+    assert output_dir.join('2.txt').read() == 'aa'
+    assert run('2', '--force') == 'ran'
+    assert run('3') == 'ran'
+    input_file.write('b')
+    assert run('2') == 'ran'
+    assert output_dir.join('2.txt').read() == 'bb'
+
+
+def test_run_key(tmpdir):
+    pytest.importorskip('click')
+    np = pytest.importorskip('numpy')
+    from src.utils.runs import run_key
+
+    script = tmpdir.join('job.py')
+    script.write('print("job")\n')
+    cache_dir = str(tmpdir.join('cache'))
+    x, y = np.zeros(10000), np.zeros(10000)
+    y[5000] = 1
+
+    assert run_key(str(script), {'x': x}, cache_dir=cache_dir) != \
+        run_key(str(script), {'x': y}, cache_dir=cache_dir)
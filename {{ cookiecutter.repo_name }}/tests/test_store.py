@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+
+def test_feature_store(tmpdir):
+    np = pytest.importorskip('numpy')
+    from src.features.store import FeatureStore
+
+    store_dir = str(tmpdir.join('features'))
+    store = FeatureStore(store_dir)
+    store.append({'x': np.arange(5.), 'v': np.ones((5, 2))})
+    size = os.path.getsize(store._column_path('x'))
+    store.append({'x': np.arange(5., 8.), 'v': np.zeros((3, 2))})
+
+    store = FeatureStore(store_dir)
+    assert len(store) == 8
+    assert np.load(store._column_path('x')).tolist() == list(range(8))
+    cols = store.read(columns=['x'], rows=(2, 6))
+    assert isinstance(cols['x'], np.memmap)
+    assert cols['x'].tolist() == [2., 3., 4., 5.]
+    assert store.take([7, 0])['v'].tolist() == [[0., 0.], [1., 1.]]
+    # Appending writes the new rows only
+    assert os.path.getsize(store._column_path('x')) == size + 3 * 8
+
+
+def test_feature_store_promotion(tmpdir):
+    np = pytest.importorskip('numpy')
+    from src.features.store import FeatureStore
+
+    store_dir = str(tmpdir.join('features'))
+    store = FeatureStore(store_dir)
+    store.append({'n': np.arange(3, dtype='int8'), 's': list('abc')})
+    store.append({'n': np.arange(3, dtype='int8'), 's': list('def')})
+    assert store['n'].dtype == 'int8' and store['s'].dtype == '<U1'
+
+    # Columns are promoted instead of overflowing or truncating
+    store.append({'n': np.array([300]), 's': ['ghij']})
+    store.append({'n': np.array([np.nan]), 's': ['k']})
+    store = FeatureStore(store_dir)
+    assert store['n'].dtype == 'float64' and store['s'].dtype == '<U4'
+    assert store['n'].tolist()[:-1] == [0, 1, 2, 0, 1, 2, 300]
+    assert np.isnan(store['n'][-1])
+    assert store['s'].tolist() == list('abcdef') + ['ghij', 'k']
+
+    for values, error in [(np.array([1.]), ValueError),
+                          (np.array([None]), TypeError)]:
+        with pytest.raises(error, match='`s`'):
+            store.append({'n': np.array([1.]), 's': values})
+    assert len(store) == 8
@@ -0,0 +1,61 @@
+import pytest
+
+
+@pytest.fixture
+def objective(tmpdir, monkeypatch):
+    """
+    Objective of the sweeps, counting its calls in a file.
+    """
+    tmpdir.join('sweep_objectives.py').write(
+        'import os\n'
+        'def quadratic(params, budget):\n'
+        '    with open(os.environ["CALLS_FILE"], "a") as f:\n'
+        '        f.write("x")\n'
+        '    return (params["a"] - 2) ** 2 + 1. / budget\n')
+    calls_file = tmpdir.join('calls')
+    calls_file.write('')
+    monkeypatch.setenv('CALLS_FILE', str(calls_file))
+    monkeypatch.syspath_prepend(str(tmpdir))
+    return calls_file
+
+
+def test_sweep(objective, tmpdir):
+    pytest.importorskip('numpy')
+    from src.models.sweep import budgets, grid_search, query, run_sweep
+
+    db_filepath = str(tmpdir.join('sweeps.sqlite'))
+    trials = grid_search({'a': list(range(9))})
+
+    for _ in range(2):
+        results = run_sweep('sweep_objectives:quadratic', trials, jobs=2,
+                            min_budget=1, max_budget=9, eta=3,
+                            db_filepath=db_filepath)
+        assert results[0]['budget'] == 9
+        assert results[0]['params'] == '{"a": 2}'
+        assert query(db_filepath=db_filepath, top=1)[0]['trial'] == 2
+        # 9 trials, then the best 3, then the best one, only once
+        assert len(objective.read()) == 9 + 3 + 1
+
+    assert budgets(1, 10, 3) == [1, 3, 10]
+    assert budgets(1, 20, 3) == [1, 3, 9, 20]
+
+    # Results of another sweep are reused, with the trials of this one
+    trials = trials[::-1]
+    results = run_sweep('sweep_objectives:quadratic', trials, jobs=2,
+                        name='other', min_budget=1, max_budget=9, eta=3,
+                        db_filepath=db_filepath)
+    assert len(objective.read()) == 9 + 3 + 1
+    assert results[0]['sweep'] == 'other'
+    assert results[0]['trial'] == 6 and results[0]['rung'] == 2
+    assert all(trials[res['trial']] == {'a': int(res['params'][6:-1])}
+               for res in results)
+    rows = query(sweep='other', db_filepath=db_filepath)
+    assert sorted((row['sweep'], row['trial'], row['rung'])
+                  for row in rows) == \
+        sorted((res['sweep'], res['trial'], res['rung'])
+               for res in results)
+    assert len(query(db_filepath=db_filepath)) == 3 * 9
+
+    with pytest.raises(ValueError):
+        run_sweep('sweep_objectives:quadratic', trials, name='other',
+                  db_filepath=db_filepath)
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def endpoint_url(monkeypatch):
+    """
+    URL of a local S3 server with the bucket `bucket`.
+    """
+    boto3 = pytest.importorskip('boto3')
+    moto_server = pytest.importorskip('moto.server')
+    for var in ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY']:
+        monkeypatch.setenv(var, 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    server = moto_server.ThreadedMotoServer(port=0)
+    server.start()
+    try:
+        endpoint_url = 'http://{0}:{1}'.format(*server.get_host_and_port())
+        boto3.client('s3', endpoint_url=endpoint_url).create_bucket(
+            Bucket='bucket')
+        yield endpoint_url
+    finally:
+        server.stop()
+
+
+def test_sync_s3(endpoint_url, tmpdir):
+    from src.data.sync_s3 import S3Sync
+
+    local, remote = str(tmpdir.join('local')), str(tmpdir.join('remote'))
+    os.makedirs(os.path.join(local, 'raw'))
+    big = os.urandom(11 * 2 ** 20)
+    with open(os.path.join(local, 'raw', 'big.bin'), 'wb') as f:
+        f.write(big)
+    with open(os.path.join(local, 'small.csv'), 'w') as f:
+        f.write('a,b\n1,2\n')
+    kwargs = dict(endpoint_url=endpoint_url, multipart_threshold=2 ** 20,
+                  part_size=5 * 2 ** 20)
+
+    assert S3Sync('bucket', data_dir=local, **kwargs).push()['files'] == 2
+    # Only the files that changed are transferred
+    assert S3Sync('bucket', data_dir=local, **kwargs).push()['files'] == 0
+    assert S3Sync('bucket', data_dir=remote, **kwargs).pull()['files'] == 2
+    with open(os.path.join(remote, 'raw', 'big.bin'), 'rb') as f:
+        assert f.read() == big
+
+    with open(os.path.join(local, 'small.csv'), 'a') as f:
+        f.write('3,4\n')
+    assert S3Sync('bucket', data_dir=local, **kwargs).push()['files'] == 1
+    assert S3Sync('bucket', data_dir=remote, **kwargs).pull()['files'] == 1
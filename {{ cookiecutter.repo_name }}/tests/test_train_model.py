@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+
+def test_train_incremental(tmpdir):
+    pytest.importorskip('sklearn')
+    import numpy as np
+    from sklearn.linear_model import SGDClassifier, SGDRegressor
+    from src.features.store import FeatureStore
+    from src.models.train_model import train_incremental
+
+    store = FeatureStore(str(tmpdir.join('features')))
+    x = np.linspace(-1, 1, 1000)
+    store.append({'x': x, 'target': 3 * x, 'label': x > 0})
+    checkpoint = str(tmpdir.join('model.checkpoint'))
+
+    model, stats = train_incremental(
+        SGDRegressor(), store, 'target', features=['x'], batch_size=100,
+        n_epochs=2, checkpoint_every=3, checkpoint_filepath=checkpoint,
+        shuffle=True, seed=0)
+    assert stats['rows'] == 2000 and stats['batches'] == 20
+    assert os.path.exists(checkpoint)
+
+    # Resumes after the last checkpoint, at batch 18
+    _, stats = train_incremental(
+        SGDRegressor(), store, 'target', features=['x'], batch_size=100,
+        n_epochs=2, checkpoint_filepath=checkpoint, resume=True,
+        shuffle=True, seed=0)
+    assert stats['batches'] == 2
+
+    model, _ = train_incremental(SGDClassifier(), store, 'label',
+                                 features=['x'], batch_size=100)
+    assert model.predict([[0.9]]).tolist() == [True]
@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+
+def test_figures(figures, tmpdir):
+    from src.visualization.registry import register_figure
+    from src.visualization.visualize import build_figures
+
+    data_file = tmpdir.join('data.txt')
+    data_file.write('1\n2\n')
+
+    @register_figure(inputs=[str(data_file)])
+    def line(fig, data_path):
+        with open(data_path) as f:
+            values = [float(line) for line in f]
+        fig.add_subplot(111).plot(values)
+
+    output_dir = str(tmpdir.join('figures'))
+
+    def build():
+        return build_figures(output_dir=output_dir, jobs=1)['line'][0]
+
+    assert build() == 'rendered'
+    assert sorted(os.listdir(output_dir)) == ['.figures_cache.json',
+                                              'line.pdf', 'line.png']
+    assert build() == 'cached'
+    # Figures are rendered again when their data change
+    data_file.write('3\n', mode='a')
+    assert build() == 'rendered'
+
+
+def test_figures_command(tmpdir):
+    pytest.importorskip('matplotlib')
+    project_dir = str(tmpdir.join('project'))
+    shutil.copytree(PROJECT_DIR, project_dir,
+                    ignore=shutil.ignore_patterns('.git'))
+    with open(os.path.join(project_dir, 'src', 'visualization', 'figures',
+                           'lines.py'), 'w') as f:
+        f.write('from src.visualization.registry import register_figure\n'
+                '@register_figure(formats=["png"])\n'
+                'def line(fig):\n'
+                '    fig.add_subplot(111).plot([1, 2])\n'
+                '@register_figure(formats=["png"])\n'
+                'def broken(fig):\n'
+                '    raise ValueError("broken figure")\n')
+    output_dir = str(tmpdir.join('figures'))
+
+    proc = subprocess.run([sys.executable, '-m',
+                           'src.visualization.visualize', '--output-dir',
+                           output_dir, '-j', '1'], cwd=project_dir,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 1
+    assert os.path.exists(os.path.join(output_dir, 'line.png'))
+    # The queued log records are written before the error
+    assert proc.stderr.index('ValueError: broken figure') < \
+        proc.stderr.index('1 of 2 figures failed')